@@ -0,0 +1,208 @@
+"""
+run_benchmarks.py - Reproducible render benchmarks: image size x point count x geometry
+
+Generates deterministic synthetic inputs (1 to 24 MP, with and without an
+alpha channel) and times every pipeline stage of run_cubist through
+cubist_trace, for point counts from 100 to 100k and for triangle-only and
+mixed geometry. Each case runs in a fresh process; the per-stage median of
+--repeat runs is kept. Results are written to JSON together with the
+environment (Python, library versions, CPU, git commit).
+
+Comparing against a stored baseline flags cases whose total time, or any
+stage above --min-seconds, got slower by more than --threshold.
+
+Examples:
+    python benchmarks/run_benchmarks.py --preset quick -o benchmarks/results/quick.json
+    python benchmarks/run_benchmarks.py --preset quick --baseline benchmarks/results/quick.json
+    python benchmarks/run_benchmarks.py --compare old.json new.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import cv2  # noqa: E402
+import numpy as np  # noqa: E402
+import scipy  # noqa: E402
+
+from cubist_costmodel import synthetic_image  # noqa: E402
+
+# Megapixels -> (width, height), 4:3 like most camera output
+SIZES = {1: (1152, 864), 4: (2304, 1728), 12: (4032, 3024), 24: (5664, 4248)}
+PRESETS = {
+    "quick": {"megapixels": (1, 4), "points": (100, 1000, 10000), "alpha": (False, True), "mixed": (False, True)},
+    "full": {"megapixels": (1, 4, 12, 24), "points": (100, 1000, 10000, 100000), "alpha": (False, True),
+             "mixed": (False, True)},
+}
+DEFAULT_THRESHOLD = 0.10
+DEFAULT_MIN_SECONDS = 0.05
+
+
+def case_id(case):
+    return (f"{case['megapixels']}mp-{'alpha' if case['alpha'] else 'opaque'}-{case['points']}pts-"
+            f"{'mixed' if case['mixed'] else 'triangles'}")
+
+
+def build_cases(preset):
+    spec = PRESETS[preset]
+    return [{"megapixels": mp, "alpha": alpha, "points": points, "mixed": mixed}
+            for mp in spec["megapixels"] for alpha in spec["alpha"]
+            for points in spec["points"] for mixed in spec["mixed"]]
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                                timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "scipy": scipy.__version__,
+        "opencv": cv2.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "opencv_threads": cv2.getNumThreads(),
+        "commit": commit,
+    }
+
+
+def input_path(input_dir, case):
+    width, height = SIZES[case["megapixels"]]
+    path = Path(input_dir) / f"bench_{width}x{height}_{'alpha' if case['alpha'] else 'opaque'}.png"
+    if not path.exists():
+        synthetic_image(path, width, height, alpha=case["alpha"], seed=case["megapixels"])
+    return str(path)
+
+
+def run_case(task):
+    """Run one case repeat times in this (fresh) process; returns its result dict."""
+    from cubist_core_logic import run_cubist
+    from cubist_trace import Tracer
+
+    case, path, output_dir, repeat = task
+    runs = []
+    for i in range(repeat):
+        records = []
+        run_cubist(path, output_dir, total_points=case["points"], clip_to_alpha=True, verbose=False,
+                   use_mixed_geometry=case["mixed"], seed=i, tracer=Tracer(hooks=[records.append]))
+        runs.append(records)
+    stages = {}
+    for records in runs:
+        for record in records:
+            stages.setdefault(record["stage"], []).append(record["wall_seconds"])
+    peaks = [max(r["rss_start_kb"] + r["peak_rss_delta_kb"] for r in records)
+             for records in runs if all("rss_start_kb" in r for r in records)]
+    medians = {stage: round(float(np.median(times)), 6) for stage, times in stages.items()}
+    width, height = SIZES[case["megapixels"]]
+    return dict(case, id=case_id(case), width=width, height=height, repeat=repeat, stages=medians,
+                total_seconds=round(sum(medians.values()), 6),
+                peak_memory_mb=round(max(peaks) / 1024, 1) if peaks else None)
+
+
+def run_suite(cases, repeat=3, input_dir=None, progress=print):
+    """Run every case, each in its own worker process; returns the results document."""
+    input_dir = Path(input_dir or Path(tempfile.gettempdir()) / "cubist_bench_inputs")
+    input_dir.mkdir(parents=True, exist_ok=True)
+    results = []
+    with tempfile.TemporaryDirectory() as output_dir:
+        tasks = [(case, input_path(input_dir, case), output_dir, repeat) for case in cases]
+        for done, task in enumerate(tasks, 1):
+            # A one-shot pool per case (max_tasks_per_child needs Python 3.11)
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                result = pool.submit(run_case, task).result()
+            results.append(result)
+            if progress is not None:
+                progress(f"[{done}/{len(tasks)}] {result['id']}: {result['total_seconds']:.3f}s")
+    return {"created": datetime.now().isoformat(timespec="seconds"), "environment": environment(),
+            "repeat": repeat, "cases": results}
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD, min_seconds=DEFAULT_MIN_SECONDS):
+    """Regressions of current against baseline, as a list of dicts.
+
+    Cases are matched by id. A case regresses when its total time, or a
+    stage taking at least min_seconds in the baseline, is more than
+    threshold (a fraction) slower.
+    """
+    base_cases = {case["id"]: case for case in baseline["cases"]}
+    regressions = []
+    for case in current["cases"]:
+        base = base_cases.get(case["id"])
+        if base is None:
+            continue
+        checks = [("total", base["total_seconds"], case["total_seconds"])]
+        checks += [(stage, seconds, case["stages"].get(stage)) for stage, seconds in base["stages"].items()
+                   if seconds >= min_seconds]
+        for name, old, new in checks:
+            if new is not None and old > 0 and new > old * (1 + threshold):
+                regressions.append({"id": case["id"], "stage": name, "baseline_seconds": old, "seconds": new,
+                                    "change": round(new / old - 1, 3)})
+    return regressions
+
+
+def print_comparison(baseline, current, regressions):
+    if baseline["environment"] != current["environment"]:
+        changed = sorted(key for key in current["environment"]
+                         if baseline["environment"].get(key) != current["environment"][key])
+        print(f"Note: environment differs from the baseline ({', '.join(changed)})")
+    for regression in regressions:
+        print(f"REGRESSION {regression['id']} {regression['stage']}: {regression['baseline_seconds']:.3f}s -> "
+              f"{regression['seconds']:.3f}s ({regression['change']:+.0%})")
+    matched = len({case["id"] for case in current["cases"]} & {case["id"] for case in baseline["cases"]})
+    print(f"{len(regressions)} regression(s) in {matched} matched case(s)")
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the render pipeline on synthetic inputs.")
+    parser.add_argument("--preset", default="quick", choices=sorted(PRESETS))
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case; stage medians are kept.")
+    parser.add_argument("-o", "--output", help="Results JSON path.")
+    parser.add_argument("--inputs", help="Directory for the generated inputs (reused between runs).")
+    parser.add_argument("--filter", help="Only run cases whose id contains this text.")
+    parser.add_argument("--baseline", help="Compare the new results against this results JSON.")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"),
+                        help="Compare two stored results files without running anything.")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Slowdown fraction that counts as a regression.")
+    parser.add_argument("--min-seconds", type=float, default=DEFAULT_MIN_SECONDS,
+                        help="Ignore stages faster than this in the baseline.")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        baseline, current = (load_results(path) for path in args.compare)
+    else:
+        cases = [case for case in build_cases(args.preset) if not args.filter or args.filter in case_id(case)]
+        current = run_suite(cases, args.repeat, args.inputs)
+        if args.output:
+            Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+            with open(args.output, "w") as f:
+                json.dump(current, f, indent=2)
+            print(f"Saved: {args.output}")
+        if not args.baseline:
+            return 0
+        baseline = load_results(args.baseline)
+    regressions = compare(baseline, current, args.threshold, args.min_seconds)
+    print_comparison(baseline, current, regressions)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,440 @@
+"""
+cubist_animation.py - Streaming animation sinks for progression frames
+
+Canvases go straight from the frame loop into one animation file instead of
+one PNG per frame that another tool decodes again. Sinks:
+
+    APNGWriter      .png/.apng  hand-written APNG, frames encoded by OpenCV's
+                                PNG encoder and spliced in as fdAT chunks
+    WebPWriter      .webp       hand-written animated WebP (RIFF ANMF
+                                frames), frames encoded by OpenCV
+    GIFWriter       .gif        frames quantized and LZW-coded by Pillow
+                                (optional dependency), streamed by hand
+    RawVideoWriter  .rgb/.raw/- rgb24 frames for an ffmpeg rawvideo pipe
+    FFmpegWriter    .mp4/...    rgb24 frames piped into an ffmpeg process
+
+Frames are encoded on a background thread behind a bounded queue (add
+blocks when max_pending frames are waiting). Frame holds stretch a frame's
+duration (repeat it, for the fixed-rate video sinks). The APNG, WebP and GIF
+sinks only store the rectangle that changed since the previous frame and
+merge identical frames into one longer one; progression frames usually only
+change around the new points.
+
+Example:
+    with open_animation("out/progression.apng", frame_ms=120) as sink:
+        for canvas in frames:
+            sink.add(canvas)
+"""
+
+import io
+import queue
+import shutil
+import struct
+import subprocess
+import sys
+import threading
+import zlib
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from cubist_writer import DEFAULT_PNG_COMPRESSION, WEBP_LOSSLESS_QUALITY
+
+DEFAULT_FRAME_MS = 100
+ANIMATION_FORMATS = {".png": "apng", ".apng": "apng", ".webp": "webp", ".gif": "gif", ".rgb": "raw", ".raw": "raw",
+                     ".mp4": "ffmpeg", ".mkv": "ffmpeg", ".mov": "ffmpeg", ".webm": "ffmpeg"}
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def changed_region(previous, current):
+    """(x0, y0, x1, y1) bounding the pixels that differ, or None if none do."""
+    diff = cv2.absdiff(previous, current)
+    height, width = diff.shape[:2]
+    rows = np.flatnonzero(diff.reshape(height, -1).any(axis=1))
+    if len(rows) == 0:
+        return None
+    cols = np.flatnonzero(diff[rows[0]:rows[-1] + 1].any(axis=0).reshape(width, -1).any(axis=1))
+    return int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1
+
+
+class AnimationSink:
+    """Base class: bounded frame queue drained by one encoder thread.
+
+    Subclasses implement _write_frame(frame, duration_ms) and _finish().
+    add() re-raises an encoder error; close() waits for all frames.
+    """
+
+    def __init__(self, frame_ms=DEFAULT_FRAME_MS, max_pending=4):
+        self.frame_ms = frame_ms
+        self.frames = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._error = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def add(self, canvas, alpha=None, hold=1):
+        """Queue an RGB canvas (and optional alpha plane) shown for hold frame times.
+
+        The arrays must not be modified afterwards.
+        """
+        if self._error is not None:
+            raise self._error
+        frame = canvas if alpha is None else np.dstack((canvas, alpha))
+        self._queue.put((frame, self.frame_ms * hold))
+        self.frames += 1
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            if self._error is None:
+                try:
+                    self._write_frame(*item)
+                except Exception as e:
+                    self._error = e
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        if self._error is None:
+            self._finish()
+            return
+        self._abort()
+        raise self._error
+
+    def _abort(self):
+        """Release resources after an encoder error."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class DeltaSink(AnimationSink):
+    """Sink that stores changed rectangles; identical frames extend the previous one.
+
+    One frame is kept back so its duration can still grow. Subclasses
+    implement _emit(frame, x, y, duration_ms, first) and _finish_file().
+    """
+
+    even_offsets = False
+
+    def __init__(self, frame_ms=DEFAULT_FRAME_MS, max_pending=4):
+        self._previous = None
+        self._pending = None
+        super().__init__(frame_ms, max_pending)
+
+    def _write_frame(self, frame, duration):
+        if self._previous is not None:
+            if frame.shape != self._previous.shape:
+                raise ValueError("All animation frames must have the same size and channels.")
+            region = changed_region(self._previous, frame)
+            if region is None:
+                self._pending[3] += duration
+                return
+        else:
+            region = (0, 0, frame.shape[1], frame.shape[0])
+        x0, y0, x1, y1 = region
+        if self.even_offsets:
+            x0, y0 = x0 - x0 % 2, y0 - y0 % 2
+        self._flush()
+        self._pending = [frame[y0:y1, x0:x1], x0, y0, duration, self._previous is None]
+        self._previous = frame
+
+    def _flush(self):
+        if self._pending is not None:
+            self._emit(*self._pending)
+            self._pending = None
+
+    def _finish(self):
+        self._flush()
+        self._finish_file()
+
+    def _abort(self):
+        self.file.close()
+
+
+def _png_chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+
+def _png_chunks(data):
+    """(type, payload) pairs of an encoded PNG."""
+    offset = len(PNG_SIGNATURE)
+    while offset < len(data):
+        length, kind = struct.unpack(">I4s", data[offset:offset + 8])
+        yield kind, data[offset + 8:offset + 8 + length]
+        offset += 12 + length
+
+
+def _bgr(frame):
+    return cv2.cvtColor(frame, cv2.COLOR_RGBA2BGRA if frame.shape[2] == 4 else cv2.COLOR_RGB2BGR)
+
+
+class APNGWriter(DeltaSink):
+    """Animated PNG, streamed; the frame count in acTL is patched on close."""
+
+    def __init__(self, path, frame_ms=DEFAULT_FRAME_MS, loop=0, png_compression=DEFAULT_PNG_COMPRESSION,
+                 max_pending=4):
+        self.file = open(path, "wb")
+        self.loop = loop
+        self.png_compression = png_compression
+        self.sequence = 0
+        self.emitted = 0
+        self.actl_offset = None
+        super().__init__(frame_ms, max_pending)
+
+    def _encode(self, frame):
+        ok, data = cv2.imencode(".png", _bgr(frame), [cv2.IMWRITE_PNG_COMPRESSION, self.png_compression])
+        if not ok:
+            raise IOError("Could not encode animation frame as PNG.")
+        return list(_png_chunks(data.tobytes()))
+
+    def _emit(self, frame, x, y, duration, first):
+        chunks = self._encode(frame)
+        if first:
+            self.file.write(PNG_SIGNATURE)
+            self.file.write(_png_chunk(b"IHDR", next(data for kind, data in chunks if kind == b"IHDR")))
+            self.actl_offset = self.file.tell()
+            self.file.write(_png_chunk(b"acTL", struct.pack(">II", 0, self.loop)))
+        height, width = frame.shape[:2]
+        # dispose NONE, blend SOURCE: the rectangle replaces what was there
+        self.file.write(_png_chunk(b"fcTL", struct.pack(">IIIIIHHBB", self.sequence, width, height, x, y,
+                                                        min(int(duration), 65535), 1000, 0, 0)))
+        self.sequence += 1
+        for kind, data in chunks:
+            if kind != b"IDAT":
+                continue
+            if first:
+                self.file.write(_png_chunk(b"IDAT", data))
+            else:
+                self.file.write(_png_chunk(b"fdAT", struct.pack(">I", self.sequence) + data))
+                self.sequence += 1
+        self.emitted += 1
+
+    def _finish_file(self):
+        if self.actl_offset is not None:
+            self.file.write(_png_chunk(b"IEND", b""))
+            self.file.seek(self.actl_offset)
+            self.file.write(_png_chunk(b"acTL", struct.pack(">II", self.emitted, self.loop)))
+        self.file.close()
+
+
+def _riff_chunk(fourcc, data):
+    return fourcc + struct.pack("<I", len(data)) + data + (b"\x00" if len(data) % 2 else b"")
+
+
+def _uint24(value):
+    return struct.pack("<I", value)[:3]
+
+
+class WebPWriter(DeltaSink):
+    """Animated WebP, streamed; the RIFF size is patched on close.
+
+    quality above 100 is lossless (the default).
+    """
+
+    even_offsets = True  # ANMF stores offsets divided by two
+
+    def __init__(self, path, frame_ms=DEFAULT_FRAME_MS, loop=0, quality=WEBP_LOSSLESS_QUALITY, max_pending=4):
+        self.file = open(path, "wb")
+        self.loop = loop
+        self.quality = quality
+        super().__init__(frame_ms, max_pending)
+
+    def _frame_chunks(self, frame):
+        ok, data = cv2.imencode(".webp", _bgr(frame), [cv2.IMWRITE_WEBP_QUALITY, self.quality])
+        if not ok:
+            raise IOError("Could not encode animation frame as WebP.")
+        data = data.tobytes()
+        chunks = []
+        offset = 12
+        while offset < len(data):
+            fourcc, size = data[offset:offset + 4], struct.unpack("<I", data[offset + 4:offset + 8])[0]
+            if fourcc in (b"ALPH", b"VP8 ", b"VP8L"):
+                chunks.append(_riff_chunk(fourcc, data[offset + 8:offset + 8 + size]))
+            offset += 8 + size + size % 2
+        return b"".join(chunks)
+
+    def _emit(self, frame, x, y, duration, first):
+        if first:
+            height, width = frame.shape[:2]
+            flags = 0x02 | (0x10 if frame.shape[2] == 4 else 0)  # animation, alpha
+            self.file.write(b"RIFF\x00\x00\x00\x00WEBP")
+            self.file.write(_riff_chunk(b"VP8X", bytes([flags, 0, 0, 0]) + _uint24(width - 1) + _uint24(height - 1)))
+            self.file.write(_riff_chunk(b"ANIM", struct.pack("<IH", 0, self.loop)))
+        height, width = frame.shape[:2]
+        header = (_uint24(x // 2) + _uint24(y // 2) + _uint24(width - 1) + _uint24(height - 1)
+                  + _uint24(min(int(duration), 0xFFFFFF)) + bytes([0x02]))  # no blending, no disposal
+        self.file.write(_riff_chunk(b"ANMF", header + self._frame_chunks(frame)))
+
+    def _finish_file(self):
+        size = self.file.tell()
+        if size:
+            self.file.seek(4)
+            self.file.write(struct.pack("<I", size - 8))
+        self.file.close()
+
+
+class GIFWriter(DeltaSink):
+    """Animated GIF, streamed; each frame is quantized to 256 colors by Pillow."""
+
+    def __init__(self, path, frame_ms=DEFAULT_FRAME_MS, loop=0, max_pending=4):
+        try:
+            from PIL import Image
+        except ImportError:
+            raise ImportError("GIF output needs Pillow (pip install Pillow); use .apng or .webp instead.")
+        self.Image = Image
+        self.file = open(path, "wb")
+        self.loop = loop
+        super().__init__(frame_ms, max_pending)
+
+    def _frame_blocks(self, frame):
+        """(transparent index or None, image descriptor + color table + LZW data) of one frame."""
+        buffer = io.BytesIO()
+        self.Image.fromarray(np.ascontiguousarray(frame)).save(buffer, "GIF")
+        data = buffer.getvalue()
+        flags = data[10]
+        offset = 13
+        table = b""
+        if flags & 0x80:
+            table = data[offset:offset + 3 * 2 ** ((flags & 0x07) + 1)]
+            offset += len(table)
+        transparency = None
+        while data[offset] == 0x21:  # extensions
+            if data[offset + 1] == 0xF9 and data[offset + 3] & 0x01:
+                transparency = data[offset + 6]
+            offset += 2
+            while data[offset]:
+                offset += data[offset] + 1
+            offset += 1
+        descriptor = bytearray(data[offset:offset + 10])
+        offset += 10
+        if table and not descriptor[9] & 0x80:
+            # Move the global color table into the frame as a local one
+            descriptor[9] |= 0x80 | (flags & 0x07)
+        elif descriptor[9] & 0x80:
+            table = data[offset:offset + 3 * 2 ** ((descriptor[9] & 0x07) + 1)]
+            offset += len(table)
+        end = offset + 1
+        while data[end]:
+            end += data[end] + 1
+        return transparency, bytes(descriptor) + table + data[offset:end + 1]
+
+    def _emit(self, frame, x, y, duration, first):
+        if first:
+            height, width = frame.shape[:2]
+            self.file.write(b"GIF89a" + struct.pack("<HHBBB", width, height, 0, 0, 0))
+            self.file.write(b"\x21\xff\x0bNETSCAPE2.0\x03\x01" + struct.pack("<H", self.loop) + b"\x00")
+        transparency, blocks = self._frame_blocks(frame)
+        delay = max(2, int(round(duration / 10.0)))  # centiseconds; viewers slow down anything below 2
+        packed = (1 << 2) | (1 if transparency is not None else 0)  # keep the previous frame under this one
+        self.file.write(b"\x21\xf9\x04" + struct.pack("<BHB", packed, delay, transparency or 0) + b"\x00")
+        descriptor = bytearray(blocks[:10])
+        struct.pack_into("<HH", descriptor, 1, x, y)
+        self.file.write(bytes(descriptor) + blocks[10:])
+
+    def _finish_file(self):
+        if self.file.tell():
+            self.file.write(b"\x3b")
+        self.file.close()
+
+
+class RawVideoWriter(AnimationSink):
+    """Raw rgb24 frames at a fixed rate, for `ffmpeg -f rawvideo -pix_fmt rgb24`.
+
+    target is a path, '-' for stdout, or a binary stream. Holds repeat the
+    frame; alpha is dropped. The frame size is printed so the pipe can be
+    set up (-s WIDTHxHEIGHT -r 1000/frame_ms).
+    """
+
+    def __init__(self, target, frame_ms=DEFAULT_FRAME_MS, max_pending=4):
+        if target == "-":
+            self.stream, self.owned = sys.stdout.buffer, False
+        elif hasattr(target, "write"):
+            self.stream, self.owned = target, False
+        else:
+            self.stream, self.owned = open(target, "wb"), True
+        self.size = None
+        super().__init__(frame_ms, max_pending)
+
+    def _write_frame(self, frame, duration):
+        if self.size is None:
+            self.size = (frame.shape[1], frame.shape[0])
+        elif (frame.shape[1], frame.shape[0]) != self.size:
+            raise ValueError("All animation frames must have the same size.")
+        data = np.ascontiguousarray(frame[:, :, :3]).tobytes()
+        for _ in range(max(1, int(round(duration / self.frame_ms)))):
+            self.stream.write(data)
+
+    def _finish(self):
+        self.stream.flush()
+        if self.owned:
+            self.stream.close()
+
+    def _abort(self):
+        if self.owned:
+            self.stream.close()
+
+
+class FFmpegWriter(RawVideoWriter):
+    """Pipe rgb24 frames into an ffmpeg process that encodes output_path.
+
+    The process starts with the first frame, once the size is known.
+    codec_args default to H.264 in yuv420p (even dimensions are padded).
+    """
+
+    def __init__(self, output_path, frame_ms=DEFAULT_FRAME_MS, ffmpeg="ffmpeg", codec_args=None, max_pending=4):
+        self.ffmpeg = shutil.which(ffmpeg)
+        if self.ffmpeg is None:
+            raise FileNotFoundError(f"'{ffmpeg}' not found; install ffmpeg or write .apng/.webp/.gif instead.")
+        self.output_path = str(output_path)
+        self.codec_args = codec_args or ["-c:v", "libx264", "-pix_fmt", "yuv420p",
+                                         "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2"]
+        self.process = None
+        super().__init__(io.BytesIO(), frame_ms, max_pending)
+
+    def _write_frame(self, frame, duration):
+        if self.process is None:
+            height, width = frame.shape[:2]
+            command = [self.ffmpeg, "-y", "-loglevel", "error", "-f", "rawvideo", "-pix_fmt", "rgb24",
+                       "-s", f"{width}x{height}", "-r", f"{1000.0 / self.frame_ms:g}", "-i", "-",
+                       *self.codec_args, self.output_path]
+            self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+            self.stream = self.process.stdin
+        super()._write_frame(frame, duration)
+
+    def _finish(self):
+        if self.process is None:
+            return
+        self.process.stdin.close()
+        if self.process.wait() != 0:
+            raise IOError(f"ffmpeg failed writing {self.output_path} (exit code {self.process.returncode}).")
+
+    def _abort(self):
+        if self.process is not None:
+            self.process.kill()
+            self.process.wait()
+
+
+def open_animation(path, frame_ms=DEFAULT_FRAME_MS, animation_format=None, max_pending=4, **options):
+    """Animation sink for path, chosen by animation_format or the path's extension."""
+    if animation_format is None:
+        animation_format = "raw" if str(path) == "-" else ANIMATION_FORMATS.get(Path(path).suffix.lower())
+    writers = {"apng": APNGWriter, "webp": WebPWriter, "gif": GIFWriter, "raw": RawVideoWriter,
+               "ffmpeg": FFmpegWriter}
+    if animation_format not in writers:
+        raise ValueError(f"Unknown animation format for '{path}', expected one of {sorted(writers)} "
+                         f"or an extension in {sorted(ANIMATION_FORMATS)}.")
+    if path != "-":
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+    return writers[animation_format](path, frame_ms=frame_ms, max_pending=max_pending, **options)
@@ -0,0 +1,270 @@
+"""
+cubist_batch.py - Headless batch renderer for folders of images
+
+Runs run_cubist over every image matched by the input globs and every
+requested point count, on a pool of worker processes, printing one progress
+line per finished job and writing a JSON summary of timings and outputs.
+Does not import tkinter, so it runs on machines without a display.
+
+Example:
+    python cubist_batch.py "input/*.png" -o output/batch -p 1000 5000 --workers 4
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+
+from cubist_colorstats import COLOR_STATS
+from cubist_core_logic import compare_draft, run_cubist
+from cubist_costmodel import ETA_CORRECTION, CostModel, format_seconds, image_size
+from cubist_edges import AUTO_MASK
+from cubist_lut import LUT_METHODS
+from cubist_posterize import MAX_COLORS, MIN_COLORS
+from cubist_sampling import PointSampler
+from cubist_trace import Tracer
+from cubist_vector import VECTOR_FORMATS
+from cubist_writer import DEFAULT_PNG_COMPRESSION, OUTPUT_FORMATS
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp", ".webp"}
+
+
+def expand_inputs(patterns):
+    """Sorted, de-duplicated image paths matched by the given globs or paths."""
+    paths = set()
+    for pattern in patterns:
+        matches = glob.glob(pattern, recursive=True) or ([pattern] if os.path.isfile(pattern) else [])
+        if not matches:
+            print(f"Warning: no files match '{pattern}'", file=sys.stderr)
+        for match in matches:
+            if Path(match).suffix.lower() in IMAGE_EXTENSIONS:
+                paths.add(os.path.normpath(match))
+    return sorted(paths)
+
+
+def resolve_mask(mask, input_path):
+    """Mask path for an input; '{stem}' in mask is replaced by the input's stem.
+
+    AUTO_MASK ('auto') generates each input's edge mask instead. A missing
+    mask file is reported and the input renders without one.
+    """
+    if not mask or mask == AUTO_MASK:
+        return mask or None
+    mask_path = mask.format(stem=Path(input_path).stem)
+    if not os.path.exists(mask_path):
+        print(f"Warning: mask '{mask_path}' not found for '{input_path}', rendering without an edge mask",
+              file=sys.stderr)
+        return None
+    return mask_path
+
+
+def build_jobs(args):
+    jobs = []
+    for input_path in expand_inputs(args.inputs):
+        for total_points in args.points:
+            jobs.append({
+                "input": input_path,
+                "output_dir": args.output_dir,
+                "mask": resolve_mask(args.mask, input_path),
+                "total_points": total_points,
+                "clip_to_alpha": not args.no_clip,
+                "use_mixed_geometry": args.mixed,
+                "seed": args.seed,
+                "sampling": args.sampling,
+                "cache_dir": args.cache_dir,
+                "draft_factor": args.draft,
+                "draft_compare": args.draft_compare,
+                "output_format": args.format,
+                "png_compression": args.png_compression,
+                "trace": args.trace,
+                "lut": args.lut,
+                "lut_method": args.lut_method,
+                "posterize": args.posterize,
+                "color_stat": args.color_stat,
+                "vector": args.vector,
+            })
+    return jobs
+
+
+def job_estimate(model, job):
+    """Pre-flight seconds for a job from the cost model, or None if the input is unreadable."""
+    try:
+        width, height = image_size(job["input"])
+    except (OSError, ValueError):
+        return None
+    factor = job["draft_factor"] or 1
+    estimate = model.predict(-(-width // factor), -(-height // factor), job["total_points"],
+                             job["use_mixed_geometry"], inpaint=not job["clip_to_alpha"], lut=bool(job["lut"]))
+    return estimate["seconds"]
+
+
+def run_job(job):
+    """Render one (image, point count) job; never raises, errors go in the result.
+
+    The job's stage records (for the cost model) are returned under
+    "trace_records". With draft_compare, the deviation of the draft colors
+    from full quality (cubist_core_logic.compare_draft) is added under
+    "draft_report".
+    """
+    result = dict(job)
+    records = []
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        tracer = Tracer(job["trace"], hooks=[records.append], input=job["input"], total_points=job["total_points"])
+        result["output"] = run_cubist(
+            job["input"], job["output_dir"], mask_path=job["mask"], total_points=job["total_points"],
+            clip_to_alpha=job["clip_to_alpha"], verbose=False, use_mixed_geometry=job["use_mixed_geometry"],
+            seed=job["seed"], sampling=job["sampling"], cache_dir=job["cache_dir"], draft_factor=job["draft_factor"],
+            output_format=job["output_format"], png_compression=job["png_compression"], tracer=tracer,
+            lut_path=job["lut"], lut_method=job["lut_method"], posterize=job["posterize"],
+            color_stat=job["color_stat"], vector_format=job["vector"])
+        if job["draft_compare"]:
+            result["draft_report"] = compare_draft(
+                job["input"], job["draft_factor"], job["total_points"], job["mask"], job["clip_to_alpha"],
+                0 if job["seed"] is None else job["seed"], job["sampling"])
+        result["status"] = "ok"
+    except Exception as e:
+        result["output"] = None
+        result["status"] = "error"
+        result["error"] = f"{type(e).__name__}: {e}"
+        result["traceback"] = traceback.format_exc()
+    result["seconds"] = round(time.perf_counter() - start, 4)
+    result["cpu_seconds"] = round(time.process_time() - cpu_start, 4)
+    result["trace_records"] = records
+    return result
+
+
+def run_batch(jobs, workers=1, progress=print, estimates=None):
+    """Run jobs serially or on a process pool; results are returned in job order.
+
+    With estimates (pre-flight seconds per job), progress lines carry an
+    ETA: the estimates of unfinished jobs, scaled by measured / estimated
+    time of the finished ones and spread over the workers.
+    """
+    results = [None] * len(jobs)
+    measured = expected = 0.0
+
+    def report(done, i):
+        nonlocal measured, expected
+        result = results[i]
+        status = "ok" if result["status"] == "ok" else f"FAILED ({result['error']})"
+        eta = ""
+        if estimates is not None and estimates[i] is not None:
+            measured += result["seconds"]
+            expected += estimates[i]
+            remaining = sum(e for j, e in enumerate(estimates) if results[j] is None and e is not None)
+            ratio = min(max(measured / expected, ETA_CORRECTION[0]), ETA_CORRECTION[1]) if expected else 1.0
+            eta = f" ETA {format_seconds(remaining * ratio / workers)}"
+        deviation = ""
+        if "draft_report" in result:
+            deviation = f" draft error {result['draft_report']['mean_abs_error']:.2f}"
+        progress(f"[{done}/{len(jobs)}] {result['input']} {result['total_points']}pts "
+                 f"{result['seconds']:.2f}s {status}{deviation}{eta}")
+
+    if workers <= 1:
+        for i, job in enumerate(jobs):
+            results[i] = run_job(job)
+            report(i + 1, i)
+        return results
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run_job, job): i for i, job in enumerate(jobs)}
+        for done, future in enumerate(as_completed(futures), 1):
+            i = futures[future]
+            results[i] = future.result()
+            report(done, i)
+    return results
+
+
+def write_summary(path, results, workers, wall_seconds):
+    summary = {
+        "finished": datetime.now().isoformat(timespec="seconds"),
+        "workers": workers,
+        "wall_seconds": round(wall_seconds, 4),
+        "jobs": len(results),
+        "failed": sum(result["status"] != "ok" for result in results),
+        "results": results,
+    }
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Render cubist images for folders of inputs without the GUI.")
+    parser.add_argument("inputs", nargs="+", help="Input image paths or glob patterns (quote globs).")
+    parser.add_argument("-o", "--output-dir", required=True, help="Directory for rendered images.")
+    parser.add_argument("-p", "--points", type=int, nargs="+", default=[1000],
+                        help="One or more point counts; every image is rendered at each.")
+    parser.add_argument("-m", "--mask", help="Edge mask path; '{stem}' is replaced by each input's file stem. "
+                                                 "'auto' generates multi-scale edges from each image.")
+    parser.add_argument("--no-clip", action="store_true", help="Do not clip triangles to the alpha channel.")
+    parser.add_argument("--mixed", action="store_true", help="Overlay mixed Voronoi geometry.")
+    parser.add_argument("--sampling", default="edge_biased", choices=PointSampler.STRATEGIES)
+    parser.add_argument("--seed", type=int, help="Sampling seed for reproducible output.")
+    parser.add_argument("--draft", type=int, choices=(2, 4, 8),
+                        help="Draft quality: decode and color at 1/2, 1/4 or 1/8 resolution.")
+    parser.add_argument("--draft-compare", action="store_true",
+                        help="With --draft, also measure how far the draft colors are from full quality.")
+    parser.add_argument("--format", default="png", choices=OUTPUT_FORMATS,
+                        help="Output encoding: PNG, lossless WebP or uncompressed TIFF.")
+    parser.add_argument("--png-compression", type=int, default=DEFAULT_PNG_COMPRESSION, choices=range(10),
+                        metavar="0-9", help="PNG compression level (higher is smaller and slower).")
+    parser.add_argument("--vector", choices=VECTOR_FORMATS,
+                        help="Also write the shapes as SVG, gzipped SVG or PDF next to each image.")
+    parser.add_argument("--color-stat", default="mean", choices=COLOR_STATS,
+                        help="Shape color: mean, median or dominant (mode) color of its pixels.")
+    parser.add_argument("--posterize", type=int, choices=range(MIN_COLORS, MAX_COLORS + 1), metavar="K",
+                        help="Paint the shapes from K area-weighted k-means colors (up to 256).")
+    parser.add_argument("--lut", help="3D LUT (.cube, .3dl or .csp) that grades the shape colors.")
+    parser.add_argument("--lut-method", default="tetrahedral", choices=LUT_METHODS,
+                        help="LUT interpolation.")
+    parser.add_argument("--cache-dir", help="Artifact cache directory for preprocessing reuse.")
+    parser.add_argument("--trace", help="Append per-stage timing records (JSON lines) to this file.")
+    parser.add_argument("--estimate", action="store_true",
+                        help="Print the pre-flight time estimate from this machine's cost model and exit.")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1, help="Worker processes.")
+    parser.add_argument("--summary", help="Summary JSON path (default: <output-dir>/batch_summary.json).")
+    args = parser.parse_args(argv)
+    if args.draft_compare and not args.draft:
+        parser.error("--draft-compare needs --draft")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    jobs = build_jobs(args)
+    if not jobs:
+        print("No input images matched.", file=sys.stderr)
+        return 2
+    workers = max(1, min(args.workers, len(jobs)))
+    model = CostModel.load()
+    estimates = [job_estimate(model, job) for job in jobs]
+    known = [e for e in estimates if e is not None]
+    # Jobs are spread over the workers, but no faster than the longest one
+    total = max(sum(known) / workers, max(known, default=0.0))
+    print(f"Rendering {len(jobs)} job(s) with {workers} worker(s), estimated {format_seconds(total)}")
+    if args.estimate:
+        return 0
+    start = time.perf_counter()
+    results = run_batch(jobs, workers, estimates=estimates)
+    for result in results:
+        model.add_records(result.pop("trace_records"))
+    model.save()
+    summary_path = args.summary or os.path.join(args.output_dir, "batch_summary.json")
+    summary = write_summary(summary_path, results, workers, time.perf_counter() - start)
+    print(f"Done: {summary['jobs'] - summary['failed']} ok, {summary['failed']} failed "
+          f"in {summary['wall_seconds']:.1f}s. Summary: {summary_path}")
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
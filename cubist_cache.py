@@ -0,0 +1,134 @@
+"""
+cubist_cache.py - Content-addressed on-disk cache for derived image artifacts
+
+Artifacts derived from an input file (decoded pixels, alpha plane, opaque
+pixel index, edge index, neutral fill color) are stored as .npy files keyed
+by the SHA-256 of the input file content plus the parameters that produced
+them, so re-running a job on an unchanged input skips all preprocessing.
+Entries are opened memory-mapped. The total size is capped and the least
+recently used entries (by modification time, bumped on every hit) are
+evicted first.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+CACHE_VERSION = 1
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "cubist"
+DEFAULT_CACHE_BYTES = 2 * 1024 ** 3
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """Hex SHA-256 digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ArtifactCache:
+    """Size-capped LRU cache of .npy artifacts under root."""
+
+    def __init__(self, root=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_CACHE_BYTES):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._file_hashes = {}
+
+    def file_hash(self, path):
+        """Content hash of a file, remembered for the lifetime of the cache object."""
+        stat = os.stat(path)
+        memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        if memo_key not in self._file_hashes:
+            self._file_hashes[memo_key] = file_sha256(path)
+        return self._file_hashes[memo_key]
+
+    def key(self, file_hash, name, **params):
+        """Cache key for one artifact of a file with the given parameters."""
+        spec = json.dumps([CACHE_VERSION, file_hash, name, params], sort_keys=True, default=str)
+        return hashlib.sha256(spec.encode("utf-8")).hexdigest()
+
+    def path(self, key):
+        return self.root / key[:2] / f"{key}.npy"
+
+    def get(self, key):
+        """Memory-mapped artifact for key, or None on a miss."""
+        path = self.path(key)
+        try:
+            array = np.load(path, mmap_mode="r")
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+        os.utime(path)
+        return array
+
+    def put(self, key, array):
+        """Store an artifact atomically and evict old entries past the size cap."""
+        self._store(key, array)
+        self.evict(protected=(key,))
+
+    def _store(self, key, array):
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            np.save(f, np.asarray(array))
+        os.replace(tmp_path, path)
+
+    def get_or_compute(self, file_hash, names, compute, **params):
+        """Artifacts for names (a name or a tuple of names), computed on a miss.
+
+        compute() must return one array per name (a tuple when names is a
+        tuple); all of them are stored together.
+        """
+        single = isinstance(names, str)
+        names = (names,) if single else tuple(names)
+        keys = [self.key(file_hash, name, **params) for name in names]
+        arrays = [self.get(key) for key in keys]
+        if any(array is None for array in arrays):
+            arrays = (compute(),) if single else tuple(compute())
+            for key, array in zip(keys, arrays):
+                self._store(key, array)
+            # Evict once all artifacts are stored, never the ones just written
+            self.evict(protected=keys)
+        return arrays[0] if single else tuple(arrays)
+
+    def evict(self, protected=()):
+        """Remove least recently used entries until the cache fits max_bytes.
+
+        Entries whose key is in protected are kept. Entries that cannot be
+        removed (on Windows, files still memory-mapped by a returned array)
+        are skipped and still count towards the total.
+        """
+        protected = {self.path(key) for key in protected}
+        entries = []
+        for path in self.root.glob("*/*.npy"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+            if total <= self.max_bytes:
+                break
+            if path in protected:
+                continue
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            except OSError:
+                continue
+            total -= size
+
+    def clear(self):
+        """Remove every entry that is not in use (see evict)."""
+        for path in self.root.glob("*/*.npy"):
+            try:
+                path.unlink()
+            except OSError:
+                continue
@@ -0,0 +1,132 @@
+"""
+cubist_colorstats.py - Per-shape median and dominant colors from label histograms
+
+Means wash out on shapes that straddle an edge: a triangle half sky, half
+roof comes out a color that is in neither. The median and the dominant
+(mode) color stay on one side. A median per shape with NumPy would need a
+sort per shape; here both come from quantized per-label histograms built
+with one bincount over label * bins + bin, so they cost about as much as
+the bincount means of cubist_renderer.shape_mean_colors.
+
+    median  per-channel median from (labels x bins) histograms of each
+            channel (exact with 256 bins, bin centers with fewer)
+    mode    the most populated cell of a (labels x levels**3) joint RGB
+            histogram; the color is the mean of the shape's pixels in it
+
+Histogram sizes shrink with the number of shapes to keep the tables below
+HIST_CELLS entries. All histograms and sums are integer counts, so partial
+results (e.g. per tile) can be added up before the colors are taken.
+"""
+
+import numpy as np
+
+COLOR_STATS = ("mean", "median", "mode")
+HIST_CELLS = 1 << 23
+MEDIAN_BINS = (256, 128, 64, 32, 16)
+MODE_LEVELS = (16, 8, 4)
+
+
+def histogram_bins(num_labels):
+    """Bins per channel for median histograms of num_labels labels."""
+    return next((bins for bins in MEDIAN_BINS if num_labels * bins <= HIST_CELLS), MEDIAN_BINS[-1])
+
+
+def mode_levels(num_labels):
+    """Levels per channel of the joint RGB histogram for num_labels labels."""
+    return next((levels for levels in MODE_LEVELS if num_labels * levels ** 3 <= HIST_CELLS), MODE_LEVELS[-1])
+
+
+def _keys(flat_labels, values, size):
+    """flat_labels * size + values, in int32 when it fits."""
+    dtype = np.int32 if (int(flat_labels.max(initial=0)) + 1) * size < 2 ** 31 else np.int64
+    keys = flat_labels.astype(dtype) * size
+    keys += values
+    return keys
+
+
+def channel_histograms(flat_labels, pixels, num_labels, bins):
+    """(3, num_labels, bins) per-channel histograms of (N, 3) uint8 pixels."""
+    shift = 8 - int(bins).bit_length() + 1
+    base = _keys(flat_labels, 0, bins)
+    hists = np.empty((3, num_labels, bins), dtype=np.int64)
+    for c in range(3):
+        keys = base + (pixels[:, c] >> shift)
+        hists[c] = np.bincount(keys, minlength=num_labels * bins).reshape(num_labels, bins)
+    return hists
+
+
+def median_colors(hists, counts):
+    """Per-label median colors from channel histograms; empty labels are black.
+
+    The lower median bin is picked; with fewer than 256 bins its center is
+    returned.
+    """
+    bins = hists.shape[2]
+    width = 256 // bins
+    colors = np.zeros((hists.shape[1], 3), dtype=np.uint8)
+    filled = counts > 0
+    target = (counts[filled, None] + 1) // 2
+    for c in range(3):
+        cumulative = np.cumsum(hists[c, filled], axis=1)
+        median_bin = np.argmax(cumulative >= target, axis=1)
+        colors[filled, c] = median_bin * width + (width - 1) // 2
+    return colors
+
+
+def quantized_colors(pixels, levels):
+    """Joint histogram cell (0 .. levels**3 - 1) of every (N, 3) uint8 pixel."""
+    shift = 8 - int(levels).bit_length() + 1
+    q = (pixels >> shift).astype(np.int32)
+    return (q[:, 0] * levels + q[:, 1]) * levels + q[:, 2]
+
+
+def joint_histogram(flat_labels, cells, num_labels, levels):
+    """(num_labels, levels**3) histogram of quantized colors per label."""
+    size = levels ** 3
+    return np.bincount(_keys(flat_labels, cells, size), minlength=num_labels * size).reshape(num_labels, size)
+
+
+def dominant_sums(flat_labels, pixels, cells, dominant, num_labels):
+    """Pixel counts and int64 RGB sums of each label's pixels in its dominant cell."""
+    inside = np.flatnonzero(cells == dominant.astype(cells.dtype)[flat_labels])
+    in_labels = flat_labels[inside]
+    selected = pixels[inside]
+    counts = np.bincount(in_labels, minlength=num_labels)
+    sums = np.empty((num_labels, 3), dtype=np.int64)
+    for c in range(3):
+        sums[:, c] = np.bincount(in_labels, weights=selected[:, c], minlength=num_labels)
+    return counts, sums
+
+
+def mean_of_sums(counts, sums):
+    """Truncated mean colors from counts and sums; empty rows are black."""
+    colors = np.zeros((len(counts), 3), dtype=np.uint8)
+    filled = counts > 0
+    colors[filled] = (sums[filled] / counts[filled, None]).astype(np.uint8)
+    return colors
+
+
+def shape_median_colors(labels, image_rgb, num_shapes, bins=None):
+    """(colors, counts) like shape_mean_colors, with per-channel medians."""
+    flat_labels = labels.ravel()
+    pixels = image_rgb.reshape(-1, 3)
+    bins = bins or histogram_bins(num_shapes + 1)
+    hists = channel_histograms(flat_labels, pixels, num_shapes + 1, bins)
+    counts = hists[0].sum(axis=1)
+    colors = median_colors(hists, counts)
+    colors[0] = 0
+    return colors, counts
+
+
+def shape_mode_colors(labels, image_rgb, num_shapes, levels=None):
+    """(colors, counts) like shape_mean_colors, with dominant colors."""
+    flat_labels = labels.ravel()
+    pixels = image_rgb.reshape(-1, 3)
+    levels = levels or mode_levels(num_shapes + 1)
+    cells = quantized_colors(pixels, levels)
+    joint = joint_histogram(flat_labels, cells, num_shapes + 1, levels)
+    counts = joint.sum(axis=1)
+    dominant = np.argmax(joint, axis=1)
+    colors = mean_of_sums(*dominant_sums(flat_labels, pixels, cells, dominant, num_shapes + 1))
+    colors[0] = 0
+    return colors, counts
@@ -1,15 +1,614 @@
 """
-cubist_core_logic.py - Placeholder for core cubist processing logic
+cubist_core_logic.py - Core cubist processing logic
 
 # Version v12h_fixed | Timestamp: 2025-07-27 21:45 UTC | Hash: SHA256_PLACEHOLDER
 """
 
-def run_cubist(input_path, output_dir, mask_path=None, total_points=1000, clip_to_alpha=True, verbose=True):
-    from pathlib import Path
-    import shutil
+import itertools
+import os
+from contextlib import ExitStack
+from pathlib import Path
 
+import cv2
+import numpy as np
+from scipy.spatial import Delaunay
+
+from cubist_animation import DEFAULT_FRAME_MS, open_animation
+from cubist_cache import ArtifactCache, file_sha256
+from cubist_draft import draft_report, load_draft_image, reduce_image, render_draft
+from cubist_edges import AUTO_MASK, compute_edge_mask, resample_mask
+from cubist_lut import lut_transform
+from cubist_parallel import map_shared
+from cubist_pointstore import load_points, save_points
+from cubist_posterize import Posterizer
+from cubist_progression import ProgressionRenderer, color_prefix_sums, frame_points, progression_point_counts
+from cubist_renderer import (chain_palette_transforms, neutral_color, paint_labels, render_mixed, render_triangles,
+                             repair_voids, resolve_mixed, triangle_visibility, void_mask)
+from cubist_sampling import EDGE_FRACTION, PointSampler
+from cubist_tiles import draw_shapes_tiled, render_polygons_tiled, voronoi_shapes_tiled
+from cubist_voronoi import render_voronoi, voronoi_shapes
+from cubist_trace import NULL_TRACER
+from cubist_vector import VECTOR_FORMATS, alpha_clip_contours, cell_shapes_of, triangle_shapes, write_vector
+from cubist_writer import (DEFAULT_PNG_COMPRESSION, FrameWriter, encode_image, output_extension, write_bytes,
+                           write_image)
+
+RENDER_STAGES = ("load", "sampling", "triangulation", "voronoi", "fill", "inpaint", "save")
+
+
+class RenderCancelled(Exception):
+    """Raised at a stage boundary when a render's cancel event is set."""
+
+
+def report_stage(name, progress=None, cancel_event=None):
+    """Stage boundary: stop if cancelled, then tell progress which stage starts.
+
+    progress is called as progress(stage_name, stage_index, stage_count).
+    """
+    if cancel_event is not None and cancel_event.is_set():
+        raise RenderCancelled(f"Render cancelled before {name}.")
+    if progress is not None:
+        progress(name, RENDER_STAGES.index(name), len(RENDER_STAGES))
+
+
+def decode_image(input_path):
+    """Decode an image file into (image_rgb, alpha, has_alpha)."""
+    image = cv2.imread(str(input_path), cv2.IMREAD_UNCHANGED)
+    if image is None:
+        raise FileNotFoundError(f"Input image not found: {input_path}")
+    if image.ndim == 2:
+        image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+    if image.shape[2] == 4:
+        image_rgb = cv2.cvtColor(image[:, :, :3], cv2.COLOR_BGR2RGB)
+        alpha = image[:, :, 3]
+        return image_rgb, alpha, True
+    image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    alpha = np.full(image_rgb.shape[:2], 255, dtype=np.uint8)
+    return image_rgb, alpha, False
+
+
+def load_image(input_path, cache=None):
+    """Load an image and split it into (image_rgb, alpha, has_alpha).
+
+    With an ArtifactCache the decoded planes are reused (memory-mapped,
+    read-only) while the file content is unchanged.
+    """
+    if cache is None:
+        return decode_image(input_path)
+
+    def decode():
+        image_rgb, alpha, has_alpha = decode_image(input_path)
+        return image_rgb, alpha, np.array(has_alpha)
+
+    image_rgb, alpha, has_alpha = cache.get_or_compute(
+        cache.file_hash(input_path), ("image_rgb", "alpha", "has_alpha"), decode)
+    return image_rgb, alpha, bool(has_alpha)
+
+
+def load_edge_mask(mask_path, shape):
+    """Grayscale edge mask matching shape.
+
+    A mask of another size (e.g. a full-resolution mask for a draft image)
+    is resampled, see cubist_edges.resample_mask.
+    """
+    edge_mask = cv2.imread(str(mask_path), cv2.IMREAD_GRAYSCALE)
+    if edge_mask is None:
+        raise ValueError(f"Edge mask '{mask_path}' not found or not readable.")
+    return resample_mask(edge_mask, shape)
+
+
+def resolve_mask_path(mask_path):
+    """mask_path if it can be used: an existing file or AUTO_MASK, else None."""
+    if mask_path == AUTO_MASK or (mask_path and os.path.exists(mask_path)):
+        return mask_path
+    return None
+
+
+def edge_mask_for(mask_path, image_rgb, alpha):
+    """Edge mask for a sampler: computed from the image for AUTO_MASK, else loaded."""
+    if mask_path == AUTO_MASK:
+        return compute_edge_mask(image_rgb, alpha)
+    return load_edge_mask(mask_path, alpha.shape)
+
+
+def build_sampler(alpha, image_rgb=None, mask_path=None, cache=None, image_hash=None):
+    """PointSampler for an image, with its pixel indices cached when a cache is given.
+
+    The edge pixels are cached per input and mask content, or per input and
+    image size for generated (AUTO_MASK) masks.
+    """
+    if cache is None:
+        edge_mask = edge_mask_for(mask_path, image_rgb, alpha) if mask_path else None
+        return PointSampler(alpha, edge_mask, image_rgb)
+    valid = cache.get_or_compute(image_hash, "valid_pixels", lambda: np.flatnonzero(alpha > 0))
+    edges = None
+    if mask_path:
+        mask = AUTO_MASK if mask_path == AUTO_MASK else cache.file_hash(mask_path)
+        edges = cache.get_or_compute(
+            image_hash, "edge_pixels",
+            lambda: np.flatnonzero((edge_mask_for(mask_path, image_rgb, alpha) == 0) & (alpha > 0)),
+            mask=mask, shape=alpha.shape)
+    return PointSampler(alpha, image_rgb=image_rgb, valid=valid, edges=edges)
+
+
+def generate_points(alpha, total_points, mask_path=None, edge_fraction=EDGE_FRACTION, seed=None,
+                    strategy="edge_biased", image_rgb=None, sampler=None):
+    """Sample points on opaque pixels with a PointSampler strategy.
+
+    The default strategy biases edge_fraction of the points towards black
+    pixels of the edge mask, as the original sampler did.
+    """
+    if sampler is None:
+        sampler = build_sampler(alpha, image_rgb, mask_path)
+    if strategy == "edge_biased":
+        return sampler.edge_biased(total_points, seed=seed, edge_fraction=edge_fraction)
+    return sampler.sample(strategy, total_points, seed=seed)
+
+
+def prepare_points(input_path, alpha, image_rgb, total_points, mask_path=None, seed=None, sampling="edge_biased",
+                   points_path=None, cache=None, full_size=None):
+    """Sampled points for a run, reused from points_path when it exists.
+
+    A new point set is saved to points_path after sampling. Stored sets are
+    checked against the input image hash and must hold at least
+    total_points points. When alpha is a reduced (draft) plane, full_size
+    (width, height) maps sampled points back to full-resolution coordinates,
+    which is what point files store.
+    """
+    image_hash = None
+    if points_path or cache is not None:
+        image_hash = cache.file_hash(input_path) if cache is not None else file_sha256(input_path)
+    if points_path and os.path.exists(points_path):
+        points = load_points(points_path, total_points, image_hash=image_hash)
+        if len(points) < total_points:
+            raise ValueError(f"Point file '{points_path}' holds {len(points)} points, {total_points} requested.")
+        return points
+    sampler = build_sampler(alpha, image_rgb, mask_path, cache, image_hash)
+    points = generate_points(alpha, total_points, mask_path, seed=seed, strategy=sampling, sampler=sampler)
+    if full_size is not None and tuple(full_size) != (alpha.shape[1], alpha.shape[0]):
+        scale = np.array(full_size, dtype=np.float64) / [alpha.shape[1], alpha.shape[0]]
+        points = ((points + 0.5) * scale).astype(np.int32)
+    if points_path:
+        save_points(points_path, points, seed, EDGE_FRACTION if mask_path else 0.0, sampling, image_hash)
+    return points
+
+
+def cached_neutral_color(input_path, image_rgb, alpha, cache=None):
+    if cache is None:
+        return None
+    return cache.get_or_compute(cache.file_hash(input_path), "neutral_color", lambda: neutral_color(image_rgb, alpha))
+
+
+def make_posterizer(posterize=None, seed=None):
+    """Posterizer for posterize colors (see cubist_posterize), or None."""
+    return Posterizer(posterize, seed) if posterize else None
+
+
+def load_palette_transform(lut_path=None, lut_method="tetrahedral", cache=None, posterizer=None):
+    """Palette transform for a run, or None when there is none.
+
+    Colors are posterized first and the reduced palette is then LUT graded.
+    """
+    lut = lut_transform(lut_path, lut_method, cache) if lut_path else None
+    return chain_palette_transforms(posterizer, lut)
+
+
+def output_tag(lut_path=None, posterize=None, color_stat="mean"):
+    """File name suffix marking median/mode, posterized or graded output, so it never replaces a plain render."""
+    return ((f"_{color_stat}" if color_stat != "mean" else "") + (f"_k{posterize}" if posterize else "")
+            + ("_lut" if lut_path else ""))
+
+
+def add_corners(points, width, height):
+    corners = np.array([[0, 0], [width - 1, 0], [width - 1, height - 1], [0, height - 1]])
+    return np.vstack([points, corners])
+
+
+def save_canvas(output_path, canvas, alpha=None, output_format=None, png_compression=DEFAULT_PNG_COMPRESSION,
+                tracer=NULL_TRACER):
+    """Encode and write a canvas, traced as the encode and write stages."""
+    if output_format is None:
+        write_image(output_path, canvas, alpha, output_format, png_compression)
+        return
+    with tracer.stage("encode", format=output_format) as record:
+        data = encode_image(canvas, alpha, output_format, png_compression)
+        record["bytes"] = int(data.size)
+    with tracer.stage("write"):
+        write_bytes(output_path, data)
+
+
+def run_cubist(input_path, output_dir, mask_path=None, total_points=1000, clip_to_alpha=True, verbose=True,
+               tile_size=None, workers=None, use_mixed_geometry=False, seed=None, sampling="edge_biased",
+               points_path=None, cache_dir=None, progress=None, cancel_event=None, draft_factor=None,
+               draft_full_size=False, output_format="png", png_compression=DEFAULT_PNG_COMPRESSION, tracer=None,
+               lut_path=None, lut_method="tetrahedral", posterize=None, color_stat="mean", vector_format=None):
+    """Render one cubist image and return the saved path.
+
+    progress and cancel_event (a threading.Event) are checked at every stage
+    boundary, see report_stage; a set event raises RenderCancelled.
+    draft_factor (2, 4 or 8) renders in draft quality, see run_cubist_draft.
+    tracer (a cubist_trace.Tracer) records timings and counts per stage.
+    lut_path (.cube, .3dl or .csp) grades the shape colors before painting,
+    interpolated with lut_method, see cubist_lut. posterize (2-256) paints
+    the shapes from that many area-weighted k-means colors, see
+    cubist_posterize. color_stat picks each shape's mean, median or
+    dominant (mode) color, see cubist_colorstats. vector_format ("svg",
+    "svgz" or "pdf") also writes the shapes as vector graphics next to the
+    raster, see cubist_vector.
+    """
+    if vector_format and vector_format not in VECTOR_FORMATS:
+        raise ValueError(f"Unknown vector format '{vector_format}', expected one of {VECTOR_FORMATS}.")
+    if draft_factor:
+        if vector_format:
+            raise ValueError("Vector output needs the full-resolution geometry; drop draft_factor.")
+        return run_cubist_draft(input_path, output_dir, draft_factor, mask_path, total_points, clip_to_alpha, verbose,
+                                use_mixed_geometry, seed, sampling, points_path, cache_dir, progress, cancel_event,
+                                draft_full_size, output_format, png_compression, tracer, lut_path, lut_method,
+                                posterize, color_stat)
+    tracer = tracer or NULL_TRACER
+    report_stage("load", progress, cancel_event)
+    cache = ArtifactCache(cache_dir) if cache_dir else None
+    with tracer.stage("decode", cached=cache is not None) as record:
+        image_rgb, alpha, has_alpha = load_image(input_path, cache)
+        height, width = image_rgb.shape[:2]
+        record.update(width=width, height=height, has_alpha=has_alpha)
+    with tracer.stage("palette", lut=int(bool(lut_path)), posterize=posterize or 0):
+        palette_transform = load_palette_transform(lut_path, lut_method, cache, make_posterizer(posterize, seed))
+
+    report_stage("sampling", progress, cancel_event)
+    mask_path = resolve_mask_path(mask_path)
+    with tracer.stage("sample", sampling=sampling, edge_mask=bool(mask_path)) as record:
+        pts = prepare_points(input_path, alpha, image_rgb, total_points, mask_path, seed, sampling, points_path,
+                             cache)
+        points = add_corners(pts, width, height)
+        record["points"] = len(points)
+
+    report_stage("triangulation", progress, cancel_event)
+    with tracer.stage("triangulate") as record:
+        tri = Delaunay(points)
+        record["triangles"] = len(tri.simplices)
+    if use_mixed_geometry:
+        # Cell statistics and shape choice; the shapes are painted with the triangles
+        report_stage("voronoi", progress, cancel_event)
+        with tracer.stage("voronoi", tile_size=tile_size) as record:
+            if tile_size:
+                cells = voronoi_shapes_tiled(points, tri, image_rgb, tile_size, workers, palette_transform,
+                                             color_stat)
+            else:
+                # resolve_mixed transforms triangle and cell colors together
+                cells = voronoi_shapes(points, tri, image_rgb, color_stat=color_stat)
+            record["regions"] = len(points)
+    report_stage("fill", progress, cancel_event)
+    if tile_size:
+        with tracer.stage("fill", tile_size=tile_size, mixed=use_mixed_geometry) as record:
+            visible = triangle_visibility(points, tri.simplices, alpha, clip_to_alpha)
+            tri_pts = points[tri.simplices[visible]].astype(np.int32)
+            canvas, palette, counts, coverage = render_polygons_tiled(tri_pts, image_rgb, alpha, clip_to_alpha,
+                                                                      tile_size, workers,
+                                                                      palette_transform=palette_transform,
+                                                                      color_stat=color_stat)
+            vector_shapes = [triangle_shapes(tri_pts, palette, counts > 0)]
+            if use_mixed_geometry:
+                canvas = draw_shapes_tiled(canvas, cells, coverage, tile_size, workers)
+                vector_shapes.append(cell_shapes_of(cells))
+            record["triangles"] = len(tri_pts)
+    elif use_mixed_geometry:
+        # Triangles and Voronoi shapes are resolved together in one pass
+        with tracer.stage("fill", mixed=True) as record:
+            coverage, palette, cells = resolve_mixed(points, tri, image_rgb, alpha, clip_to_alpha,
+                                                     palette_transform=palette_transform, color_stat=color_stat,
+                                                     shapes=cells)
+            canvas = paint_labels(coverage, palette)
+            if vector_format:
+                shown = np.bincount(coverage.ravel(), minlength=len(palette)) > 0
+                vector_shapes = [triangle_shapes(points[tri.simplices], palette, shown),
+                                 cell_shapes_of(cells, palette, len(tri.simplices))]
+            record["triangles"] = len(tri.simplices)
+    else:
+        with tracer.stage("fill") as record:
+            canvas, coverage, palette = render_triangles(points, tri.simplices, image_rgb, alpha, clip_to_alpha,
+                                                         palette_transform, color_stat)
+            if vector_format:
+                shown = np.bincount(coverage.ravel(), minlength=len(palette)) > 0
+                vector_shapes = [triangle_shapes(points[tri.simplices], palette, shown)]
+            record["triangles"] = len(tri.simplices)
+    report_stage("inpaint", progress, cancel_event)
+    with tracer.stage("inpaint") as record:
+        voids = void_mask(coverage, alpha)
+        record["void_pixels"] = 0 if voids is None else int(np.count_nonzero(voids))
+        neutral = None
+        if voids is not None:
+            neutral = cached_neutral_color(input_path, image_rgb, alpha, cache)
+            canvas = repair_voids(canvas, image_rgb, alpha, neutral, voids)
+
+    report_stage("save", progress, cancel_event)
     Path(output_dir).mkdir(parents=True, exist_ok=True)
-    output_name = f"your_input_image_{total_points:05d}pts.png"
+    output_name = f"{Path(input_path).stem}_{total_points:05d}pts{output_tag(lut_path, posterize, color_stat)}{output_extension(output_format)}"
     output_path = Path(output_dir) / output_name
-    shutil.copy(input_path, output_path)
+    save_canvas(output_path, canvas, alpha if has_alpha else None, output_format, png_compression, tracer)
+    if verbose:
+        print(f"Saved: {output_path} ({len(tri.simplices)} triangles)")
+    if vector_format:
+        vector_path = output_path.with_suffix(f".{vector_format}")
+        with tracer.stage("vector", format=vector_format) as record:
+            # Voids are not inpainted in vector form; a neutral backdrop shows through them
+            if voids is not None and neutral is None:
+                neutral = neutral_color(image_rgb, alpha)
+            clip = alpha_clip_contours(alpha) if has_alpha else None
+            written = write_vector(vector_path, itertools.chain(*vector_shapes), width, height, clip, neutral,
+                                   vector_format)
+            record.update(shapes=written, bytes=vector_path.stat().st_size)
+        if verbose:
+            print(f"Saved: {vector_path} ({written} shapes)")
     return str(output_path)
+
+
+def load_draft_inputs(input_path, draft_factor, cache=None):
+    """Draft planes (image_rgb, alpha, has_alpha, full_size) for an input."""
+    draft = load_draft_image(input_path, draft_factor)
+    if draft is None:
+        draft = reduce_image(*load_image(input_path, cache), draft_factor)
+    return draft
+
+
+def run_cubist_draft(input_path, output_dir, draft_factor=4, mask_path=None, total_points=1000, clip_to_alpha=True,
+                     verbose=True, use_mixed_geometry=False, seed=None, sampling="edge_biased", points_path=None,
+                     cache_dir=None, progress=None, cancel_event=None, full_size_output=False, output_format="png",
+                     png_compression=DEFAULT_PNG_COMPRESSION, tracer=None, lut_path=None, lut_method="tetrahedral",
+                     posterize=None, color_stat="mean"):
+    """Draft-quality render: reduced decode and color statistics, full-resolution geometry.
+
+    The input is decoded at 1/draft_factor scale; points are sampled on the
+    reduced alpha but triangulated in full-resolution coordinates (so point
+    files are shared with full renders). The canvas is saved at the reduced
+    size, or at full size when full_size_output is set (the file name then
+    ends in _draft{draft_factor}_full instead of _draft{draft_factor}).
+    """
+    tracer = tracer or NULL_TRACER
+    report_stage("load", progress, cancel_event)
+    cache = ArtifactCache(cache_dir) if cache_dir else None
+    with tracer.stage("decode", draft_factor=draft_factor) as record:
+        image_rgb, alpha, has_alpha, full_size = load_draft_inputs(input_path, draft_factor, cache)
+        width, height = full_size
+        record.update(width=image_rgb.shape[1], height=image_rgb.shape[0], has_alpha=has_alpha)
+    with tracer.stage("palette", lut=int(bool(lut_path)), posterize=posterize or 0):
+        palette_transform = load_palette_transform(lut_path, lut_method, cache, make_posterizer(posterize, seed))
+
+    report_stage("sampling", progress, cancel_event)
+    mask_path = resolve_mask_path(mask_path)
+    with tracer.stage("sample", sampling=sampling, edge_mask=bool(mask_path)) as record:
+        pts = prepare_points(input_path, alpha, image_rgb, total_points, mask_path, seed, sampling, points_path,
+                             cache, full_size)
+        points = add_corners(pts, width, height)
+        record["points"] = len(points)
+
+    report_stage("triangulation", progress, cancel_event)
+    with tracer.stage("triangulate") as record:
+        tri = Delaunay(points)
+        record["triangles"] = len(tri.simplices)
+    if use_mixed_geometry:
+        # Voronoi cells need the draft-scale point set; upscale the result if asked
+        report_stage("voronoi", progress, cancel_event)
+        with tracer.stage("voronoi", draft_factor=draft_factor) as record:
+            small = points / float(draft_factor)
+            small_tri = Delaunay(small)
+            cells = voronoi_shapes(small, small_tri, image_rgb, color_stat=color_stat)
+            record["regions"] = len(points)
+    report_stage("fill", progress, cancel_event)
+    output_size = full_size if full_size_output else None
+    with tracer.stage("fill", draft_factor=draft_factor, mixed=use_mixed_geometry) as record:
+        if use_mixed_geometry:
+            canvas, coverage = render_mixed(small, small_tri, image_rgb, alpha, clip_to_alpha,
+                                            palette_transform=palette_transform, color_stat=color_stat,
+                                            shapes=cells)
+            out_alpha = alpha
+            if full_size_output:
+                canvas = cv2.resize(canvas, full_size, interpolation=cv2.INTER_NEAREST)
+                coverage = cv2.resize(coverage, full_size, interpolation=cv2.INTER_NEAREST)
+                out_alpha = cv2.resize(alpha, full_size, interpolation=cv2.INTER_NEAREST)
+        else:
+            canvas, out_alpha, _, coverage = render_draft(points, tri.simplices, image_rgb, alpha, draft_factor,
+                                                          output_size, clip_to_alpha, palette_transform, color_stat)
+        record["triangles"] = len(tri.simplices)
+    report_stage("inpaint", progress, cancel_event)
+    with tracer.stage("inpaint") as record:
+        voids = void_mask(coverage, out_alpha)
+        record["void_pixels"] = 0 if voids is None else int(np.count_nonzero(voids))
+        if voids is not None:
+            canvas = repair_voids(canvas, image_rgb, out_alpha, neutral_color(image_rgb, alpha), voids)
+
+    report_stage("save", progress, cancel_event)
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    # Full-size drafts get their own name so they never overwrite a reduced-size one
+    draft_tag = f"_draft{draft_factor}" + ("_full" if full_size_output else "")
+    output_name = (f"{Path(input_path).stem}_{total_points:05d}pts{draft_tag}{output_tag(lut_path, posterize, color_stat)}"
+                   f"{output_extension(output_format)}")
+    output_path = Path(output_dir) / output_name
+    save_canvas(output_path, canvas, out_alpha if has_alpha else None, output_format, png_compression, tracer)
+    if verbose:
+        print(f"Saved: {output_path} ({len(tri.simplices)} triangles, draft 1/{draft_factor})")
+    return str(output_path)
+
+
+def compare_draft(input_path, draft_factor=4, total_points=1000, mask_path=None, clip_to_alpha=True, seed=0,
+                  sampling="edge_biased"):
+    """Report how far draft colors deviate from full quality for one point set.
+
+    Returns the dict from cubist_draft.draft_report (per-triangle mean,
+    95th percentile and max absolute channel error, plus timings).
+    """
+    image_rgb, alpha, _ = load_image(input_path)
+    height, width = image_rgb.shape[:2]
+    mask_path = resolve_mask_path(mask_path)
+    points = add_corners(prepare_points(input_path, alpha, image_rgb, total_points, mask_path, seed, sampling),
+                         width, height)
+    tri = Delaunay(points)
+    draft_rgb, draft_alpha, _, _ = load_draft_inputs(input_path, draft_factor)
+    return draft_report(points, tri.simplices, image_rgb, alpha, draft_rgb, draft_alpha, draft_factor, clip_to_alpha)
+
+
+def render_points(points, image_rgb, alpha, clip_to_alpha=True, use_mixed_geometry=False, palette_transform=None,
+                  color_stat="mean"):
+    """Full (non-incremental) fill of points; returns (canvas, coverage, tri)."""
+    tri = Delaunay(points)
+    if use_mixed_geometry:
+        canvas, coverage = render_mixed(points, tri, image_rgb, alpha, clip_to_alpha,
+                                        palette_transform=palette_transform, color_stat=color_stat)
+    else:
+        canvas, coverage, _ = render_triangles(points, tri.simplices, image_rgb, alpha, clip_to_alpha,
+                                               palette_transform, color_stat)
+    return canvas, coverage, tri
+
+
+def run_cubist_progression(input_path, output_dir, mask_path=None, total_points=1000, clip_to_alpha=True,
+                           verbose=True, num_frames=20, base_point=2, growth_factor=1.53, use_mixed_geometry=False,
+                           seed=None, sampling="edge_biased", points_path=None,
+                           cache_dir=None, workers=None, output_format="png",
+                           png_compression=DEFAULT_PNG_COMPRESSION, tracer=None, animation_path=None,
+                           frame_ms=DEFAULT_FRAME_MS, final_hold=1, write_frames=None, lut_path=None,
+                           lut_method="tetrahedral", posterize=None, color_stat="mean"):
+    """Render a geometric point-count progression, one frame per point count.
+
+    Frames share one incremental triangulation: each frame only re-renders
+    the triangles its new points created. With workers > 1 the frames are
+    instead rendered independently on a process pool (see render_frame).
+    Returns the list of saved paths in frame order. tracer records decode
+    and sampling, plus per-frame stages in the incremental path; frames
+    are encoded in the background, so encode and write are not traced.
+
+    animation_path streams the frames into one animation (see
+    cubist_animation.open_animation, format by extension), frame_ms apart,
+    with the last frame held final_hold frame times; its path is appended
+    to the result. Individual frame images are then only written with
+    write_frames=True. Animations always use the incremental path.
+    lut_path, lut_method, posterize and color_stat work as in run_cubist;
+    the posterized palette is fitted once, on the final frame's shapes,
+    and shared by all frames. Mean colors come from prefix sums over whole
+    triangle spans in both paths (see ProgressionRenderer). The worker count
+    only changes a frame where the incremental and the fresh triangulation
+    split a tie between cocircular points differently, which moves a few
+    edge pixels. Prefix sums only give means, so with a median or mode
+    color_stat every frame is rendered in full instead.
+    """
+    if write_frames is None:
+        write_frames = animation_path is None
+    tracer = tracer or NULL_TRACER
+    cache = ArtifactCache(cache_dir) if cache_dir else None
+    with tracer.stage("decode", cached=cache is not None) as record:
+        image_rgb, alpha, has_alpha = load_image(input_path, cache)
+        height, width = image_rgb.shape[:2]
+        record.update(width=width, height=height, has_alpha=has_alpha)
+    with tracer.stage("palette", lut=int(bool(lut_path)), posterize=posterize or 0):
+        posterizer = make_posterizer(posterize, seed)
+        palette_transform = load_palette_transform(lut_path, lut_method, cache, posterizer)
+
+    mask_path = resolve_mask_path(mask_path)
+    with tracer.stage("sample", sampling=sampling, edge_mask=bool(mask_path)) as record:
+        fixed_points = prepare_points(input_path, alpha, image_rgb, total_points, mask_path, seed, sampling,
+                                      points_path, cache)
+        record["points"] = len(fixed_points)
+    neutral = cached_neutral_color(input_path, image_rgb, alpha, cache)
+    point_counts = progression_point_counts(num_frames, base_point, growth_factor, total_points)
+    if posterizer is not None:
+        render_points(frame_points(fixed_points, point_counts[-1], alpha), image_rgb, alpha, clip_to_alpha,
+                      use_mixed_geometry, posterizer, color_stat)
+
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    if workers and workers > 1 and animation_path is None:
+        arrays = {"image_rgb": image_rgb, "alpha": alpha, "fixed_points": fixed_points}
+        if posterizer is not None:
+            arrays["posterize_palette"] = posterizer.palette
+        if color_stat == "mean":
+            arrays["prefix"] = color_prefix_sums(image_rgb, alpha, clip_to_alpha)
+        results = map_shared(render_frame, enumerate(point_counts, 1), arrays, workers, costs=point_counts,
+                             output_dir=str(output_dir), clip_to_alpha=clip_to_alpha,
+                             use_mixed_geometry=use_mixed_geometry, has_alpha=has_alpha, neutral=neutral,
+                             output_format=output_format, png_compression=png_compression, lut_path=lut_path,
+                             lut_method=lut_method, color_stat=color_stat)
+        if verbose:
+            for output_path, num_triangles in results:
+                print(f"Saved: {output_path} ({num_triangles} triangles)")
+        return [output_path for output_path, _ in results]
+
+    renderer = None
+    if color_stat == "mean":
+        renderer = ProgressionRenderer(image_rgb, alpha, clip_to_alpha, max_points=len(fixed_points) + 4,
+                                       palette_transform=palette_transform)
+    output_paths = []
+    # Frames are encoded in the background while the next one renders
+    with ExitStack() as stack:
+        writer = stack.enter_context(FrameWriter(output_format, png_compression)) if write_frames else None
+        sink = stack.enter_context(open_animation(animation_path, frame_ms)) if animation_path else None
+        for frame, count in enumerate(point_counts, 1):
+            points = frame_points(fixed_points, count, alpha)
+            with tracer.stage("fill", frame=frame, points=len(points)) as record:
+                if renderer is None:
+                    canvas, coverage, tri = render_points(points, image_rgb, alpha, clip_to_alpha, use_mixed_geometry,
+                                                          palette_transform, color_stat)
+                    rendered = len(tri.simplices)
+                else:
+                    canvas = renderer.render(points).copy()
+                    tri, rendered = renderer.tri, renderer.last_created
+                    # Without alpha clipping hidden triangles leave holes; only then is coverage tracked
+                    coverage = None if renderer.coverage is None else renderer.coverage.copy()
+                record.update(triangles=len(tri.simplices), rendered=rendered)
+            if use_mixed_geometry and renderer is not None:
+                with tracer.stage("voronoi", frame=frame, regions=len(points)):
+                    canvas = render_voronoi(points, renderer.tri, image_rgb, canvas, coverage=coverage,
+                                            palette_transform=palette_transform)
+            with tracer.stage("inpaint", frame=frame) as record:
+                voids = None if coverage is None else void_mask(coverage, alpha)
+                record["void_pixels"] = 0 if voids is None else int(np.count_nonzero(voids))
+                if voids is not None:
+                    canvas = repair_voids(canvas, image_rgb, alpha, neutral, voids)
+
+            if sink is not None:
+                sink.add(canvas, alpha if has_alpha else None, final_hold if frame == len(point_counts) else 1)
+            output_path = Path(output_dir) / f"frame_{frame:02d}_{count:05d}pts{output_extension(output_format)}"
+            if writer is not None:
+                writer.submit(output_path, canvas, alpha if has_alpha else None)
+                output_paths.append(str(output_path))
+            if verbose:
+                print(f"Rendered: frame {frame} ({count} points, {rendered} triangles re-rendered)")
+    if animation_path:
+        output_paths.append(str(animation_path))
+        if verbose:
+            print(f"Saved: {animation_path} ({len(point_counts)} frames)")
+    return output_paths
+
+
+def render_frame(arrays, task, output_dir, clip_to_alpha=True, use_mixed_geometry=False, has_alpha=True,
+                 neutral=None, output_format="png", png_compression=DEFAULT_PNG_COMPRESSION, lut_path=None,
+                 lut_method="tetrahedral", color_stat="mean"):
+    """Render and save one progression frame from scratch (process-pool worker).
+
+    arrays holds the shared image_rgb, alpha and fixed_points, plus the
+    fitted posterize_palette when posterizing and the color prefix sums
+    for mean colors; task is (frame, count). Mean-colored frames go through
+    a fresh ProgressionRenderer so they match the incremental path.
+    Returns (output_path, triangle count).
+    """
+    frame, count = task
+    image_rgb, alpha = arrays["image_rgb"], arrays["alpha"]
+    points = frame_points(arrays["fixed_points"], count, alpha)
+    posterizer = None
+    if "posterize_palette" in arrays:
+        palette = arrays["posterize_palette"]
+        posterizer = Posterizer(len(palette), palette=palette)
+    palette_transform = load_palette_transform(lut_path, lut_method, posterizer=posterizer)
+    if "prefix" in arrays:
+        renderer = ProgressionRenderer(image_rgb, alpha, clip_to_alpha, len(points), palette_transform,
+                                       arrays["prefix"])
+        canvas, coverage, tri = renderer.render(points), renderer.coverage, renderer.tri
+        if use_mixed_geometry:
+            canvas = render_voronoi(points, tri, image_rgb, canvas, coverage=coverage,
+                                    palette_transform=palette_transform)
+    else:
+        canvas, coverage, tri = render_points(points, image_rgb, alpha, clip_to_alpha, use_mixed_geometry,
+                                              palette_transform, color_stat)
+    voids = None if coverage is None else void_mask(coverage, alpha)
+    if voids is not None:
+        canvas = repair_voids(canvas, image_rgb, alpha, neutral, voids)
+
+    output_path = Path(output_dir) / f"frame_{frame:02d}_{count:05d}pts{output_extension(output_format)}"
+    save_canvas(output_path, canvas, alpha if has_alpha else None, output_format, png_compression)
+    return str(output_path), len(tri.simplices)
@@ -0,0 +1,334 @@
+"""
+cubist_costmodel.py - Calibrated per-machine cost model for render estimates
+
+Each pipeline stage is modelled as a non-negative linear function of what it
+touches: a fixed overhead plus terms in image pixels, points and triangles
+(a Delaunay triangulation has about two triangles per point). The
+coefficients are fitted with non-negative least squares on stage records
+from cubist_trace (recent samples are kept per stage). They are saved per
+machine, so the fit sticks to the hardware that produced it. Until enough
+samples exist, built-in defaults are used.
+
+predict() gives a pre-flight estimate of seconds per stage and peak memory;
+EtaTracker turns it into an ETA that follows the stages a running render
+finishes, scaled by how far the measured stages were off.
+
+Example:
+    python cubist_costmodel.py --trace logs/trace.jsonl   # fit from traces
+    python cubist_costmodel.py --synthetic                # time test renders
+"""
+
+import argparse
+import json
+import os
+import platform
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+from scipy.optimize import nnls
+
+from cubist_cache import DEFAULT_CACHE_DIR
+from cubist_draft import image_header
+
+MODEL_VERSION = 1
+MAX_SAMPLES = 400
+MIN_SAMPLES = 4
+VOID_FRACTION = 0.01  # share of opaque pixels left uncovered without alpha clipping
+ETA_CORRECTION = (0.25, 4.0)
+
+# Feature names per stage; every stage also has a constant term
+STAGE_FEATURES = {
+    "decode": ("pixels",),
+    "palette": ("lut",),
+    "sample": ("pixels", "points"),
+    "triangulate": ("points",),
+    "fill": ("pixels", "triangles"),
+    "fill_mixed": ("pixels", "triangles"),
+    "voronoi": ("pixels", "points"),
+    "inpaint": ("pixels", "void_pixels"),
+    "encode": ("pixels",),
+    "write": ("pixels",),
+}
+MEMORY_FEATURES = ("pixels", "points")
+
+# Seconds (constant, then per feature unit) measured on a single-core
+# reference machine; replaced by the calibrated fit once there are samples
+DEFAULT_COEFFICIENTS = {
+    "decode": (0.015, 4.0e-8),
+    "palette": (0.0001, 0.04),
+    "sample": (0.001, 3.5e-9, 7.0e-8),
+    "triangulate": (0.001, 1.1e-5),
+    "fill": (0.002, 6.0e-8, 2.8e-6),
+    "fill_mixed": (0.003, 3.5e-8, 1.2e-5),
+    "voronoi": (0.004, 1.2e-7, 3.0e-5),
+    "inpaint": (0.001, 1.2e-9, 5.0e-5),
+    "encode": (0.03, 4.7e-8),
+    "write": (0.0005, 1.5e-11),
+}
+DEFAULT_MEMORY = (105000.0, 0.028, 0.46)  # KiB: constant, per pixel, per point
+
+
+def machine_id():
+    return f"{platform.node() or 'unknown'}-{platform.machine()}-{os.cpu_count() or 1}cpu"
+
+
+def default_model_path():
+    safe = "".join(c if c.isalnum() or c in "-_" else "_" for c in machine_id())
+    return DEFAULT_CACHE_DIR / f"cost_model_{safe}.json"
+
+
+def image_size(path):
+    """(width, height) of an image file, from its header when possible."""
+    header = image_header(path)
+    if header is not None:
+        return header[:2]
+    image = cv2.imread(str(path), cv2.IMREAD_UNCHANGED)
+    if image is None:
+        raise FileNotFoundError(f"Input image not found: {path}")
+    return image.shape[1], image.shape[0]
+
+
+def stage_key(record):
+    if record["stage"] == "fill" and record.get("mixed"):
+        return "fill_mixed"
+    return record["stage"]
+
+
+def format_seconds(seconds):
+    if seconds < 60:
+        return f"{seconds:.1f}s"
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    if minutes < 60:
+        return f"{minutes}m {seconds:02d}s"
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes:02d}m"
+
+
+class CostModel:
+    """Per-stage linear timing model plus a peak-memory model for one machine."""
+
+    def __init__(self, path=None, samples=None, memory_samples=None):
+        self.path = Path(path) if path else default_model_path()
+        self.samples = {stage: list(rows) for stage, rows in (samples or {}).items()}
+        self.memory_samples = list(memory_samples or [])
+        self._coefficients = {}
+
+    @classmethod
+    def load(cls, path=None):
+        """The saved model for this machine, or an uncalibrated one."""
+        path = Path(path) if path else default_model_path()
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return cls(path)
+        if data.get("version") != MODEL_VERSION:
+            return cls(path)
+        return cls(path, data.get("samples"), data.get("memory_samples"))
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        data = {"version": MODEL_VERSION, "machine": machine_id(), "samples": self.samples,
+                "memory_samples": self.memory_samples}
+        tmp_path = self.path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    def add_records(self, records):
+        """Add samples from cubist_trace records; records are grouped by run id.
+
+        Returns the number of stage samples added. Progression frames and
+        stages without the needed counts are skipped.
+        """
+        runs = {}
+        for record in records:
+            runs.setdefault(record.get("run"), []).append(record)
+        added = 0
+        for run_records in runs.values():
+            decode = next((r for r in run_records if r["stage"] == "decode"), None)
+            if decode is None or "width" not in decode:
+                continue
+            pixels = decode["width"] * decode["height"]
+            points = next((r["points"] for r in run_records if r["stage"] == "sample"), 0)
+            triangles = next((r["triangles"] for r in run_records if r["stage"] == "triangulate"), 2 * points)
+            values = {"pixels": pixels, "points": points, "triangles": triangles}
+            for record in run_records:
+                key = stage_key(record)
+                if key not in STAGE_FEATURES or "frame" in record or "error" in record:
+                    continue
+                features = dict(values, void_pixels=record.get("void_pixels", 0), lut=record.get("lut", 0))
+                row = [features[name] for name in STAGE_FEATURES[key]] + [record["wall_seconds"]]
+                self.samples.setdefault(key, []).append(row)
+                del self.samples[key][:-MAX_SAMPLES]
+                added += 1
+            # Absolute process peak; needs per-stage peaks (Linux only)
+            if all("rss_start_kb" in record for record in run_records):
+                peak = max(record["rss_start_kb"] + record["peak_rss_delta_kb"] for record in run_records)
+                self.memory_samples.append([pixels, points, peak])
+                del self.memory_samples[:-MAX_SAMPLES]
+        self._coefficients = {}
+        return added
+
+    def coefficients(self, stage):
+        """(constant, per-feature...) seconds for a stage, fitted when possible."""
+        if stage not in self._coefficients:
+            rows = self.samples.get(stage, [])
+            if len(rows) < MIN_SAMPLES:
+                self._coefficients[stage] = np.asarray(DEFAULT_COEFFICIENTS[stage], dtype=np.float64)
+            else:
+                data = np.asarray(rows, dtype=np.float64)
+                self._coefficients[stage] = fit_nonnegative(data[:, :-1], data[:, -1])
+        return self._coefficients[stage]
+
+    def memory_coefficients(self):
+        if len(self.memory_samples) < MIN_SAMPLES:
+            return np.asarray(DEFAULT_MEMORY, dtype=np.float64)
+        data = np.asarray(self.memory_samples, dtype=np.float64)
+        return fit_nonnegative(data[:, :-1], data[:, -1])
+
+    def predict(self, width, height, points, mixed=False, inpaint=False, lut=False):
+        """Pre-flight estimate for one render.
+
+        inpaint means voids are expected (no alpha clipping), lut that a LUT
+        file is loaded. Returns a dict
+        with total seconds, seconds per stage and peak memory in MiB.
+        """
+        pixels = width * height
+        points = points + 4  # image corners
+        features = {"pixels": pixels, "points": points, "triangles": 2 * points,
+                    "void_pixels": pixels * VOID_FRACTION if inpaint else 0, "lut": int(lut)}
+        stages = ["decode", "palette", "sample", "triangulate"] + (["voronoi", "fill_mixed"] if mixed else ["fill"])
+        stages += ["inpaint", "encode", "write"]
+        seconds = {}
+        for stage in stages:
+            x = np.array([1.0] + [features[name] for name in STAGE_FEATURES[stage]])
+            seconds[stage] = float(x @ self.coefficients(stage))
+        memory = np.array([1.0] + [features[name] for name in MEMORY_FEATURES]) @ self.memory_coefficients()
+        return {"seconds": sum(seconds.values()), "stages": seconds, "peak_memory_mb": float(memory) / 1024}
+
+    def predict_file(self, input_path, points, mixed=False, inpaint=False, lut=False):
+        width, height = image_size(input_path)
+        return self.predict(width, height, points, mixed, inpaint, lut)
+
+
+def fit_nonnegative(features, seconds):
+    """Non-negative least squares fit of seconds = [1, features] @ coefficients.
+
+    Columns are scaled to unit norm first so pixel counts and constants
+    are weighted alike.
+    """
+    x = np.column_stack((np.ones(len(features)), features))
+    scale = np.linalg.norm(x, axis=0)
+    scale[scale == 0] = 1.0
+    coefficients, _ = nnls(x / scale, seconds)
+    return coefficients / scale
+
+
+class EtaTracker:
+    """Remaining time of a running render from its estimate and finished stages.
+
+    Use observe as a cubist_trace hook. Unfinished stages are predicted
+    from the estimate, scaled by measured / estimated time of the stages
+    finished so far.
+    """
+
+    def __init__(self, estimate):
+        self.estimate = estimate
+        self.done = set()
+        self.measured = 0.0
+        self.expected = 0.0
+
+    def observe(self, record):
+        key = stage_key(record)
+        if key not in self.estimate["stages"]:
+            return
+        self.done.add(key)
+        self.measured += record["wall_seconds"]
+        self.expected += self.estimate["stages"][key]
+
+    def remaining(self):
+        left = sum(seconds for stage, seconds in self.estimate["stages"].items() if stage not in self.done)
+        if self.expected > 0:
+            left *= min(max(self.measured / self.expected, ETA_CORRECTION[0]), ETA_CORRECTION[1])
+        return left
+
+
+def synthetic_image(path, width, height, alpha=False, seed=0):
+    """Write a smooth-gradient-plus-noise test image (optionally with an alpha disc)."""
+    rng = np.random.default_rng(seed)
+    ys, xs = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = np.dstack((xs / width, ys / height, (xs + ys) / (width + height))) * 200
+    image = np.clip(base + rng.normal(0, 12, (height, width, 3)), 0, 255).astype(np.uint8)
+    if alpha:
+        disc = (((xs - width / 2) / (width / 2)) ** 2 + ((ys - height / 2) / (height / 2)) ** 2) <= 1
+        image = np.dstack((image, np.where(disc, 255, 0).astype(np.uint8)))
+    cv2.imwrite(str(path), image)
+    return str(path)
+
+
+def _calibration_run(job):
+    from cubist_core_logic import run_cubist
+    from cubist_trace import Tracer
+
+    records = []
+    input_path, output_dir, points, mixed, clip_to_alpha = job
+    run_cubist(input_path, output_dir, total_points=points, clip_to_alpha=clip_to_alpha, verbose=False,
+               use_mixed_geometry=mixed, seed=0, tracer=Tracer(hooks=[records.append]))
+    return records
+
+
+def calibrate_synthetic(model, sizes=((640, 480), (1600, 1200), (3000, 2000)), point_counts=(500, 5000, 20000),
+                        progress=print):
+    """Time test renders in fresh processes (so memory growth is seen) and add them to model."""
+    with tempfile.TemporaryDirectory() as tmp:
+        jobs = []
+        for i, (width, height) in enumerate(sizes):
+            input_path = synthetic_image(Path(tmp) / f"calib_{width}x{height}.png", width, height, alpha=i % 2 == 1)
+            for points in point_counts:
+                for mixed in (False, True):
+                    jobs.append((input_path, tmp, points, mixed, not mixed))
+        for done, job in enumerate(jobs, 1):
+            # A one-shot pool per render (max_tasks_per_child needs Python 3.11)
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                records = pool.submit(_calibration_run, job).result()
+            model.add_records(records)
+            if progress is not None:
+                progress(f"[{done}/{len(jobs)}] calibration render")
+    return model
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calibrate or query this machine's render cost model.")
+    parser.add_argument("--trace", nargs="*", default=[], help="cubist_trace JSON-lines files to fit from.")
+    parser.add_argument("--synthetic", action="store_true", help="Time a set of synthetic test renders.")
+    parser.add_argument("--model", help=f"Model file (default: {default_model_path()}).")
+    parser.add_argument("--estimate", nargs=2, type=int, metavar=("WIDTH", "HEIGHT"),
+                        help="Print an estimate for an image size after calibrating.")
+    parser.add_argument("-p", "--points", type=int, default=1000)
+    parser.add_argument("--mixed", action="store_true")
+    args = parser.parse_args(argv)
+
+    from cubist_trace import read_trace
+
+    model = CostModel.load(args.model)
+    for trace_path in args.trace:
+        print(f"{trace_path}: {model.add_records(read_trace(trace_path))} stage samples")
+    if args.synthetic:
+        calibrate_synthetic(model)
+    if args.trace or args.synthetic:
+        model.save()
+        print(f"Saved: {model.path}")
+    if args.estimate:
+        estimate = model.predict(*args.estimate, args.points, args.mixed)
+        for stage, seconds in estimate["stages"].items():
+            print(f"  {stage:12s} {seconds:8.3f}s")
+        print(f"Total {format_seconds(estimate['seconds'])}, peak memory ~{estimate['peak_memory_mb']:.0f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,162 @@
+"""
+cubist_draft.py - Draft-quality rendering from a reduced-resolution decode
+
+Draft mode decodes the input at 1/2, 1/4 or 1/8 scale (OpenCV's
+IMREAD_REDUCED_COLOR_* flags, which JPEG decodes natively at the reduced
+size), samples and triangulates in full-resolution coordinates and computes
+every triangle's color on the reduced image. The canvas is painted either at
+the reduced size or at full size from the draft palette. Inputs with an
+alpha channel still need a full decode (the reduced flags drop alpha), so
+for them draft mode only saves on the statistics and painting.
+
+draft_report measures how far draft colors deviate from full-quality colors
+for the same triangulation.
+"""
+
+import struct
+import time
+
+import cv2
+import numpy as np
+
+from cubist_renderer import (paint_labels, rasterize_triangles, shape_colors, shape_mean_colors, transform_palette,
+                             triangle_visibility)
+
+# The reduced flags would apply EXIF orientation, which decode_image (IMREAD_UNCHANGED) and image_header do not
+DRAFT_FLAGS = {factor: flag | cv2.IMREAD_IGNORE_ORIENTATION for factor, flag in
+               ((2, cv2.IMREAD_REDUCED_COLOR_2), (4, cv2.IMREAD_REDUCED_COLOR_4), (8, cv2.IMREAD_REDUCED_COLOR_8))}
+
+
+def image_header(path):
+    """(width, height, has_alpha) from a PNG or JPEG header, or None if unknown."""
+    with open(path, "rb") as f:
+        head = f.read(32)
+        if head[:8] == b"\x89PNG\r\n\x1a\n" and head[12:16] == b"IHDR":
+            width, height = struct.unpack(">II", head[16:24])
+            color_type = head[25]
+            # tRNS chunks on palette images are decoded as alpha too; treat
+            # anything but plain gray/RGB as carrying alpha
+            return width, height, color_type not in (0, 2)
+        if head[:2] != b"\xff\xd8":
+            return None
+        f.seek(2)
+        while True:
+            marker = f.read(2)
+            if len(marker) < 2 or marker[0] != 0xFF:
+                return None
+            length = struct.unpack(">H", f.read(2))[0]
+            if marker[1] in (0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF):
+                height, width = struct.unpack(">xHH", f.read(5))
+                return width, height, False
+            f.seek(length - 2, 1)
+
+
+def load_draft_image(input_path, draft_factor):
+    """Decode at 1/draft_factor scale; returns (image_rgb, alpha, has_alpha, full_size).
+
+    full_size is (width, height) of the original image. Returns None when
+    the file may carry alpha, its header is not understood or the reduced
+    decode does not match the header size; decode it fully and use
+    reduce_image instead.
+    """
+    if draft_factor not in DRAFT_FLAGS:
+        raise ValueError(f"Draft factor must be one of {sorted(DRAFT_FLAGS)}, got {draft_factor}.")
+    header = image_header(input_path)
+    if header is None or header[2]:
+        return None
+    image = cv2.imread(str(input_path), DRAFT_FLAGS[draft_factor])
+    if image is None:
+        raise FileNotFoundError(f"Input image not found: {input_path}")
+    width, height = header[:2]
+    if image.shape[:2] != (-(-height // draft_factor), -(-width // draft_factor)):
+        return None
+    image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    alpha = np.full(image_rgb.shape[:2], 255, dtype=np.uint8)
+    return image_rgb, alpha, False, header[:2]
+
+
+def reduce_image(image_rgb, alpha, has_alpha, draft_factor):
+    """Draft planes from a full decode, same result layout as load_draft_image."""
+    height, width = image_rgb.shape[:2]
+    size = (-(-width // draft_factor), -(-height // draft_factor))
+    return (cv2.resize(image_rgb, size, interpolation=cv2.INTER_AREA),
+            cv2.resize(alpha, size, interpolation=cv2.INTER_NEAREST), has_alpha, (width, height))
+
+
+def upscale_alpha(alpha, full_size):
+    return cv2.resize(alpha, full_size, interpolation=cv2.INTER_NEAREST)
+
+
+def render_draft(points, simplices, image_rgb, alpha, draft_factor, full_size=None, clip_to_alpha=True,
+                 palette_transform=None, color_stat="mean"):
+    """Render triangles with colors from the reduced image.
+
+    points are in full-resolution coordinates. Returns (canvas, alpha,
+    palette, labels): at the reduced size by default, or painted at
+    full_size (width, height) from the draft palette, with alpha upscaled
+    to match. Colors use color_stat (see cubist_renderer.shape_colors) and
+    palette_transform is applied to the draft palette.
+    """
+    height, width = image_rgb.shape[:2]
+    small = np.asarray(points, dtype=np.float64) / draft_factor
+    visible = triangle_visibility(small, simplices, alpha, clip_to_alpha)
+    labels = rasterize_triangles(small, simplices, height, width, visible)
+    if clip_to_alpha:
+        labels[alpha == 0] = 0
+    palette, counts = shape_colors(labels, image_rgb, len(simplices), color_stat)
+    # Triangles thinner than a draft pixel own no pixels; take the color under their centroid
+    empty = np.flatnonzero((counts[1:] == 0) & visible)
+    if len(empty):
+        centroids = small[simplices[empty]].mean(axis=1)
+        cx = np.clip(centroids[:, 0].astype(np.int64), 0, width - 1)
+        cy = np.clip(centroids[:, 1].astype(np.int64), 0, height - 1)
+        palette[empty + 1] = image_rgb[cy, cx]
+    transform_palette(palette, counts, palette_transform)
+    if full_size is None:
+        return paint_labels(labels, palette), alpha, palette, labels
+
+    full_width, full_height = full_size
+    full_alpha = upscale_alpha(alpha, full_size)
+    visible = triangle_visibility(points, simplices, full_alpha, clip_to_alpha)
+    labels = rasterize_triangles(points, simplices, full_height, full_width, visible)
+    if clip_to_alpha:
+        labels[full_alpha == 0] = 0
+    return paint_labels(labels, palette), full_alpha, palette, labels
+
+
+def color_deviation(draft_palette, full_palette, counts):
+    """Pixel-weighted statistics of |draft - full| color error per triangle."""
+    shown = counts[1:] > 0
+    error = np.abs(draft_palette[1:].astype(np.int16) - full_palette[1:].astype(np.int16)).mean(axis=1)[shown]
+    weights = counts[1:][shown]
+    if len(error) == 0:
+        return {"mean_abs_error": 0.0, "p95_abs_error": 0.0, "max_abs_error": 0.0}
+    return {
+        "mean_abs_error": round(float(np.average(error, weights=weights)), 3),
+        "p95_abs_error": round(float(np.percentile(error, 95)), 3),
+        "max_abs_error": round(float(error.max()), 3),
+    }
+
+
+def draft_report(points, simplices, image_rgb, alpha, draft_rgb, draft_alpha, draft_factor, clip_to_alpha=True):
+    """Color deviation of a draft render from the full-quality one.
+
+    Errors are per-triangle mean absolute channel differences (0-255),
+    weighted by the triangle's full-resolution pixel count.
+    """
+    height, width = image_rgb.shape[:2]
+    start = time.perf_counter()
+    visible = triangle_visibility(points, simplices, alpha, clip_to_alpha)
+    labels = rasterize_triangles(points, simplices, height, width, visible)
+    if clip_to_alpha:
+        labels[alpha == 0] = 0
+    full_palette, counts = shape_mean_colors(labels, image_rgb, len(simplices))
+    full_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    _, _, draft_palette, _ = render_draft(points, simplices, draft_rgb, draft_alpha, draft_factor,
+                                       clip_to_alpha=clip_to_alpha)
+    draft_seconds = time.perf_counter() - start
+    report = {"draft_factor": draft_factor, "triangles": len(simplices),
+              "full_seconds": round(full_seconds, 4), "draft_seconds": round(draft_seconds, 4)}
+    report.update(color_deviation(draft_palette, full_palette, counts))
+    return report
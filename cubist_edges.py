@@ -0,0 +1,118 @@
+"""
+cubist_edges.py - Built-in edge masks from a multi-scale image pyramid
+
+Instead of a hand-made edge_mask.png, edges are detected on a Gaussian
+pyramid of the grayscale input (full size, 1/2, 1/4, ...) with Canny (the
+same 100/200 thresholds the archive scripts used for their overlay) or a
+thresholded Sobel magnitude. Coarse levels catch soft, large-scale contours
+that full-size Canny misses; their edges are scaled back up, trimmed to
+pixels with a real full-size gradient and merged with the fine ones. Masks
+use the existing convention: uint8, black (0) on edges, white elsewhere.
+
+resample_mask fits any edge mask to another image size, so masks made for a
+different resolution of the same picture can still be used.
+
+Example:
+    python cubist_edges.py input/photo.jpg -o input/photo_edges.png
+"""
+
+import argparse
+
+import cv2
+import numpy as np
+
+AUTO_MASK = "auto"
+EDGE_METHODS = ("canny", "sobel")
+EDGE_LEVELS = 3
+CANNY_LOW = 100
+CANNY_HIGH = 200
+
+
+def gradient_magnitude(gray):
+    gx = cv2.Sobel(gray, cv2.CV_32F, 1, 0, ksize=3)
+    gy = cv2.Sobel(gray, cv2.CV_32F, 0, 1, ksize=3)
+    return cv2.magnitude(gx, gy)
+
+
+def level_edges(gray, method, low, high):
+    """Boolean edge map of one pyramid level."""
+    if method == "canny":
+        return cv2.Canny(gray, low, high) > 0
+    if method == "sobel":
+        return gradient_magnitude(gray) >= high
+    raise ValueError(f"Unknown edge method '{method}', expected one of {EDGE_METHODS}.")
+
+
+def compute_edge_mask(image_rgb, alpha=None, levels=EDGE_LEVELS, method="canny", low=CANNY_LOW, high=CANNY_HIGH):
+    """Edge mask (0 on edges, 255 elsewhere) merged over levels pyramid levels.
+
+    An edge found at a coarse level covers a 2**level pixel wide band at
+    full size; only the band's pixels with a full-size gradient of at least
+    low are kept, so merged edges stay close to the fine ones in width.
+    With alpha, the outline of the opaque region is added as an edge and
+    edges in fully transparent pixels are dropped.
+    """
+    height, width = image_rgb.shape[:2]
+    gray = cv2.cvtColor(image_rgb, cv2.COLOR_RGB2GRAY)
+    if method not in EDGE_METHODS:
+        raise ValueError(f"Unknown edge method '{method}', expected one of {EDGE_METHODS}.")
+    edges = level_edges(gray, method, low, high)
+    strong = None
+    level_gray = gray
+    for _ in range(1, levels):
+        if min(level_gray.shape) < 16:
+            break
+        level_gray = cv2.pyrDown(level_gray)
+        coarse = level_edges(level_gray, method, low, high).view(np.uint8)
+        if strong is None:
+            strong = gradient_magnitude(gray) >= low
+        band = cv2.resize(coarse, (width, height), interpolation=cv2.INTER_NEAREST) > 0
+        edges |= band & strong
+    if alpha is not None:
+        opaque = (alpha > 0).view(np.uint8)
+        edges |= cv2.morphologyEx(opaque, cv2.MORPH_GRADIENT, np.ones((3, 3), np.uint8)) > 0
+        edges &= alpha > 0
+    return np.where(edges, 0, 255).astype(np.uint8)
+
+
+def resample_mask(edge_mask, shape):
+    """Fit an edge mask to shape (height, width).
+
+    When shrinking, a pixel is an edge if any pixel it covers is (area
+    averaging in float, so thin edges survive); when enlarging, nearest
+    neighbor keeps the mask binary.
+    """
+    height, width = shape[:2]
+    if edge_mask.shape[:2] == (height, width):
+        return edge_mask
+    edges = (edge_mask == 0).astype(np.float32)
+    if height * width < edge_mask.shape[0] * edge_mask.shape[1]:
+        resized = cv2.resize(edges, (width, height), interpolation=cv2.INTER_AREA)
+    else:
+        resized = cv2.resize(edges, (width, height), interpolation=cv2.INTER_NEAREST)
+    return np.where(resized > 0, 0, 255).astype(np.uint8)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a multi-scale edge mask for an input image.")
+    parser.add_argument("input", help="Input image path.")
+    parser.add_argument("-o", "--output", required=True, help="Edge mask PNG path.")
+    parser.add_argument("--method", default="canny", choices=EDGE_METHODS)
+    parser.add_argument("--levels", type=int, default=EDGE_LEVELS, help="Pyramid levels (1 = full size only).")
+    parser.add_argument("--low", type=int, default=CANNY_LOW, help="Canny low threshold, also the full-size gradient kept from coarse levels.")
+    parser.add_argument("--high", type=int, default=CANNY_HIGH, help="Canny high / Sobel magnitude threshold.")
+    args = parser.parse_args(argv)
+
+    from cubist_core_logic import load_image
+
+    image_rgb, alpha, has_alpha = load_image(args.input)
+    edge_mask = compute_edge_mask(image_rgb, alpha if has_alpha else None, args.levels, args.method, args.low,
+                                  args.high)
+    if not cv2.imwrite(args.output, edge_mask):
+        raise IOError(f"Could not write edge mask: {args.output}")
+    print(f"Saved: {args.output} ({int((edge_mask == 0).sum())} edge pixels)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
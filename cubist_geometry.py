@@ -0,0 +1,122 @@
+"""
+cubist_geometry.py - Voronoi cells derived from an existing Delaunay triangulation
+
+The Voronoi diagram is the dual of the Delaunay triangulation: its vertices
+are the triangle circumcenters and the cell of a point is the ring of
+circumcenters of the triangles around it. Building it from the Delaunay
+result avoids a second Qhull run per frame. Unbounded hull cells are closed
+with far points along the outward edge normals and every cell leaving the
+image is clipped to the image rectangle.
+"""
+
+import numpy as np
+
+
+def circumcenters(points, simplices):
+    """Circumcenter of every triangle, vectorized over all simplices."""
+    pts = np.asarray(points, dtype=np.float64)
+    a = pts[simplices[:, 0]]
+    b = pts[simplices[:, 1]]
+    c = pts[simplices[:, 2]]
+    ab = b - a
+    ac = c - a
+    d = 2.0 * (ab[:, 0] * ac[:, 1] - ab[:, 1] * ac[:, 0])
+    # Degenerate (collinear) triangles have no finite circumcenter; Qhull
+    # does not emit them, but guard the division anyway
+    d = np.where(d == 0, np.finfo(np.float64).tiny, d)
+    ab2 = (ab ** 2).sum(axis=1)
+    ac2 = (ac ** 2).sum(axis=1)
+    ux = (ac[:, 1] * ab2 - ab[:, 1] * ac2) / d
+    uy = (ab[:, 0] * ac2 - ac[:, 0] * ab2) / d
+    return a + np.column_stack((ux, uy))
+
+
+def hull_rays(tri, centers, far):
+    """Far points closing the unbounded cells of hull vertices.
+
+    For every hull edge (neighbors == -1) the Voronoi edge between its two
+    end points is a ray from the triangle's circumcenter along the edge
+    normal pointing away from the opposite vertex. Returns (sites, far_points)
+    with one far point for each end point of each hull edge.
+    """
+    simplex_ids, opposite = np.nonzero(tri.neighbors == -1)
+    pts = tri.points
+    a = tri.simplices[simplex_ids, (opposite + 1) % 3]
+    b = tri.simplices[simplex_ids, (opposite + 2) % 3]
+    c = tri.simplices[simplex_ids, opposite]
+    edge = pts[b] - pts[a]
+    normal = np.column_stack((edge[:, 1], -edge[:, 0]))
+    normal /= np.linalg.norm(normal, axis=1, keepdims=True)
+    flip = np.einsum("ij,ij->i", pts[c] - pts[a], normal) > 0
+    normal[flip] *= -1
+    far_points = centers[simplex_ids] + normal * far
+    return np.concatenate((a, b)), np.concatenate((far_points, far_points))
+
+
+def clip_polygon_to_rect(polygon, x0, y0, x1, y1):
+    """Clip a convex polygon to an axis-aligned rectangle (Sutherland-Hodgman).
+
+    Each of the four half-plane passes is vectorized over the polygon edges.
+    """
+    poly = np.asarray(polygon, dtype=np.float64)
+    for axis, bound, keep_below in ((0, x0, False), (0, x1, True), (1, y0, False), (1, y1, True)):
+        if len(poly) == 0:
+            break
+        nxt = np.roll(poly, -1, axis=0)
+        side = poly[:, axis] - bound
+        side_next = nxt[:, axis] - bound
+        if keep_below:
+            inside, inside_next = side <= 0, side_next <= 0
+        else:
+            inside, inside_next = side >= 0, side_next >= 0
+        crossing = inside != inside_next
+        denom = np.where(crossing, side - side_next, 1.0)
+        t = side / denom
+        hits = poly + (nxt - poly) * t[:, None]
+        # For edge i emit its start vertex if inside, then the crossing point
+        candidates = np.stack((poly, hits), axis=1).reshape(-1, 2)
+        keep = np.column_stack((inside, crossing)).ravel()
+        poly = candidates[keep]
+    return poly
+
+
+def voronoi_cells(tri, width, height):
+    """Voronoi cell polygons for every input point of a Delaunay triangulation.
+
+    Returns a list indexed like tri.points of int32 (K, 2) vertex arrays in
+    angular order, clipped to the image rectangle. Points that are not a
+    vertex of any simplex (duplicates) get None.
+    """
+    pts = tri.points
+    num_points = len(pts)
+    centers = circumcenters(pts, tri.simplices)
+    far = 4.0 * (width + height)
+
+    sites = tri.simplices.ravel()
+    vertices = np.repeat(centers, 3, axis=0)
+    ray_sites, ray_points = hull_rays(tri, centers, far)
+    sites = np.concatenate((sites, ray_sites))
+    vertices = np.concatenate((vertices, ray_points))
+
+    offsets = vertices - pts[sites]
+    angles = np.arctan2(offsets[:, 1], offsets[:, 0])
+    order = np.lexsort((angles, sites))
+    sites = sites[order]
+    vertices = vertices[order]
+    splits = np.searchsorted(sites, np.arange(num_points + 1))
+
+    x1, y1 = width - 1, height - 1
+    out_of_bounds = (vertices[:, 0] < 0) | (vertices[:, 0] > x1) | (vertices[:, 1] < 0) | (vertices[:, 1] > y1)
+    needs_clip = np.bincount(sites[out_of_bounds], minlength=num_points) > 0
+
+    cells = [None] * num_points
+    for i in range(num_points):
+        ring = vertices[splits[i]:splits[i + 1]]
+        if len(ring) == 0:
+            continue
+        if needs_clip[i]:
+            ring = clip_polygon_to_rect(ring, 0, 0, x1, y1)
+            if len(ring) == 0:
+                continue
+        cells[i] = np.rint(ring).astype(np.int32)
+    return cells
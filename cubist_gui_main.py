@@ -1,12 +1,21 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox
+import base64
 import os
-from cubist_core_logic import run_cubist
+import queue
+import threading
+import cv2
+from cubist_core_logic import RenderCancelled, run_cubist
+from cubist_costmodel import CostModel, EtaTracker, format_seconds
+from cubist_edges import AUTO_MASK
+from cubist_preview import run_cubist_preview
+from cubist_trace import Tracer
 from datetime import datetime
 import traceback
 
 CONFIG_FILE = "last_config.txt"
 LOG_FILE = "run_log.txt"
+TRACE_FILE = os.path.join("logs", "trace.jsonl")
 
 def log_message(msg):
     with open(LOG_FILE, "a") as f:
@@ -23,22 +32,10 @@ def load_last_config():
                     k, v = line.strip().split("=", 1)
                     config[k.strip()] = v.strip()
 
-    
-
-    # Ensure GUI fields are correctly initialized
-    if "input_image" in config:
-        input_entry.insert(0, config["input_image"])
-    if "output_dir" in config:
-        output_entry.insert(0, config["output_dir"])
-    if "mask_path" in config:
-        mask_entry.insert(0, config["mask_path"])
-    if "total_points" in config:
-        points_entry.delete(0, tk.END)
-        points_entry.insert(0, config["total_points"])
-    if "clip_to_alpha" in config:
-        clip_var.set(config["clip_to_alpha"].lower() == "true")
-
+    # The widgets are created after this runs and read their initial values
+    # from the returned dict
     log_message("Last config loaded.")
+    return config
 
 
 def save_config(config):
@@ -46,6 +43,94 @@ def save_config(config):
         for k, v in config.items():
             f.write(f"{k}={v}\n")
 
+POLL_MS = 100
+PREVIEW_SIZE = 480
+PREVIEW_BUDGET_SECONDS = 3.0
+render_queue = queue.Queue()
+cancel_event = threading.Event()
+cost_model = CostModel.load()
+
+
+def render_worker(params):
+    """Runs on a background thread; reports back only through render_queue."""
+    eta = EtaTracker(params["estimate"]) if params["estimate"] else None
+    records = []
+
+    def progress(stage, index, count):
+        render_queue.put(("stage", stage, index, count, eta.remaining() if eta else None))
+
+    try:
+        tracer = Tracer(TRACE_FILE, hooks=[records.append], input=params["input_path"],
+                        total_points=params["total_points"])
+        if eta:
+            tracer.add_hook(eta.observe)
+        result_path = run_cubist(params["input_path"], params["output_dir"], mask_path=params["mask_path"] or None,
+                                 total_points=params["total_points"], clip_to_alpha=params["clip_to_alpha"],
+                                 progress=progress, cancel_event=cancel_event, tracer=tracer)
+        # Every finished render refines this machine's cost model
+        cost_model.add_records(records)
+        cost_model.save()
+        render_queue.put(("done", result_path))
+    except RenderCancelled:
+        render_queue.put(("cancelled",))
+    except Exception as e:
+        render_queue.put(("error", e, traceback.format_exc()))
+
+
+def preview_png(canvas):
+    """Base64 PNG of the canvas scaled to fit the preview pane (Tk reads PNG natively)."""
+    height, width = canvas.shape[:2]
+    scale = min(PREVIEW_SIZE / float(max(height, width)), 1.0)
+    small = cv2.resize(canvas, (max(1, int(width * scale)), max(1, int(height * scale))), interpolation=cv2.INTER_AREA)
+    ok, encoded = cv2.imencode(".png", cv2.cvtColor(small, cv2.COLOR_RGB2BGR))
+    return base64.b64encode(encoded.tobytes()).decode("ascii")
+
+
+def preview_worker(params):
+    """Background coarse-to-fine preview; each finished step is queued for display."""
+    def on_step(scale, count, canvas):
+        render_queue.put(("preview", preview_png(canvas), f"Preview: {count} points at {scale:.0%} scale"))
+
+    try:
+        run_cubist_preview(params["input_path"], mask_path=params["mask_path"] or None,
+                           total_points=params["total_points"], clip_to_alpha=params["clip_to_alpha"],
+                           time_budget=PREVIEW_BUDGET_SECONDS, on_step=on_step, cancel_event=cancel_event)
+        render_queue.put(("preview_done",))
+    except RenderCancelled:
+        render_queue.put(("cancelled",))
+    except Exception as e:
+        render_queue.put(("error", e, traceback.format_exc()))
+
+
+def read_params():
+    return {
+        "input_path": input_entry.get(),
+        "output_dir": output_entry.get(),
+        "mask_path": mask_entry.get(),
+        "total_points": int(points_entry.get()),
+        "clip_to_alpha": bool(clip_var.get()),
+    }
+
+
+def start_job(worker, params):
+    cancel_event.clear()
+    generate_button.config(state=tk.DISABLED)
+    preview_button.config(state=tk.DISABLED)
+    cancel_button.config(state=tk.NORMAL)
+    status_var.set("Starting...")
+    threading.Thread(target=worker, args=(params,), daemon=True).start()
+    root.after(POLL_MS, poll_render_queue)
+
+
+def run_preview():
+    try:
+        params = read_params()
+    except Exception as e:
+        messagebox.showerror("Error", f"An error occurred:\n{e}")
+        return
+    start_job(preview_worker, params)
+
+
 def run_process():
     try:
         input_path = input_entry.get()
@@ -59,19 +144,79 @@ def run_process():
             "output_dir": output_dir,
             "mask_path": mask_path,
             "total_points": str(total_points),
-            "clip_to_alpha": str(clip_to_alpha)
+            "clip_to_alpha": str(int(clip_to_alpha))
         }
 
         save_config(config)
         log_message(f"START: {config}")
-        result_path = run_cubist(input_path, output_dir, total_points, clip_to_alpha, mask_path)
-        log_message(f"SUCCESS: {result_path}")
-
-        if messagebox.askyesno("Success", f"Output saved to: {result_path}. View it?"):
-            os.startfile(result_path)
     except Exception as e:
         log_message(f"ERROR: {traceback.format_exc()}")
         messagebox.showerror("Error", f"An error occurred:\n{e}")
+        return
+
+    try:
+        estimate = cost_model.predict_file(input_path, total_points, inpaint=not clip_to_alpha)
+    except (OSError, ValueError):
+        estimate = None
+    params = {"input_path": input_path, "output_dir": output_dir, "mask_path": mask_path,
+              "total_points": total_points, "clip_to_alpha": clip_to_alpha, "estimate": estimate}
+    start_job(render_worker, params)
+    if estimate:
+        status_var.set(f"Starting... estimated {format_seconds(estimate['seconds'])}, "
+                       f"~{estimate['peak_memory_mb']:.0f} MB")
+
+
+def cancel_process():
+    cancel_event.set()
+    cancel_button.config(state=tk.DISABLED)
+    status_var.set("Cancelling after the current stage...")
+
+
+def finish_render():
+    generate_button.config(state=tk.NORMAL)
+    preview_button.config(state=tk.NORMAL)
+    cancel_button.config(state=tk.DISABLED)
+
+
+def poll_render_queue():
+    """Drain worker messages on the Tk thread; reschedules itself until the job ends."""
+    while True:
+        try:
+            message = render_queue.get_nowait()
+        except queue.Empty:
+            root.after(POLL_MS, poll_render_queue)
+            return
+        kind = message[0]
+        if kind == "stage":
+            _, stage, index, count, remaining = message
+            eta = f" ETA {format_seconds(remaining)}" if remaining is not None else ""
+            status_var.set(f"[{index + 1}/{count}] {stage.capitalize()}...{eta}")
+            continue
+        if kind == "preview":
+            _, png_data, text = message
+            preview_image = tk.PhotoImage(data=png_data)
+            preview_label.config(image=preview_image)
+            preview_label.image = preview_image  # Keep a reference or Tk drops the image
+            status_var.set(text)
+            continue
+        finish_render()
+        if kind == "preview_done":
+            log_message("PREVIEW DONE")
+        elif kind == "done":
+            result_path = message[1]
+            status_var.set(f"Saved: {result_path}")
+            log_message(f"SUCCESS: {result_path}")
+            if messagebox.askyesno("Success", f"Output saved to: {result_path}. View it?"):
+                os.startfile(result_path)
+        elif kind == "cancelled":
+            status_var.set("Cancelled.")
+            log_message("CANCELLED")
+        else:
+            _, error, details = message
+            status_var.set("Failed.")
+            log_message(f"ERROR: {details}")
+            messagebox.showerror("Error", f"An error occurred:\n{error}")
+        return
 
 def browse_file(entry):
     filename = filedialog.askopenfilename()
@@ -79,6 +224,10 @@ def browse_file(entry):
         entry.delete(0, tk.END)
         entry.insert(0, filename)
 
+def use_auto_mask(entry):
+    entry.delete(0, tk.END)
+    entry.insert(0, AUTO_MASK)
+
 def browse_dir(entry):
     dirname = filedialog.askdirectory()
     if dirname:
@@ -106,16 +255,27 @@ mask_entry = tk.Entry(root, width=50)
 mask_entry.insert(0, last.get("mask_path", ""))
 mask_entry.grid(row=2, column=1)
 tk.Button(root, text="Browse", command=lambda: browse_file(mask_entry)).grid(row=2, column=2)
+tk.Button(root, text="Auto", command=lambda: use_auto_mask(mask_entry)).grid(row=2, column=3)
 
 tk.Label(root, text="Total Points:").grid(row=3, column=0, sticky="e")
 points_entry = tk.Entry(root, width=10)
 points_entry.insert(0, last.get("total_points", "1000"))
 points_entry.grid(row=3, column=1, sticky="w")
 
-clip_var = tk.IntVar(value=int(last.get("clip_to_alpha", "1")))
+clip_var = tk.IntVar(value=int(last.get("clip_to_alpha", "1").lower() in ("1", "true")))
 tk.Checkbutton(root, text="Clip to Alpha/Mask", variable=clip_var).grid(row=4, column=1, sticky="w")
 
-tk.Button(root, text="Generate", command=run_process).grid(row=5, column=1)
+generate_button = tk.Button(root, text="Generate", command=run_process)
+generate_button.grid(row=5, column=1)
+cancel_button = tk.Button(root, text="Cancel", command=cancel_process, state=tk.DISABLED)
+cancel_button.grid(row=5, column=2)
+preview_button = tk.Button(root, text="Preview", command=run_preview)
+preview_button.grid(row=5, column=0)
+
+status_var = tk.StringVar(value="Ready.")
+tk.Label(root, textvariable=status_var, anchor="w").grid(row=6, column=0, columnspan=3, sticky="we")
+preview_label = tk.Label(root)
+preview_label.grid(row=7, column=0, columnspan=3)
 
 root.mainloop()
 
@@ -0,0 +1,232 @@
+"""
+cubist_lut.py - 3D LUT color grading of shape palettes
+
+Parses the LUT formats Photoshop's Export Color Lookup writes (.CUBE, .3DL,
+.CSP) into one representation: an (N, N, N, 3) float32 lattice indexed
+[r, g, b] with outputs in 0..1, plus a (256, 3) table mapping every 8-bit
+input channel value to its lattice coordinate (this absorbs .CUBE domains
+and .CSP pre-LUT shapers). Both arrays are kept in an in-process memo and,
+with an ArtifactCache, on disk keyed by the LUT file's content hash, so a
+LUT is parsed once.
+
+Since shapes are flat-colored, only their palette is graded (see
+cubist_renderer.transform_palette): a few thousand lookups instead of one
+per pixel. Interpolation is vectorized trilinear (8 lattice points) or
+tetrahedral (4 lattice points, what most graders use).
+
+Example:
+    grade = lut_transform("LUTs/Standing Woman Cubist LUT.CUBE")
+    canvas, _, _ = render_triangles(points, simplices, image_rgb, alpha, palette_transform=grade)
+"""
+
+import os
+
+import numpy as np
+
+LUT_EXTENSIONS = (".cube", ".3dl", ".csp")
+LUT_METHODS = ("tetrahedral", "trilinear")
+
+_memo = {}
+
+
+def _data_rows(lines, columns=3):
+    """Float array of the numeric rows in lines, shape (rows, columns)."""
+    values = np.array(" ".join(lines).split(), dtype=np.float32)
+    if values.size % columns:
+        raise ValueError("LUT data rows are incomplete.")
+    return values.reshape(-1, columns)
+
+
+def _lattice(rows, size, red_fastest):
+    """(size, size, size, 3) lattice indexed [r, g, b] from rows in file order."""
+    if len(rows) != size ** 3:
+        raise ValueError(f"LUT holds {len(rows)} entries, expected {size ** 3} for size {size}.")
+    lattice = rows.reshape(size, size, size, 3)
+    if red_fastest:
+        lattice = lattice.transpose(2, 1, 0, 3)
+    return np.ascontiguousarray(lattice, dtype=np.float32)
+
+
+def _coordinates(size, inputs=None, outputs=None):
+    """(256, 3) lattice coordinates of the 8-bit input values.
+
+    inputs/outputs are per-channel shaper breakpoints (input value ->
+    normalized 0..1 position), identity by default.
+    """
+    values = np.arange(256, dtype=np.float64) / 255.0
+    coords = np.empty((256, 3), dtype=np.float32)
+    for c in range(3):
+        position = values if inputs is None else np.interp(values, inputs[c], outputs[c])
+        coords[:, c] = np.clip(position, 0.0, 1.0) * (size - 1)
+    return coords
+
+
+def parse_cube(text):
+    """(lattice, coords) of an Adobe/Resolve .cube file (red varies fastest)."""
+    size = None
+    domain_min, domain_max = [0.0] * 3, [1.0] * 3
+    data = []
+    for line in text.splitlines():
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+        keyword = line.split()[0].upper()
+        if keyword == "LUT_3D_SIZE":
+            size = int(line.split()[1])
+        elif keyword == "LUT_1D_SIZE":
+            raise ValueError("1D .cube LUTs are not supported, export a 3D LUT.")
+        elif keyword == "DOMAIN_MIN":
+            domain_min = [float(v) for v in line.split()[1:4]]
+        elif keyword == "DOMAIN_MAX":
+            domain_max = [float(v) for v in line.split()[1:4]]
+        elif keyword[0].isalpha():
+            continue  # TITLE, LUT_3D_INPUT_RANGE, ...
+        else:
+            data.append(line)
+    if size is None:
+        raise ValueError("Missing LUT_3D_SIZE in .cube file.")
+    inputs = [[lo, hi] for lo, hi in zip(domain_min, domain_max)]
+    return _lattice(_data_rows(data), size, True), _coordinates(size, inputs, [[0.0, 1.0]] * 3)
+
+
+def _bit_depth(max_value):
+    """Smallest of 10, 12, 14 or 16 bits that holds max_value."""
+    return next((b for b in (10, 12, 14, 16) if max_value <= 2 ** b - 1), 16)
+
+
+def parse_3dl(text):
+    """(lattice, coords) of an Autodesk/Photoshop .3dl file (blue varies fastest).
+
+    The first numeric line is the input mesh (e.g. 0 33 ... 1023). Output
+    values are integers; their bit depth is read from a Lustre
+    "Mesh <mesh bits> <output bits>" header. Without one it is guessed as
+    the smallest of 10, 12, 14 or 16 bits holding both the largest output
+    and the largest mesh value, since outputs are never stored at a lower
+    depth than the mesh.
+    """
+    lines = [line.strip() for line in text.splitlines()]
+    output_bits = None
+    for line in lines:
+        fields = line.split()
+        if len(fields) == 3 and fields[0].lower() == "mesh":
+            output_bits = int(fields[2])
+    lines = [line for line in lines if line and not line.startswith("#")
+             and not line.lower().startswith("mesh") and not line.startswith("3DMESH")]
+    if not lines:
+        raise ValueError("Empty .3dl file.")
+    mesh = lines[0].split()
+    if len(mesh) == 3:
+        raise ValueError("The .3dl file has no input mesh line.")
+    size = len(mesh)
+    rows = _data_rows(lines[1:])
+    if output_bits is None:
+        output_bits = _bit_depth(max(float(rows.max()), max(float(v) for v in mesh)))
+    return _lattice(rows / (2 ** output_bits - 1), size, False), _coordinates(size)
+
+
+def parse_csp(text):
+    """(lattice, coords) of a Rising Sun .csp 3D file, pre-LUT shapers included."""
+    lines = [line.strip() for line in text.splitlines()]
+    lines = [line for line in lines if line]
+    if not lines or lines[0] != "CSPLUTV100":
+        raise ValueError("Not a CSP LUT (missing CSPLUTV100 header).")
+    if lines[1].upper() != "3D":
+        raise ValueError("Only 3D CSP LUTs are supported.")
+    i = 2
+    if lines[i].upper() == "BEGIN METADATA":
+        while lines[i].upper() != "END METADATA":
+            i += 1
+        i += 1
+    inputs, outputs = [], []
+    for _ in range(3):
+        count = int(lines[i])
+        inputs.append([float(v) for v in lines[i + 1].split()][:count])
+        outputs.append([float(v) for v in lines[i + 2].split()][:count])
+        i += 3
+    sizes = [int(v) for v in lines[i].split()]
+    if len(set(sizes)) != 1:
+        raise ValueError(f"Only cubic CSP lattices are supported, got {sizes}.")
+    return _lattice(_data_rows(lines[i + 1:]), sizes[0], True), _coordinates(sizes[0], inputs, outputs)
+
+
+PARSERS = {".cube": parse_cube, ".3dl": parse_3dl, ".csp": parse_csp}
+
+
+def parse_lut(path):
+    """(lattice, coords) of a LUT file, format by extension."""
+    suffix = os.path.splitext(str(path))[1].lower()
+    if suffix not in PARSERS:
+        raise ValueError(f"Unsupported LUT format '{suffix}', expected one of {LUT_EXTENSIONS}.")
+    with open(path, encoding="utf-8", errors="replace") as f:
+        text = f.read()
+    if not text.strip():
+        raise ValueError(f"LUT file '{path}' is empty.")
+    return PARSERS[suffix](text)
+
+
+def load_lut(path, cache=None):
+    """Parsed (lattice, coords) of a LUT, memoized per process and in cache."""
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if memo_key not in _memo:
+        if cache is None:
+            _memo[memo_key] = parse_lut(path)
+        else:
+            _memo[memo_key] = tuple(np.asarray(array) for array in cache.get_or_compute(
+                cache.file_hash(path), ("lut_lattice", "lut_coords"), lambda: parse_lut(path)))
+    return _memo[memo_key]
+
+
+def apply_lut(colors, lattice, coords, method="tetrahedral"):
+    """Grade (K, 3) uint8 colors through a lattice; returns (K, 3) uint8."""
+    colors = np.asarray(colors, dtype=np.uint8).reshape(-1, 3)
+    size = lattice.shape[0]
+    position = coords[colors, np.arange(3)]
+    base = np.minimum(position.astype(np.int64), size - 2)
+    frac = position - base
+    r, g, b = base[:, 0], base[:, 1], base[:, 2]
+
+    def corner(dr, dg, db):
+        return lattice[r + dr, g + dg, b + db]
+
+    if method == "trilinear":
+        fr, fg, fb = frac[:, :1], frac[:, 1:2], frac[:, 2:]
+        c00 = corner(0, 0, 0) * (1 - fr) + corner(1, 0, 0) * fr
+        c10 = corner(0, 1, 0) * (1 - fr) + corner(1, 1, 0) * fr
+        c01 = corner(0, 0, 1) * (1 - fr) + corner(1, 0, 1) * fr
+        c11 = corner(0, 1, 1) * (1 - fr) + corner(1, 1, 1) * fr
+        out = (c00 * (1 - fg) + c10 * fg) * (1 - fb) + (c01 * (1 - fg) + c11 * fg) * fb
+    elif method == "tetrahedral":
+        # Walk from the base corner to the far corner along the axes in
+        # decreasing fraction order; the 4 visited corners span the tetrahedron
+        order = np.argsort(-frac, axis=1, kind="stable")
+        f = np.take_along_axis(frac, order, axis=1)
+        rows = np.arange(len(colors))
+        step1 = np.zeros_like(base)
+        step1[rows, order[:, 0]] = 1
+        step2 = step1.copy()
+        step2[rows, order[:, 1]] = 1
+        v1 = lattice[r + step1[:, 0], g + step1[:, 1], b + step1[:, 2]]
+        v2 = lattice[r + step2[:, 0], g + step2[:, 1], b + step2[:, 2]]
+        out = (corner(0, 0, 0) * (1 - f[:, :1]) + v1 * (f[:, :1] - f[:, 1:2]) + v2 * (f[:, 1:2] - f[:, 2:])
+               + corner(1, 1, 1) * f[:, 2:])
+    else:
+        raise ValueError(f"Unknown LUT interpolation '{method}', expected one of {LUT_METHODS}.")
+    return np.clip(np.rint(out * 255.0), 0, 255).astype(np.uint8)
+
+
+def lut_transform(path, method="tetrahedral", cache=None):
+    """Palette transform grading colors through the LUT at path.
+
+    Called as transform(colors, counts) like every palette transform;
+    counts are not needed for grading.
+    """
+    if method not in LUT_METHODS:
+        raise ValueError(f"Unknown LUT interpolation '{method}', expected one of {LUT_METHODS}.")
+    lattice, coords = load_lut(path, cache)
+
+    def transform(colors, counts=None):
+        return apply_lut(colors, lattice, coords, method)
+
+    return transform
+
@@ -0,0 +1,83 @@
+"""
+cubist_parallel.py - Process-pool task runner over shared-memory arrays
+
+Large read-only inputs (the decoded image, the alpha plane, the point set)
+are copied once into multiprocessing.shared_memory blocks. Workers attach to
+them by name in the pool initializer, so tasks only pickle their small
+arguments. Tasks are submitted most expensive first for load balance and
+results come back in task order.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+_worker_blocks = []
+_worker_arrays = {}
+
+
+def share_arrays(arrays):
+    """Copy arrays into new shared-memory blocks; returns (blocks, specs).
+
+    specs maps each name to (block_name, shape, dtype) for attach_arrays.
+    The caller owns the blocks and must close and unlink them.
+    """
+    blocks = []
+    specs = {}
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        blocks.append(block)
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+        specs[name] = (block.name, array.shape, array.dtype.str)
+    return blocks, specs
+
+
+def release_blocks(blocks):
+    for block in blocks:
+        block.close()
+        block.unlink()
+
+
+def attach_arrays(specs):
+    """Attach to shared blocks created by share_arrays; returns (blocks, arrays)."""
+    blocks = []
+    arrays = {}
+    for name, (block_name, shape, dtype) in specs.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)
+        array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+        array.flags.writeable = False
+        arrays[name] = array
+    return blocks, arrays
+
+
+def _init_worker(specs):
+    blocks, arrays = attach_arrays(specs)
+    _worker_blocks.extend(blocks)
+    _worker_arrays.update(arrays)
+
+
+def _run_task(func, task, options):
+    return func(_worker_arrays, task, **options)
+
+
+def map_shared(func, tasks, arrays, workers=None, costs=None, **options):
+    """Run func(arrays, task, **options) for every task on a process pool.
+
+    func must be a module-level function. arrays (name -> ndarray) are
+    shared once instead of pickled per task. With costs given, tasks are
+    submitted in descending cost order. Returns the results in task order.
+    """
+    tasks = list(tasks)
+    workers = min(workers or os.cpu_count() or 1, max(len(tasks), 1))
+    order = range(len(tasks)) if costs is None else np.argsort(-np.asarray(costs), kind="stable")
+    blocks, specs = share_arrays(arrays)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(specs,)) as pool:
+            futures = {i: pool.submit(_run_task, func, tasks[i], options) for i in order}
+            return [futures[i].result() for i in range(len(tasks))]
+    finally:
+        release_blocks(blocks)
@@ -0,0 +1,116 @@
+"""
+cubist_pointstore.py - Binary memory-mapped point sets
+
+Replaces the point_data.json text format. A point file is a fixed 128-byte
+header followed by the points as raw little-endian int32 (x, y) rows:
+
+    magic     8s   b"CUBPTS\\0\\0"
+    version   u4   POINTSTORE_VERSION
+    flags     u4   bit 0: seed is set
+    count     u8   number of points
+    seed      i8
+    edge      f8   edge fraction used when sampling
+    strategy  16s  sampling strategy name (ASCII, NUL padded)
+    sha256    32s  digest of the source image file
+    (zero padding up to 128 bytes)
+
+The rows are stored interleaved so that any prefix fixed_points[:N] is one
+contiguous byte range; files are opened with np.memmap and a prefix load
+only touches the pages it needs. Legacy JSON files still load.
+"""
+
+import json
+import struct
+import warnings
+from pathlib import Path
+
+import numpy as np
+
+POINTSTORE_MAGIC = b"CUBPTS\0\0"
+POINTSTORE_VERSION = 1
+HEADER_SIZE = 128
+HEADER_FORMAT = "<8sIIQqd16s32s"
+FLAG_HAS_SEED = 1
+
+
+def save_points(path, points, seed=None, edge_fraction=0.0, strategy="", image_hash=None):
+    """Write points as a binary point file."""
+    points = np.ascontiguousarray(points, dtype="<i4").reshape(-1, 2)
+    header = struct.pack(
+        HEADER_FORMAT, POINTSTORE_MAGIC, POINTSTORE_VERSION, FLAG_HAS_SEED if seed is not None else 0,
+        len(points), seed if seed is not None else 0, float(edge_fraction), strategy.encode("ascii")[:16],
+        bytes.fromhex(image_hash) if image_hash else b"")
+    with open(path, "wb") as f:
+        f.write(header.ljust(HEADER_SIZE, b"\0"))
+        f.write(points.tobytes())
+
+
+def read_header(path):
+    """Parse and validate the header of a point file; returns a metadata dict."""
+    with open(path, "rb") as f:
+        raw = f.read(HEADER_SIZE)
+    if len(raw) < HEADER_SIZE or raw[:8] != POINTSTORE_MAGIC:
+        raise ValueError(f"'{path}' is not a cubist point file.")
+    magic, version, flags, count, seed, edge_fraction, strategy, digest = struct.unpack_from(HEADER_FORMAT, raw)
+    if version != POINTSTORE_VERSION:
+        raise ValueError(f"Unsupported point file version {version} in '{path}'.")
+    return {
+        "version": version,
+        "count": count,
+        "seed": seed if flags & FLAG_HAS_SEED else None,
+        "edge_fraction": edge_fraction,
+        "strategy": strategy.rstrip(b"\0").decode("ascii"),
+        "image_hash": digest.hex() if any(digest) else None,
+    }
+
+
+def check_image_hash(path, stored_hash, image_hash, require_hash=False):
+    """Refuse a point file made for another image; warn (or with require_hash refuse) if it records none."""
+    if not image_hash:
+        return
+    if stored_hash is None:
+        message = f"Point file '{path}' records no source image and cannot be checked against this one."
+        if require_hash:
+            raise ValueError(message)
+        warnings.warn(message, stacklevel=3)
+    elif stored_hash != image_hash:
+        raise ValueError(f"Point file '{path}' was generated for a different image.")
+
+
+def open_points(path, image_hash=None, require_hash=False):
+    """Memory-map a point file; returns (points, metadata).
+
+    points is a read-only (count, 2) int32 memmap. If image_hash is given
+    and the file records a different source image, ValueError is raised;
+    a file recording no image (e.g. from import_json_points without
+    image_hash) raises with require_hash and gives a UserWarning otherwise.
+    """
+    meta = read_header(path)
+    check_image_hash(path, meta["image_hash"], image_hash, require_hash)
+    if meta["count"] == 0:
+        return np.empty((0, 2), dtype=np.int32), meta
+    points = np.memmap(path, dtype="<i4", mode="r", offset=HEADER_SIZE, shape=(meta["count"], 2))
+    return points, meta
+
+
+def load_points(path, count=None, image_hash=None, require_hash=False):
+    """Load the first count points (all by default) as an int32 array.
+
+    Binary point files are memory-mapped so only the requested prefix is
+    read. Legacy point_data.json files are parsed and record no image, so
+    with image_hash they are treated like hashless files (see open_points).
+    """
+    if Path(path).suffix.lower() == ".json":
+        check_image_hash(path, None, image_hash, require_hash)
+        with open(path, "r") as f:
+            points = np.asarray(json.load(f)["points"], dtype=np.float64).reshape(-1, 2)
+        return points[:count].astype(np.int32)
+    points, _ = open_points(path, image_hash, require_hash)
+    return np.array(points[:count], dtype=np.int32)
+
+
+def import_json_points(json_path, output_path, image_hash=None):
+    """Convert a legacy point_data.json file into a binary point file."""
+    points = load_points(json_path)
+    save_points(output_path, points, image_hash=image_hash)
+    return output_path
@@ -0,0 +1,152 @@
+"""
+cubist_posterize.py - Palette quantization of shape colors with mini-batch k-means
+
+The archived posterize_test.py ran cv2.kmeans (K=8, 10 attempts) over every
+pixel of the image. Flat-shaded output only has one color per shape, so the
+clustering here runs on the per-shape mean colors instead, each weighted by
+the shape's pixel area, and the shapes are painted from the K cluster
+centers. Identical colors are merged first, centers are seeded with
+weighted k-means++ on a sample and refined by mini-batch k-means (batches
+drawn in proportion to area), followed by one exact area-weighted Lloyd
+step so every palette color is the mean of the pixels it replaces.
+
+A Posterizer is a palette transform (see cubist_renderer.transform_palette).
+It fits its palette on the first colors it sees and maps later calls to the
+same palette, so a second pass (e.g. Voronoi shapes after triangles) or a
+pre-fitted progression keeps one consistent set of colors.
+"""
+
+import numpy as np
+
+MIN_COLORS = 2
+MAX_COLORS = 256
+BATCH_SIZE = 1024
+MAX_BATCHES = 100
+# Stop once no center moved more than this (in 0..255 color units) for a batch
+TOLERANCE = 0.05
+
+
+def nearest_center(colors, centers, chunk=1 << 16):
+    """Index of the nearest center (squared RGB distance) for every color."""
+    colors = np.asarray(colors, dtype=np.float64)
+    centers = np.asarray(centers, dtype=np.float64)
+    center_sq = (centers * centers).sum(axis=1)
+    nearest = np.empty(len(colors), dtype=np.int64)
+    for start in range(0, len(colors), chunk):
+        block = colors[start:start + chunk]
+        distance = center_sq - 2.0 * block @ centers.T
+        nearest[start:start + chunk] = np.argmin(distance, axis=1)
+    return nearest
+
+
+def weighted_sample(cumulative, size, rng):
+    """Indices drawn with replacement in proportion to the weights behind cumulative."""
+    return np.searchsorted(cumulative, rng.random(size) * cumulative[-1], side="right")
+
+
+def kmeans_plus_plus(colors, weights, k, rng):
+    """k-means++ seeding where a color's pick probability also scales with its weight."""
+    centers = np.empty((k, 3), dtype=np.float64)
+    centers[0] = colors[weighted_sample(np.cumsum(weights), 1, rng)[0]]
+    closest = ((colors - centers[0]) ** 2).sum(axis=1)
+    for i in range(1, k):
+        score = np.cumsum(closest * weights)
+        if score[-1] <= 0:
+            centers[i:] = centers[0]
+            break
+        centers[i] = colors[weighted_sample(score, 1, rng)[0]]
+        np.minimum(closest, ((colors - centers[i]) ** 2).sum(axis=1), out=closest)
+    return centers
+
+
+def minibatch_kmeans(colors, weights, k, seed=None, batch_size=BATCH_SIZE, max_batches=MAX_BATCHES,
+                     tolerance=TOLERANCE):
+    """Area-weighted mini-batch k-means; returns (centers, cluster weights).
+
+    colors is (n, 3) float, weights (n,) non-negative. Clusters that end up
+    without weight are dropped, so fewer than k centers may come back.
+    """
+    rng = np.random.default_rng(seed)
+    cumulative = np.cumsum(weights)
+    init_size = min(len(colors), max(3 * batch_size, 10 * k))
+    init = np.unique(weighted_sample(cumulative, init_size, rng))
+    centers = kmeans_plus_plus(colors[init], weights[init], k, rng)
+
+    # Per-center learning rate 1 / (samples seen so far), as in Sculley's mini-batch k-means
+    seen = np.zeros(k, dtype=np.float64)
+    for _ in range(max_batches):
+        batch = colors[weighted_sample(cumulative, batch_size, rng)]
+        assigned = nearest_center(batch, centers)
+        counts = np.bincount(assigned, minlength=k).astype(np.float64)
+        sums = np.empty((k, 3), dtype=np.float64)
+        for c in range(3):
+            sums[:, c] = np.bincount(assigned, weights=batch[:, c], minlength=k)
+        seen += counts
+        hit = counts > 0
+        step = (sums[hit] - counts[hit, None] * centers[hit]) / seen[hit, None]
+        centers[hit] += step
+        if np.abs(step).max() < tolerance:
+            break
+
+    # One exact weighted Lloyd step over all colors
+    assigned = nearest_center(colors, centers)
+    cluster_weights = np.bincount(assigned, weights=weights, minlength=k)
+    for c in range(3):
+        sums = np.bincount(assigned, weights=colors[:, c] * weights, minlength=k)
+        filled = cluster_weights > 0
+        centers[filled, c] = sums[filled] / cluster_weights[filled]
+    keep = cluster_weights > 0
+    return centers[keep], cluster_weights[keep]
+
+
+def quantize_palette(colors, counts=None, k=8, seed=None, batch_size=BATCH_SIZE, max_batches=MAX_BATCHES):
+    """(K', 3) uint8 palette (K' <= k) for shape colors weighted by pixel counts.
+
+    Colors are merged by value first; when no more than k distinct colors
+    remain they are the palette. Weights of zero (shapes that show no
+    pixels) do not pull the centers.
+    """
+    if not MIN_COLORS <= k <= MAX_COLORS:
+        raise ValueError(f"Posterize colors must be between {MIN_COLORS} and {MAX_COLORS}, got {k}.")
+    colors = np.asarray(colors, dtype=np.uint8).reshape(-1, 3)
+    weights = np.ones(len(colors)) if counts is None else np.asarray(counts, dtype=np.float64)
+    if weights.sum() <= 0:
+        weights = np.ones(len(colors))
+    packed = (colors[:, 0].astype(np.int64) << 16) | (colors[:, 1].astype(np.int64) << 8) | colors[:, 2]
+    unique, inverse = np.unique(packed, return_inverse=True)
+    unique_weights = np.bincount(inverse, weights=weights, minlength=len(unique))
+    shown = unique_weights > 0
+    unique, unique_weights = unique[shown], unique_weights[shown]
+    distinct = np.column_stack(((unique >> 16) & 255, (unique >> 8) & 255, unique & 255))
+    if len(distinct) <= k:
+        return distinct.astype(np.uint8)
+    centers, _ = minibatch_kmeans(distinct.astype(np.float64), unique_weights, k, seed, batch_size, max_batches)
+    return np.clip(np.rint(centers), 0, 255).astype(np.uint8)
+
+
+class Posterizer:
+    """Palette transform mapping shape colors onto k area-weighted k-means colors.
+
+    The palette is fitted on the first call (or by fit, or passed in as
+    palette) and reused for every later call.
+    """
+
+    def __init__(self, k=8, seed=None, palette=None, batch_size=BATCH_SIZE, max_batches=MAX_BATCHES):
+        if not MIN_COLORS <= k <= MAX_COLORS:
+            raise ValueError(f"Posterize colors must be between {MIN_COLORS} and {MAX_COLORS}, got {k}.")
+        self.k = k
+        self.seed = seed
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.palette = None if palette is None else np.asarray(palette, dtype=np.uint8)
+
+    def fit(self, colors, counts=None):
+        self.palette = quantize_palette(colors, counts, self.k, self.seed, self.batch_size, self.max_batches)
+        return self.palette
+
+    def __call__(self, colors, counts=None):
+        if self.palette is None:
+            self.fit(colors, counts)
+        if len(colors) == 0:
+            return np.asarray(colors, dtype=np.uint8)
+        return self.palette[nearest_center(colors, self.palette)]
@@ -0,0 +1,120 @@
+"""
+cubist_preview.py - Progressive coarse-to-fine preview renders
+
+A preview renders the same point set several times, starting from a few
+points on a heavily downscaled image and increasing both points and
+resolution until the full render. Every finished step is handed to the
+caller immediately, so once a 12 MP input is decoded the first image arrives
+in well under a second. With a time budget, a step is only started if its estimated cost
+(scaled from the previous step by pixel count) still fits, and the best
+finished canvas is returned when time runs out.
+"""
+
+import time
+
+import cv2
+import numpy as np
+
+from cubist_cache import ArtifactCache
+from cubist_core_logic import (RenderCancelled, add_corners, load_image, load_palette_transform, make_posterizer,
+                               prepare_points, render_points, resolve_mask_path)
+from cubist_renderer import repair_voids, void_mask
+
+# (image scale, fraction of the points) per step, coarse to fine
+PREVIEW_STEPS = ((0.125, 0.0625), (0.25, 0.25), (0.5, 0.5), (1.0, 1.0))
+
+
+def scaled_inputs(image_rgb, alpha, scale):
+    """Image and alpha resized by scale (area averaging for color)."""
+    if scale >= 1:
+        return image_rgb, alpha
+    height, width = image_rgb.shape[:2]
+    size = (max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+    return (cv2.resize(image_rgb, size, interpolation=cv2.INTER_AREA),
+            cv2.resize(alpha, size, interpolation=cv2.INTER_NEAREST))
+
+
+def scaled_points(points, scale, alpha):
+    """Full-resolution points mapped to a scaled image, keeping opaque ones."""
+    height, width = alpha.shape[:2]
+    pts = np.asarray(points, dtype=np.float64)
+    xs = np.clip((pts[:, 0] * scale).astype(np.int64), 0, width - 1)
+    ys = np.clip((pts[:, 1] * scale).astype(np.int64), 0, height - 1)
+    keep = alpha[ys, xs] > 0
+    return np.column_stack((xs[keep], ys[keep]))
+
+
+def render_step(image_rgb, alpha, points, clip_to_alpha=True, use_mixed_geometry=False, palette_transform=None,
+                color_stat="mean"):
+    """One complete render (fill and inpaint) of points on the given image."""
+    height, width = image_rgb.shape[:2]
+    points = add_corners(points, width, height)
+    canvas, coverage, _ = render_points(points, image_rgb, alpha, clip_to_alpha, use_mixed_geometry, palette_transform,
+                                        color_stat)
+    voids = void_mask(coverage, alpha)
+    return canvas if voids is None else repair_voids(canvas, image_rgb, alpha, voids=voids)
+
+
+def progressive_render(image_rgb, alpha, points, clip_to_alpha=True, use_mixed_geometry=False, time_budget=None,
+                       steps=PREVIEW_STEPS, cancel_event=None, palette_transform=None, color_stat="mean",
+                       start=None):
+    """Yield (scale, num_points, canvas) for each step, coarse to fine.
+
+    The first step always runs. Later steps are skipped, and the generator
+    stops, when the estimated finish time exceeds time_budget seconds from
+    start (a time.perf_counter() value, default now), or when cancel_event
+    is set. Steps take prefixes of the points in one fixed shuffled order,
+    so coarse steps get an even mix of the sampler's edge and fill points
+    and every step's points include the previous step's.
+    """
+    start = time.perf_counter() if start is None else start
+    points = np.asarray(points)[np.random.default_rng(0).permutation(len(points))]
+    full_pixels = image_rgb.shape[0] * image_rgb.shape[1]
+    last_seconds = last_pixels = None
+    for scale, fraction in steps:
+        if cancel_event is not None and cancel_event.is_set():
+            return
+        pixels = full_pixels * min(scale, 1.0) ** 2
+        if time_budget is not None and last_seconds is not None:
+            estimate = last_seconds * pixels / last_pixels
+            if time.perf_counter() - start + estimate > time_budget:
+                return
+        step_start = time.perf_counter()
+        step_rgb, step_alpha = scaled_inputs(image_rgb, alpha, scale)
+        count = max(1, int(len(points) * fraction))
+        step_points = scaled_points(points[:count], min(scale, 1.0), step_alpha)
+        canvas = render_step(step_rgb, step_alpha, step_points, clip_to_alpha, use_mixed_geometry,
+                             palette_transform, color_stat)
+        last_seconds, last_pixels = time.perf_counter() - step_start, pixels
+        yield scale, count, canvas
+
+
+def run_cubist_preview(input_path, mask_path=None, total_points=1000, clip_to_alpha=True, time_budget=None,
+                       on_step=None, use_mixed_geometry=False, seed=None, sampling="edge_biased", cancel_event=None,
+                       cache_dir=None, lut_path=None, lut_method="tetrahedral", posterize=None, color_stat="mean"):
+    """Progressively render a preview; returns the finest finished step.
+
+    on_step(scale, num_points, canvas) is called after every step. Returns
+    (scale, num_points, canvas) of the last finished step; the canvas is at
+    the step's resolution. Raises RenderCancelled if cancelled before any
+    step finished. With cache_dir, repeated previews of the same input skip
+    decoding, which dominates the time to the first step. time_budget
+    counts from the call, decoding and sampling included. lut_path,
+    posterize and color_stat work as in run_cubist; the posterized palette
+    is fitted on the first step and kept for the finer ones.
+    """
+    start = time.perf_counter()
+    cache = ArtifactCache(cache_dir) if cache_dir else None
+    image_rgb, alpha, _ = load_image(input_path, cache)
+    mask_path = resolve_mask_path(mask_path)
+    points = prepare_points(input_path, alpha, image_rgb, total_points, mask_path, seed, sampling, cache=cache)
+    palette_transform = load_palette_transform(lut_path, lut_method, cache, make_posterizer(posterize, seed))
+    best = None
+    for best in progressive_render(image_rgb, alpha, points, clip_to_alpha, use_mixed_geometry, time_budget,
+                                   cancel_event=cancel_event, palette_transform=palette_transform,
+                                   color_stat=color_stat, start=start):
+        if on_step is not None:
+            on_step(*best)
+    if best is None:
+        raise RenderCancelled("Preview cancelled before the first step.")
+    return best
@@ -0,0 +1,235 @@
+"""
+cubist_progression.py - Incremental rendering of point-count progressions
+
+Progression runs render prefixes fixed_points[:N] of one point list with N
+growing frame by frame. Instead of a fresh Delaunay and a full re-render per
+frame, one incremental triangulation is extended with add_points and only
+the simplices created by each frame's new points are recolored and painted;
+the previous frame's canvas is reused everywhere else.
+"""
+
+import cv2
+import numpy as np
+from scipy.spatial import Delaunay
+
+from cubist_renderer import triangle_visibility
+
+
+def simplex_keys(simplices, num_points):
+    """Order-independent int64 key for every simplex (its sorted vertex ids)."""
+    s = np.sort(simplices.astype(np.int64), axis=1)
+    return (s[:, 0] * num_points + s[:, 1]) * num_points + s[:, 2]
+
+
+def frame_points(fixed_points, count, alpha):
+    """Corners followed by the first count points that land on opaque pixels.
+
+    The corners come first so that every frame's point array is a prefix of
+    the next one, which is what the incremental triangulation relies on.
+    """
+    height, width = alpha.shape[:2]
+    pts = np.asarray(fixed_points[:count])
+    xs = pts[:, 0].astype(np.int64)
+    ys = pts[:, 1].astype(np.int64)
+    keep = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+    keep[keep] = alpha[ys[keep], xs[keep]] > 0
+    corners = np.array([[0, 0], [width - 1, 0], [width - 1, height - 1], [0, height - 1]])
+    return np.vstack([corners, pts[keep]])
+
+
+def row_prefix_sums(image_rgb, mask):
+    """Row-wise prefix sums of the masked RGB channels and the mask itself.
+
+    Returns a (H, W + 1, 4) uint32 table where table[y, x] holds the sums of
+    (R, G, B, count) over columns [0, x) of row y. A row of 4032 pixels sums
+    to at most ~1M, well inside uint32.
+    """
+    height, width = mask.shape
+    table = np.zeros((height, width + 1, 4), dtype=np.uint32)
+    weight = mask.astype(np.uint8)
+    for c in range(3):
+        np.cumsum(image_rgb[:, :, c] * weight, axis=1, dtype=np.uint32, out=table[:, 1:, c])
+    np.cumsum(weight, axis=1, dtype=np.uint32, out=table[:, 1:, 3])
+    return table
+
+
+def color_prefix_sums(image_rgb, alpha, clip_to_alpha=True):
+    """row_prefix_sums over the pixels triangle colors are taken from."""
+    return row_prefix_sums(image_rgb, alpha > 0 if clip_to_alpha else np.ones(alpha.shape, dtype=bool))
+
+
+def triangle_spans(tri_pts, height, width):
+    """Integer pixel spans of every triangle, one (row, x_left, x_right) per row.
+
+    Returns (owner, rows, xl, xr) with owner the triangle index of each span;
+    spans are inclusive and clipped to the image, empty ones have xl > xr.
+    """
+    tri_pts = np.asarray(tri_pts, dtype=np.float64)
+    ys = tri_pts[:, :, 1]
+    y0 = np.clip(np.ceil(ys.min(axis=1)), 0, height - 1).astype(np.int64)
+    y1 = np.clip(np.floor(ys.max(axis=1)), 0, height - 1).astype(np.int64)
+    counts = np.maximum(y1 - y0 + 1, 0)
+    owner = np.repeat(np.arange(len(tri_pts)), counts)
+    rows = np.repeat(y0, counts) + (np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts))
+    y = rows.astype(np.float64)
+
+    x_lo = np.full(len(rows), np.inf)
+    x_hi = np.full(len(rows), -np.inf)
+    for e in range(3):
+        a = tri_pts[owner, e]
+        b = tri_pts[owner, (e + 1) % 3]
+        lo_y = np.minimum(a[:, 1], b[:, 1])
+        hi_y = np.maximum(a[:, 1], b[:, 1])
+        on_edge = (y >= lo_y) & (y <= hi_y)
+        flat = a[:, 1] == b[:, 1]
+        dy = np.where(flat, 1.0, b[:, 1] - a[:, 1])
+        x = a[:, 0] + (y - a[:, 1]) * (b[:, 0] - a[:, 0]) / dy
+        edge_lo = np.where(flat, np.minimum(a[:, 0], b[:, 0]), x)
+        edge_hi = np.where(flat, np.maximum(a[:, 0], b[:, 0]), x)
+        x_lo = np.where(on_edge, np.minimum(x_lo, edge_lo), x_lo)
+        x_hi = np.where(on_edge, np.maximum(x_hi, edge_hi), x_hi)
+
+    xl = np.clip(np.ceil(x_lo - 1e-9), 0, width).astype(np.int64)
+    xr = np.clip(np.floor(x_hi + 1e-9), -1, width - 1).astype(np.int64)
+    return owner, rows, xl, xr
+
+
+class ProgressionRenderer:
+    """Keeps one incremental triangulation and canvas across frames.
+
+    Triangle colors come from row prefix sums built once per image: the sum
+    over a triangle is the sum of its per-row span differences, so the cost
+    of recoloring scales with triangle heights rather than areas. Only the
+    box around each frame's created triangles is redrawn, in simplex key
+    order, so a frame does not depend on the frames rendered before it.
+    palette_transform (see cubist_renderer.transform_palette) is applied to
+    the colors of each frame's created triangles.
+
+    A triangle's color is the mean over every pixel of its span, shared
+    edge pixels included, whereas render_triangles only averages the pixels
+    a triangle keeps in the label map. The two differ slightly along
+    edges, so progressions use this renderer for every mean-colored frame,
+    also when frames are rendered independently on a process pool (a
+    fresh renderer per frame, sharing one prefix table passed as prefix).
+    The pool and serial paths then agree wherever the incremental and the
+    fresh triangulation agree; Delaunay ties (four cocircular points) may
+    still be split either way.
+    """
+
+    def __init__(self, image_rgb, alpha, clip_to_alpha=True, max_points=None, palette_transform=None, prefix=None):
+        self.image_rgb = image_rgb
+        self.alpha = alpha
+        self.clip_to_alpha = clip_to_alpha
+        self.height, self.width = image_rgb.shape[:2]
+        self.max_points = max_points
+        self.palette_transform = palette_transform
+        self.tri = None
+        self.points = None
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.colors = np.zeros((0, 3), dtype=np.uint8)
+        self.shown = np.zeros(0, dtype=bool)
+        self.opaque = (alpha > 0).astype(np.uint8)
+        self.clear_transparent = clip_to_alpha and not self.opaque.all()
+        self.prefix = color_prefix_sums(image_rgb, alpha, clip_to_alpha) if prefix is None else prefix
+        self.canvas = np.zeros_like(image_rgb)
+        # With alpha clipping every triangle is painted, so the canvas is
+        # always fully covered; otherwise the visible triangles are tracked here
+        self.coverage = None if clip_to_alpha else np.zeros((self.height, self.width), dtype=np.uint8)
+        self.last_created = 0
+
+    def render(self, points):
+        """Render the triangle layer for points; returns the shared canvas.
+
+        points must extend the previous call's points (same prefix). The
+        returned canvas is reused by the next call, so copy it before
+        modifying.
+        """
+        points = np.asarray(points, dtype=np.float64)
+        if self.tri is None:
+            self.max_points = max(self.max_points or 0, len(points))
+            self.tri = Delaunay(points, incremental=True)
+            self.points = points
+            return self._update()
+
+        if len(points) < len(self.points) or not np.array_equal(points[:len(self.points)], self.points):
+            raise ValueError("Progression frames must extend the previous frame's points.")
+        if len(points) == len(self.points):
+            self.last_created = 0
+            return self.canvas
+        if len(points) > self.max_points:
+            raise ValueError(f"Progression was set up for at most {self.max_points} points.")
+
+        self.tri.add_points(points[len(self.points):])
+        self.points = points
+        return self._update()
+
+    def _update(self):
+        simplices = self.tri.simplices
+        keys = simplex_keys(simplices, self.max_points)
+        old = np.argsort(self.keys)
+        pos = np.clip(np.searchsorted(self.keys[old], keys), 0, max(len(old) - 1, 0))
+        created = np.ones(len(keys), dtype=bool) if len(old) == 0 else self.keys[old][pos] != keys
+        self.last_created = int(created.sum())
+        if not created.any():
+            self.keys = keys
+            return self.canvas
+
+        colors = np.zeros((len(keys), 3), dtype=np.uint8)
+        shown = np.zeros(len(keys), dtype=bool)
+        colors[~created] = self.colors[old[pos[~created]]]
+        shown[~created] = self.shown[old[pos[~created]]]
+        tri_pts = self.points[simplices[created]]
+        new_colors, counts = self.triangle_colors(tri_pts)
+        if self.palette_transform is not None:
+            new_colors = self.palette_transform(new_colors, counts)
+        colors[created] = new_colors
+        shown[created] = triangle_visibility(self.points, simplices[created], self.alpha, self.clip_to_alpha)
+        self.keys, self.colors, self.shown = keys, colors, shown
+
+        # fillConvexPoly gives shared edge pixels to whichever triangle is
+        # drawn last, so painting only the created triangles over the old
+        # canvas would depend on the frame history. Instead the box around
+        # the created triangles (which also holds every destroyed one) is
+        # redrawn from scratch in simplex key order, the order a fresh
+        # renderer for the same points uses everywhere.
+        corners = self.points[simplices]
+        lo = np.floor(corners.min(axis=1)).astype(np.int64)
+        hi = np.floor(corners.max(axis=1)).astype(np.int64) + 1
+        x0, y0 = np.clip(lo[created].min(axis=0), 0, [self.width, self.height])
+        x1, y1 = np.clip(hi[created].max(axis=0), 0, [self.width, self.height])
+        inside = (lo[:, 0] < x1) & (hi[:, 0] > x0) & (lo[:, 1] < y1) & (hi[:, 1] > y0)
+        order = np.flatnonzero(inside)
+        order = order[np.argsort(keys[order])]
+        sub = self.canvas[y0:y1, x0:x1]
+        offset = np.array([x0, y0])
+        # Hidden triangles paint black: their pixels are voids, which the
+        # caller inpaints from coverage
+        colors[~shown] = 0
+        for i in order:
+            cv2.fillConvexPoly(sub, corners[i].astype(np.int32) - offset, colors[i].tolist())
+        if self.clear_transparent:
+            np.multiply(sub, self.opaque[y0:y1, x0:x1, None], out=sub)
+        if self.coverage is not None:
+            covered = self.coverage[y0:y1, x0:x1]
+            for i in order:
+                cv2.fillConvexPoly(covered, corners[i].astype(np.int32) - offset, int(shown[i]))
+        return self.canvas
+
+    def triangle_colors(self, tri_pts):
+        """Truncated mean color and pixel count of every triangle from the row prefix sums."""
+        owner, rows, xl, xr = triangle_spans(tri_pts, self.height, self.width)
+        filled = xl <= xr
+        owner, rows, xl, xr = owner[filled], rows[filled], xl[filled], xr[filled]
+        span_sums = (self.prefix[rows, xr + 1] - self.prefix[rows, xl]).astype(np.float64)
+        totals = np.empty((len(tri_pts), 4), dtype=np.float64)
+        for c in range(4):
+            totals[:, c] = np.bincount(owner, weights=span_sums[:, c], minlength=len(tri_pts))
+        colors = np.zeros((len(tri_pts), 3), dtype=np.uint8)
+        nonempty = totals[:, 3] > 0
+        colors[nonempty] = (totals[nonempty, :3] / totals[nonempty, 3:]).astype(np.uint8)
+        return colors, totals[:, 3].astype(np.int64)
+
+
+def progression_point_counts(num_frames, base_point, growth_factor, total_points):
+    """Geometric point-count schedule used by progression runs."""
+    return [min(int(base_point * (growth_factor ** (frame - 1))), total_points) for frame in range(1, num_frames + 1)]
@@ -0,0 +1,263 @@
+"""
+cubist_renderer.py - Label-map renderer for flat-shaded cubist geometry
+
+Every triangle is rasterized once into a single int32 triangle-ID image
+(0 = background, i + 1 = simplex i). Per-triangle mean colors come from one
+np.bincount pass per channel and the canvas is painted with one gather,
+instead of allocating and scanning a full-frame mask for every simplex.
+"""
+
+import cv2
+import numpy as np
+
+from cubist_colorstats import COLOR_STATS, shape_median_colors, shape_mode_colors
+from cubist_voronoi import draw_shape, voronoi_shapes
+
+# Margin around each void component kept as inpainting context (> the 3 px
+# TELEA radius plus the 1 px mask dilation)
+VOID_PAD = 8
+
+
+def triangle_visibility(points, simplices, alpha, clip_to_alpha=True):
+    """Return a boolean array telling which simplices should be rendered.
+
+    With clip_to_alpha every triangle is rendered (pixels are clipped to
+    alpha > 0 later). Otherwise a triangle is skipped if any of its vertices
+    lies outside the image or on a fully transparent pixel.
+    """
+    if clip_to_alpha:
+        return np.ones(len(simplices), dtype=bool)
+    height, width = alpha.shape[:2]
+    verts = points[simplices].astype(np.int64)
+    xs, ys = verts[..., 0], verts[..., 1]
+    inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+    opaque = np.zeros(inside.shape, dtype=bool)
+    opaque[inside] = alpha[ys[inside], xs[inside]] > 0
+    return np.all(opaque, axis=1)
+
+
+def rasterize_triangles(points, simplices, height, width, visible=None, labels=None):
+    """Rasterize all simplices into one int32 label image.
+
+    Later simplices overwrite shared edge pixels of earlier ones, the same
+    draw order the per-mask loop used when painting the canvas. Pass labels
+    to draw into an existing label image instead of a fresh one.
+    """
+    if labels is None:
+        labels = np.zeros((height, width), dtype=np.int32)
+    tri_pts = points[simplices].astype(np.int32)
+    if visible is None:
+        indices = range(len(simplices))
+    else:
+        indices = np.flatnonzero(visible)
+    for i in indices:
+        cv2.fillConvexPoly(labels, tri_pts[i], int(i) + 1)
+    return labels
+
+
+def shape_mean_colors(labels, image_rgb, num_shapes):
+    """Per-label mean colors and pixel counts from one bincount per channel.
+
+    Returns (colors, counts) where colors is a (num_shapes + 1, 3) uint8
+    palette indexed by label; row 0 (background) and empty labels are black.
+    Means are truncated like the int(np.mean(...)) they replace.
+    """
+    flat_labels = labels.ravel()
+    counts = np.bincount(flat_labels, minlength=num_shapes + 1)
+    sums = np.empty((num_shapes + 1, 3), dtype=np.float64)
+    for c in range(3):
+        sums[:, c] = np.bincount(flat_labels, weights=image_rgb[:, :, c].ravel(), minlength=num_shapes + 1)
+    colors = np.zeros((num_shapes + 1, 3), dtype=np.uint8)
+    filled = counts > 0
+    colors[filled] = (sums[filled] / counts[filled, None]).astype(np.uint8)
+    colors[0] = 0
+    return colors, counts
+
+
+def shape_colors(labels, image_rgb, num_shapes, color_stat="mean"):
+    """Per-label (colors, counts) with the chosen statistic: mean, median or mode.
+
+    See shape_mean_colors and cubist_colorstats; all three return the same
+    palette layout.
+    """
+    if color_stat == "mean":
+        return shape_mean_colors(labels, image_rgb, num_shapes)
+    if color_stat == "median":
+        return shape_median_colors(labels, image_rgb, num_shapes)
+    if color_stat == "mode":
+        return shape_mode_colors(labels, image_rgb, num_shapes)
+    raise ValueError(f"Unknown color statistic '{color_stat}', expected one of {COLOR_STATS}.")
+
+
+def transform_palette(palette, counts, palette_transform=None):
+    """Apply a palette transform (LUT grading, ...) to every shape color in place.
+
+    palette_transform is called as palette_transform(colors, counts) with
+    the (K, 3) uint8 shape colors and their pixel counts (which may be
+    None) and returns new uint8 colors. Row 0, the background, stays black.
+    """
+    if palette_transform is not None and len(palette) > 1:
+        palette[1:] = palette_transform(palette[1:], None if counts is None else counts[1:])
+    return palette
+
+
+def chain_palette_transforms(*transforms):
+    """One palette transform running the given ones in order (None entries are skipped)."""
+    transforms = [transform for transform in transforms if transform is not None]
+    if len(transforms) <= 1:
+        return transforms[0] if transforms else None
+
+    def chained(colors, counts=None):
+        for transform in transforms:
+            colors = transform(colors, counts)
+        return colors
+
+    return chained
+
+
+def paint_labels(labels, palette):
+    """Paint the canvas from a label image with a single palette gather."""
+    return palette[labels]
+
+
+def render_triangles(points, simplices, image_rgb, alpha, clip_to_alpha=True, palette_transform=None,
+                     color_stat="mean"):
+    """Render flat-shaded Delaunay triangles.
+
+    Returns (canvas, labels, palette) so callers can reuse the label map for
+    further passes. Triangle colors are the color_stat of their pixels (see
+    shape_colors); palette_transform is applied to them before painting,
+    see transform_palette.
+    """
+    height, width = image_rgb.shape[:2]
+    visible = triangle_visibility(points, simplices, alpha, clip_to_alpha)
+    labels = rasterize_triangles(points, simplices, height, width, visible)
+    if clip_to_alpha:
+        labels[alpha == 0] = 0
+    palette, counts = shape_colors(labels, image_rgb, len(simplices), color_stat)
+    transform_palette(palette, counts, palette_transform)
+    canvas = paint_labels(labels, palette)
+    return canvas, labels, palette
+
+
+def resolve_mixed(points, tri, image_rgb, alpha, clip_to_alpha=True, chunk_rows=None, palette_transform=None,
+                  color_stat="mean", shapes=None):
+    """Owner map and palette of triangles with Voronoi shapes on top, skipping hidden triangle work.
+
+    The Voronoi shapes are drawn first into an owner map, so the final
+    per-pixel coverage is known before any triangle color is computed.
+    Triangle statistics are then gathered only for triangles that still show
+    through, and the canvas is painted once from the composited owner map.
+    The result matches drawing all triangles and then all shapes on top.
+    Triangle and cell colors use color_stat (see shape_colors).
+    palette_transform sees triangle and shape colors together, weighted by
+    the pixels each one shows. Returns (owner, palette, shapes): owner is
+    the composited label map (triangle i is i + 1, shape k is
+    len(tri.simplices) + k + 1), shapes the voronoi_shapes list. shapes
+    computed beforehand (voronoi_shapes without palette_transform) can be
+    passed in.
+    """
+    height, width = image_rgb.shape[:2]
+    num_tri = len(tri.simplices)
+    if shapes is None:
+        shapes = voronoi_shapes(points, tri, image_rgb, chunk_rows, color_stat=color_stat)
+    owner = np.zeros((height, width), dtype=np.int32)
+    for k, (_, kind, geometry, _) in enumerate(shapes):
+        draw_shape(owner, kind, geometry, num_tri + k + 1)
+
+    palette = np.zeros((num_tri + len(shapes) + 1, 3), dtype=np.uint8)
+    if shapes:
+        palette[num_tri + 1:] = [color for _, _, _, color in shapes]
+
+    uncovered = owner == 0
+    if clip_to_alpha:
+        uncovered &= alpha > 0
+    if uncovered.any():
+        visible = triangle_visibility(points, tri.simplices, alpha, clip_to_alpha)
+        labels = rasterize_triangles(points, tri.simplices, height, width, visible)
+        if clip_to_alpha:
+            labels[alpha == 0] = 0
+        shown = np.zeros(num_tri + 1, dtype=bool)
+        shown[labels[uncovered]] = True
+        shown[0] = False
+        # Triangle colors stay full-area (as if painted underneath), but only
+        # the pixels of triangles that show through are gathered and summed
+        pixels = np.flatnonzero(shown[labels])
+        if len(pixels) * 2 > labels.size:
+            tri_palette, _ = shape_colors(labels, image_rgb, num_tri, color_stat)
+        else:
+            tri_palette, _ = shape_colors(labels.ravel()[pixels], image_rgb.reshape(-1, 3)[pixels, None], num_tri,
+                                          color_stat)
+        palette[:num_tri + 1] = tri_palette
+        owner = np.where(owner > 0, owner, labels)
+    if palette_transform is not None:
+        transform_palette(palette, np.bincount(owner.ravel(), minlength=len(palette)), palette_transform)
+    return owner, palette, shapes
+
+
+def render_mixed(points, tri, image_rgb, alpha, clip_to_alpha=True, chunk_rows=None, palette_transform=None,
+                 color_stat="mean", shapes=None):
+    """Render triangles with Voronoi shapes on top, see resolve_mixed.
+
+    Returns (canvas, owner), owner being the composited label map.
+    """
+    owner, palette, _ = resolve_mixed(points, tri, image_rgb, alpha, clip_to_alpha, chunk_rows, palette_transform,
+                                      color_stat, shapes)
+    return paint_labels(owner, palette), owner
+
+
+def neutral_color(image_rgb, alpha):
+    """Mean color of the opaque pixels, used to fill unreachable voids."""
+    return np.mean(image_rgb[alpha > 0], axis=0).astype(np.uint8)
+
+
+def void_mask(coverage, alpha):
+    """Opaque pixels that no shape covered, or None when there are none.
+
+    coverage is any per-pixel map where 0 means uncovered (a label image or
+    a coverage bitmap). Unlike testing for black canvas pixels, genuinely
+    black shapes are never mistaken for holes.
+    """
+    voids = (coverage == 0) & (alpha > 0)
+    return voids if voids.any() else None
+
+
+def repair_voids(canvas, image_rgb, alpha, neutral=None, voids=None):
+    """Inpaint holes left inside the alpha region, one component at a time.
+
+    voids marks the holes, normally from void_mask; without it, black
+    opaque canvas pixels are treated as holes. Each connected component is
+    inpainted inside its padded bounding box only, instead of the full
+    frame. Anything inpainting could not reach gets the neutral (mean
+    opaque) color; pass neutral to reuse a precomputed one.
+    """
+    if voids is None:
+        voids = np.all(canvas == 0, axis=2) & (alpha > 0)
+    # Dilate first so holes that touch after dilation are inpainted together
+    mask = cv2.dilate(voids.view(np.uint8), np.ones((3, 3), np.uint8), iterations=1)
+    num_components, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    if num_components <= 1:
+        return canvas
+
+    height, width = canvas.shape[:2]
+    for component, (x, y, w, h, _) in enumerate(stats[1:], 1):
+        x0, y0 = max(x - VOID_PAD, 0), max(y - VOID_PAD, 0)
+        x1, y1 = min(x + w + VOID_PAD, width), min(y + h + VOID_PAD, height)
+        roi = canvas[y0:y1, x0:x1]
+        roi_labels = labels[y0:y1, x0:x1]
+        # Neighbouring voids inside the box are masked too, so their black
+        # pixels are never used as inpainting source; only this component
+        # is written back
+        roi_mask = (roi_labels > 0).view(np.uint8)
+        own = roi_labels == component
+        if roi_mask.all():
+            # Nothing known to inpaint from inside the box
+            roi[own] = neutral_color(image_rgb, alpha) if neutral is None else neutral
+            continue
+        inpainted = cv2.cvtColor(cv2.inpaint(cv2.cvtColor(roi, cv2.COLOR_RGB2BGR), roi_mask, 3, cv2.INPAINT_TELEA),
+                                 cv2.COLOR_BGR2RGB)
+        roi[own] = inpainted[own]
+        remaining = own & np.all(roi == 0, axis=2) & (alpha[y0:y1, x0:x1] > 0)
+        if remaining.any():
+            roi[remaining] = neutral_color(image_rgb, alpha) if neutral is None else neutral
+    return canvas
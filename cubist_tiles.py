@@ -0,0 +1,371 @@
+"""
+cubist_tiles.py - Tile-parallel renderer with bounded per-tile memory
+
+The canvas is split into fixed-size tiles. A bounding-box index assigns each
+shape (triangle or Voronoi polygon) to the tiles it overlaps, and every tile
+rasterizes only its own shapes into a tile-sized label image on a thread pool
+(OpenCV's fill functions release the GIL). Per-shape pixel counts and color
+sums are integers, so merging the per-tile partials is exact and the output
+matches a single-tile render.
+
+OpenCV clips polygon outlines against the destination image, which changes
+edge pixels when a shape is cut by a tile border. Shapes that cross a border
+are therefore rasterized once, unclipped, into per-row spans and the tiles
+paint their share of those spans.
+
+The mixed-geometry overlay goes through the same machinery: Voronoi cell
+statistics are gathered from the rasterized cell polygons tile by tile
+(voronoi_shapes_tiled) and the chosen cell shapes are painted as polygons
+over the triangle canvas (draw_shapes_tiled).
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from cubist_colorstats import (COLOR_STATS, channel_histograms, dominant_sums, histogram_bins, joint_histogram,
+                               mean_of_sums, median_colors, mode_levels, quantized_colors)
+from cubist_geometry import voronoi_cells
+from cubist_renderer import transform_palette
+from cubist_voronoi import cell_shapes, shape_polygon
+
+DEFAULT_TILE_SIZE = 512
+
+
+def shape_bounds(polygons):
+    """Inclusive integer bounding boxes (lo, hi) as (N, 2) arrays of (x, y)."""
+    if isinstance(polygons, np.ndarray) and polygons.ndim == 3:
+        lo = polygons.min(axis=1)
+        hi = polygons.max(axis=1)
+    else:
+        lo = np.array([np.min(p, axis=0) for p in polygons]).reshape(-1, 2)
+        hi = np.array([np.max(p, axis=0) for p in polygons]).reshape(-1, 2)
+    return np.floor(lo).astype(np.int64), np.ceil(hi).astype(np.int64)
+
+
+def build_tile_index(polygons, height, width, tile_size=DEFAULT_TILE_SIZE):
+    """Map every tile to the shapes whose bounding box overlaps it.
+
+    Returns (index, crossing): index is a list of (y0, y1, x0, x1,
+    shape_indices) with shape indices in ascending (draw) order, including
+    empty tiles; crossing flags shapes not contained in a single tile.
+    """
+    tiles_y = (height + tile_size - 1) // tile_size
+    tiles_x = (width + tile_size - 1) // tile_size
+    lo, hi = shape_bounds(polygons)
+    tx0 = np.clip(lo[:, 0] // tile_size, 0, tiles_x - 1)
+    ty0 = np.clip(lo[:, 1] // tile_size, 0, tiles_y - 1)
+    tx1 = np.clip(hi[:, 0] // tile_size, 0, tiles_x - 1)
+    ty1 = np.clip(hi[:, 1] // tile_size, 0, tiles_y - 1)
+    on_canvas = (hi[:, 0] >= 0) & (hi[:, 1] >= 0) & (lo[:, 0] < width) & (lo[:, 1] < height)
+    inside_canvas = (lo[:, 0] >= 0) & (lo[:, 1] >= 0) & (hi[:, 0] < width) & (hi[:, 1] < height)
+    crossing = on_canvas & ((tx0 != tx1) | (ty0 != ty1) | ~inside_canvas)
+
+    shape_ids = np.flatnonzero(on_canvas)
+    nx = (tx1 - tx0 + 1)[shape_ids]
+    ny = (ty1 - ty0 + 1)[shape_ids]
+    per_shape = nx * ny
+    owner = np.repeat(shape_ids, per_shape)
+    # Position of each (shape, tile) pair inside its shape's tile block
+    offset = np.arange(len(owner)) - np.repeat(np.cumsum(per_shape) - per_shape, per_shape)
+    pair_nx = np.repeat(nx, per_shape)
+    tile_x = tx0[owner] + offset % pair_nx
+    tile_y = ty0[owner] + offset // pair_nx
+    tile_ids = tile_y * tiles_x + tile_x
+
+    order = np.argsort(tile_ids, kind="stable")
+    tile_ids = tile_ids[order]
+    owner = owner[order]
+    splits = np.searchsorted(tile_ids, np.arange(tiles_x * tiles_y + 1))
+
+    index = []
+    for t in range(tiles_x * tiles_y):
+        ty, tx = divmod(t, tiles_x)
+        y0, x0 = ty * tile_size, tx * tile_size
+        index.append((y0, min(y0 + tile_size, height), x0, min(x0 + tile_size, width),
+                      owner[splits[t]:splits[t + 1]]))
+    return index, crossing
+
+
+def fill_shape(img, poly, value, convex=True):
+    if convex:
+        cv2.fillConvexPoly(img, poly, value)
+    else:
+        cv2.fillPoly(img, [poly], value)
+
+
+def shape_spans(polygon, convex=True):
+    """Rasterize one shape unclipped and return its per-row spans.
+
+    Returns (y0, xl, xr): row y0 + r covers columns xl[r]..xr[r] inclusive
+    (empty rows have xl > xr). Spans are exact for convex shapes.
+    """
+    poly = np.asarray(polygon, dtype=np.int32)
+    lo = poly.min(axis=0)
+    hi = poly.max(axis=0)
+    buf = np.zeros((hi[1] - lo[1] + 1, hi[0] - lo[0] + 1), dtype=np.uint8)
+    fill_shape(buf, poly - lo, 1, convex)
+    filled = buf.any(axis=1)
+    xl = np.argmax(buf, axis=1)
+    xr = buf.shape[1] - 1 - np.argmax(buf[:, ::-1], axis=1)
+    xl[~filled] = 1
+    xr[~filled] = 0
+    return int(lo[1]), xl + lo[0], xr + lo[0]
+
+
+def rasterize_tile(polygons, shape_ids, y0, y1, x0, x1, alpha=None, convex=True, spans=None):
+    """Rasterize the given shapes into a tile-local label image.
+
+    Labels are local: shape_ids[k] is drawn as k + 1 so the bincount that
+    follows only spans the shapes touching this tile. Shapes found in spans
+    (those crossing a tile border) are painted from their precomputed spans.
+    """
+    labels = np.zeros((y1 - y0, x1 - x0), dtype=np.int32)
+    origin = np.array([x0, y0], dtype=np.int32)
+    cols = np.arange(x0, x1)
+    for k, i in enumerate(shape_ids):
+        if spans is not None and i in spans:
+            sy0, xl, xr = spans[i]
+            r0 = max(sy0, y0)
+            r1 = min(sy0 + len(xl), y1)
+            if r0 >= r1:
+                continue
+            row_xl = xl[r0 - sy0:r1 - sy0, None]
+            row_xr = xr[r0 - sy0:r1 - sy0, None]
+            c0 = max(int(row_xl.min()), x0)
+            c1 = min(int(row_xr.max()) + 1, x1)
+            if c0 >= c1:
+                continue
+            c = cols[c0 - x0:c1 - x0]
+            inside = (c >= row_xl) & (c <= row_xr)
+            labels[r0 - y0:r1 - y0, c0 - x0:c1 - x0][inside] = k + 1
+        else:
+            fill_shape(labels, np.asarray(polygons[i], dtype=np.int32) - origin, k + 1, convex)
+    if alpha is not None:
+        labels[alpha[y0:y1, x0:x1] == 0] = 0
+    return labels
+
+
+def accumulate_tile(labels, image_tile, num_local):
+    """Per-local-label pixel counts and integer RGB sums for one tile."""
+    flat_labels = labels.ravel()
+    counts = np.bincount(flat_labels, minlength=num_local + 1)
+    sums = np.empty((num_local + 1, 3), dtype=np.int64)
+    for c in range(3):
+        sums[:, c] = np.bincount(flat_labels, weights=image_tile[:, :, c].ravel(), minlength=num_local + 1)
+    return counts[1:], sums[1:]
+
+
+def accumulate_squares(labels, image_tile, num_local):
+    """Per-local-label sums of squared channel values (all channels together) for one tile."""
+    flat_labels = labels.ravel()
+    squares = np.zeros(num_local + 1, dtype=np.float64)
+    for c in range(3):
+        channel = image_tile[:, :, c].ravel().astype(np.float64)
+        squares += np.bincount(flat_labels, weights=channel * channel, minlength=num_local + 1)
+    return squares[1:]
+
+
+def tile_histograms(labels, image_tile, num_local, color_stat, size, dominant=None):
+    """Per-local-label histograms (median, mode) or dominant-cell sums (mode, second pass) of one tile."""
+    flat_labels = labels.ravel()
+    pixels = image_tile.reshape(-1, 3)
+    if color_stat == "median":
+        return channel_histograms(flat_labels, pixels, num_local + 1, size)[:, 1:]
+    cells = quantized_colors(pixels, size)
+    if dominant is None:
+        return joint_histogram(flat_labels, cells, num_local + 1, size)[1:]
+    counts, sums = dominant_sums(flat_labels, pixels, cells, dominant, num_local + 1)
+    return counts[1:], sums[1:]
+
+
+def tile_layout(polygons, height, width, tile_size, pool, convex=True):
+    """Tile index (see build_tile_index) and the spans of shapes crossing a tile border."""
+    if len(polygons):
+        index, crossing = build_tile_index(polygons, height, width, tile_size)
+    else:
+        index, crossing = [], np.zeros(0, dtype=bool)
+    crossing_ids = np.flatnonzero(crossing)
+    spans = dict(zip(crossing_ids, pool.map(lambda i: shape_spans(polygons[i], convex), crossing_ids)))
+    return index, spans
+
+
+def tile_statistics(polygons, image_rgb, clip_alpha, index, spans, pool, convex=True, color_stat="mean",
+                    with_std=False):
+    """Per-shape colors and pixel counts merged over the tiles of index.
+
+    Returns (palette, counts, stds): palette row i + 1 is the color_stat
+    color of polygons[i] (row 0 black), counts the pixel counts and stds,
+    only with with_std, the standard deviation over all channel values of
+    every shape, as cubist_voronoi.region_stats takes it.
+    """
+    num_shapes = len(polygons)
+    if color_stat == "median":
+        hist_size = histogram_bins(num_shapes + 1)
+        total_hists = np.zeros((3, num_shapes + 1, hist_size), dtype=np.int64)
+    elif color_stat == "mode":
+        hist_size = mode_levels(num_shapes + 1)
+        total_hists = np.zeros((num_shapes + 1, hist_size ** 3), dtype=np.int64)
+
+    def stats_pass(tile):
+        y0, y1, x0, x1, ids = tile
+        if len(ids) == 0:
+            return ids, None, None, None, None
+        labels = rasterize_tile(polygons, ids, y0, y1, x0, x1, clip_alpha, convex, spans)
+        image_tile = image_rgb[y0:y1, x0:x1]
+        counts, sums = accumulate_tile(labels, image_tile, len(ids))
+        hists = squares = None
+        if color_stat != "mean":
+            hists = tile_histograms(labels, image_tile, len(ids), color_stat, hist_size)
+        if with_std:
+            squares = accumulate_squares(labels, image_tile, len(ids))
+        return ids, counts, sums, hists, squares
+
+    def dominant_pass(tile):
+        y0, y1, x0, x1, ids = tile
+        if len(ids) == 0:
+            return ids, None, None
+        labels = rasterize_tile(polygons, ids, y0, y1, x0, x1, clip_alpha, convex, spans)
+        local_dominant = np.concatenate(([0], dominant[ids + 1]))
+        counts, sums = tile_histograms(labels, image_rgb[y0:y1, x0:x1], len(ids), color_stat, hist_size,
+                                       local_dominant)
+        return ids, counts, sums
+
+    total_counts = np.zeros(num_shapes + 1, dtype=np.int64)
+    total_sums = np.zeros((num_shapes + 1, 3), dtype=np.int64)
+    total_squares = np.zeros(num_shapes + 1, dtype=np.float64)
+    for ids, counts, sums, hists, squares in pool.map(stats_pass, index):
+        if counts is None:
+            continue
+        # Shape ids are unique within a tile, so plain fancy-index adds are safe
+        total_counts[ids + 1] += counts
+        total_sums[ids + 1] += sums
+        if color_stat == "median":
+            total_hists[:, ids + 1] += hists
+        elif color_stat == "mode":
+            total_hists[ids + 1] += hists
+        if with_std:
+            total_squares[ids + 1] += squares
+
+    if color_stat == "median":
+        palette = median_colors(total_hists, total_counts)
+    elif color_stat == "mode":
+        dominant = np.argmax(total_hists, axis=1)
+        dominant_counts = np.zeros(num_shapes + 1, dtype=np.int64)
+        dominant_totals = np.zeros((num_shapes + 1, 3), dtype=np.int64)
+        for ids, counts, sums in pool.map(dominant_pass, index):
+            if counts is not None:
+                dominant_counts[ids + 1] += counts
+                dominant_totals[ids + 1] += sums
+        palette = mean_of_sums(dominant_counts, dominant_totals)
+    else:
+        palette = mean_of_sums(total_counts, total_sums)
+    palette[0] = 0
+
+    stds = None
+    if with_std:
+        stds = np.zeros(num_shapes + 1, dtype=np.float64)
+        filled = total_counts > 0
+        n_values = 3.0 * total_counts[filled]
+        variance = total_squares[filled] / n_values - (total_sums[filled].sum(axis=1) / n_values) ** 2
+        stds[filled] = np.sqrt(np.maximum(variance, 0.0))
+    return palette, total_counts, stds
+
+
+def render_polygons_tiled(polygons, image_rgb, alpha, clip_to_alpha=True, tile_size=DEFAULT_TILE_SIZE,
+                          workers=None, convex=True, palette_transform=None, color_stat="mean", colors=None,
+                          canvas=None):
+    """Render flat-shaded polygons tile by tile on a thread pool.
+
+    Returns (canvas, palette, counts, coverage); palette row i + 1 is the
+    color_stat (mean, median or mode, see cubist_colorstats) color of
+    polygons[i] (after palette_transform, see
+    cubist_renderer.transform_palette) and row 0 is the black background,
+    as in cubist_renderer. coverage is a uint8 bitmap of the pixels some
+    shape painted. Median and mode histograms are integer counts too, so
+    they merge across tiles exactly; mode takes a second statistics pass.
+
+    colors, one RGB row per polygon, skips the statistics passes: the
+    polygons are painted with those colors as given (no palette_transform)
+    and counts is None. With canvas given, the polygons are painted over
+    it in place rather than over a black canvas, leaving uncovered pixels
+    as they are.
+    """
+    if color_stat not in COLOR_STATS:
+        raise ValueError(f"Unknown color statistic '{color_stat}', expected one of {COLOR_STATS}.")
+    height, width = image_rgb.shape[:2]
+    clip_alpha = alpha if clip_to_alpha else None
+    workers = workers or os.cpu_count() or 1
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        index, spans = tile_layout(polygons, height, width, tile_size, pool, convex)
+        if colors is None:
+            palette, counts, _ = tile_statistics(polygons, image_rgb, clip_alpha, index, spans, pool, convex,
+                                                 color_stat)
+            transform_palette(palette, counts, palette_transform)
+        else:
+            counts = None
+            palette = np.zeros((len(polygons) + 1, 3), dtype=np.uint8)
+            palette[1:] = np.asarray(colors, dtype=np.uint8).reshape(-1, 3)
+
+        over = canvas is not None
+        if not over:
+            canvas = np.zeros_like(image_rgb)
+        coverage = np.zeros((height, width), dtype=np.uint8)
+
+        def paint_pass(tile):
+            y0, y1, x0, x1, ids = tile
+            if len(ids) == 0:
+                return
+            labels = rasterize_tile(polygons, ids, y0, y1, x0, x1, clip_alpha, convex, spans)
+            local_palette = np.vstack([palette[:1], palette[ids + 1]])
+            covered = labels > 0
+            if over:
+                np.copyto(canvas[y0:y1, x0:x1], local_palette[labels], where=covered[:, :, None])
+            else:
+                canvas[y0:y1, x0:x1] = local_palette[labels]
+            coverage[y0:y1, x0:x1] = covered
+
+        list(pool.map(paint_pass, index))
+    return canvas, palette, counts, coverage
+
+
+def voronoi_shapes_tiled(points, tri, image_rgb, tile_size=DEFAULT_TILE_SIZE, workers=None, palette_transform=None,
+                         color_stat="mean"):
+    """cubist_voronoi.voronoi_shapes with the cell statistics gathered tile by tile.
+
+    Cells are rasterized from their Voronoi polygons instead of labelling
+    every pixel with its nearest seed, so pixels right on a cell border
+    may be counted in the neighbouring cell.
+    """
+    if color_stat not in COLOR_STATS:
+        raise ValueError(f"Unknown color statistic '{color_stat}', expected one of {COLOR_STATS}.")
+    height, width = image_rgb.shape[:2]
+    polygons = voronoi_cells(tri, width, height)
+    kept = [i for i, polygon in enumerate(polygons) if polygon is not None]
+    cells = [polygons[i] for i in kept]
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+        index, spans = tile_layout(cells, height, width, tile_size, pool)
+        cell_colors, cell_counts, cell_stds = tile_statistics(cells, image_rgb, None, index, spans, pool,
+                                                              color_stat=color_stat, with_std=True)
+    # Back to rows indexed by point, as cell_shapes expects
+    rows = np.concatenate(([0], np.asarray(kept, dtype=np.int64) + 1))
+    colors = np.zeros((len(polygons) + 1, 3), dtype=np.uint8)
+    counts = np.zeros(len(polygons) + 1, dtype=np.int64)
+    stds = np.zeros(len(polygons) + 1, dtype=np.float64)
+    colors[rows], counts[rows], stds[rows] = cell_colors, cell_counts, cell_stds
+    transform_palette(colors, counts, palette_transform)
+    return cell_shapes(polygons, counts, colors, stds)
+
+
+def draw_shapes_tiled(canvas, shapes, coverage=None, tile_size=DEFAULT_TILE_SIZE, workers=None):
+    """cubist_voronoi.draw_shapes tile by tile, circles drawn as polygons (see shape_polygon)."""
+    polygons = [shape_polygon(kind, geometry) for _, kind, geometry, _ in shapes]
+    colors = [color for _, _, _, color in shapes]
+    _, _, _, covered = render_polygons_tiled(polygons, canvas, None, False, tile_size, workers, colors=colors,
+                                             canvas=canvas)
+    if coverage is not None:
+        coverage |= covered
+    return canvas
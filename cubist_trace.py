@@ -0,0 +1,213 @@
+"""
+cubist_trace.py - Lightweight per-stage tracing for the rendering pipeline
+
+A Tracer times each pipeline stage (decode, palette, sample, triangulate,
+voronoi, fill, inpaint, encode, write) and produces one record per stage with
+wall time, CPU time, how far RSS peaked above its level at the stage start
+and any counts the stage adds (triangles, regions, void pixels, bytes,
+...). Records are appended to a JSON-lines file and/or passed to hook
+callables.
+
+Tracing off is the NULL_TRACER, whose stage() hands back one shared no-op
+context manager, so instrumented code costs a method call per stage.
+
+Example:
+    tracer = Tracer("logs/trace.jsonl", input="photo.jpg")
+    with tracer.stage("fill") as record:
+        ...
+        record["triangles"] = len(simplices)
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+TRACE_STAGES = ("decode", "palette", "sample", "triangulate", "voronoi", "fill", "inpaint", "encode", "write")
+
+
+def _proc_status_kb(*fields):
+    values = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            name, _, value = line.partition(":")
+            if name in fields:
+                values[name] = int(value.split()[0])
+    return [values[field] for field in fields]
+
+
+def _windows_peak_kb():
+    """PeakWorkingSetSize of this process in KiB (GetProcessMemoryInfo), or None."""
+    import ctypes
+    from ctypes import wintypes
+
+    class ProcessMemoryCounters(ctypes.Structure):
+        _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                    ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                    ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                    ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+    counters = ProcessMemoryCounters()
+    counters.cb = ctypes.sizeof(counters)
+    kernel32 = ctypes.WinDLL("kernel32")
+    kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+    # K32GetProcessMemoryInfo is the kernel32 export of psapi's GetProcessMemoryInfo (Windows 7+)
+    get_info = kernel32.K32GetProcessMemoryInfo
+    get_info.argtypes = [wintypes.HANDLE, ctypes.POINTER(ProcessMemoryCounters), wintypes.DWORD]
+    if not get_info(kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+        return None
+    return counters.PeakWorkingSetSize // 1024
+
+
+def peak_rss_kb():
+    """Peak resident set size of this process in KiB, or None if unavailable.
+
+    Linux reads VmHWM, Windows the peak working set, other systems
+    getrusage's ru_maxrss.
+    """
+    try:
+        return _proc_status_kb("VmHWM")[0]
+    except (OSError, KeyError, ValueError):
+        pass
+    if sys.platform == "win32":
+        try:
+            return _windows_peak_kb()
+        except (OSError, AttributeError):
+            return None
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS, KiB elsewhere
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def reset_peak_rss():
+    """Start a new peak RSS window; returns the current RSS in KiB, or None.
+
+    Only Linux can reset the high-water mark, by writing 5 to
+    /proc/self/clear_refs. That resets VmHWM for the whole process (every
+    thread, and anyone else reading it) and is why Tracer has reset_peak.
+    Where it cannot, the stage's peak delta is the growth of the process
+    peak, which is 0 for stages that stay below an earlier peak.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return _proc_status_kb("VmRSS")[0]
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+class _Stage:
+    """Context manager measuring one stage; yields the record to add counts to."""
+
+    __slots__ = ("tracer", "record", "wall", "cpu", "rss")
+
+    def __init__(self, tracer, record):
+        self.tracer = tracer
+        self.record = record
+
+    def __enter__(self):
+        self.rss = reset_peak_rss() if self.tracer.reset_peak else None
+        if self.rss is None:
+            self.rss = peak_rss_kb()
+        else:
+            self.record["rss_start_kb"] = self.rss
+        self.cpu = time.process_time()
+        self.wall = time.perf_counter()
+        return self.record
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self.wall
+        cpu = time.process_time() - self.cpu
+        rss = peak_rss_kb()
+        self.record["wall_seconds"] = round(wall, 6)
+        self.record["cpu_seconds"] = round(cpu, 6)
+        self.record["peak_rss_delta_kb"] = None if rss is None else rss - self.rss
+        if exc_type is not None:
+            self.record["error"] = exc_type.__name__
+        self.tracer.emit(self.record)
+        return False
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return {}
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+class Tracer:
+    """Collects stage records and sends them to a JSON-lines file and hooks.
+
+    path is appended to (one JSON object per line) and may be shared by
+    several processes. Each hook is called as hook(record). context is
+    copied into every record, next to a run id, the stage name and a
+    timestamp.
+
+    reset_peak resets the process's peak RSS at every stage start on Linux
+    (see reset_peak_rss), so each stage reports its own peak. Pass False
+    when something else in the process relies on VmHWM; stages then report
+    the growth of the process peak only.
+    """
+
+    enabled = True
+
+    def __init__(self, path=None, hooks=(), reset_peak=True, **context):
+        self.path = path
+        self.hooks = list(hooks)
+        self.reset_peak = reset_peak
+        self.context = dict(context, run=uuid.uuid4().hex[:12])
+        self._lock = threading.Lock()
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def stage(self, name, **counts):
+        record = dict(self.context, stage=name, time=datetime.now().isoformat(timespec="milliseconds"))
+        record.update(counts)
+        return _Stage(self, record)
+
+    def emit(self, record):
+        if self.path:
+            line = json.dumps(record, default=str) + "\n"
+            with self._lock, open(self.path, "a") as f:
+                f.write(line)
+        for hook in self.hooks:
+            hook(record)
+
+
+class NullTracer:
+    """Tracing switched off."""
+
+    enabled = False
+    _stage = _NullStage()
+
+    def stage(self, name, **counts):
+        return self._stage
+
+    def emit(self, record):
+        pass
+
+
+NULL_TRACER = NullTracer()
+
+
+def read_trace(path):
+    """All records of a JSON-lines trace file."""
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
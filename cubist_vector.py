@@ -0,0 +1,300 @@
+"""
+cubist_vector.py - Streaming SVG/PDF export of the rendered shapes
+
+Instead of rasterizing to a PNG and upscaling it for print, the shape list
+(triangles, then Voronoi polygons, circles and rectangles, in draw order)
+is written with its final colors as vector graphics, clipped to the opaque
+region of the alpha channel. Writers stream: every shape is written as it
+arrives (SVG text, or a zlib-compressed PDF content stream whose length is
+filled in at the end), so 100k-shape scenes never build a document tree.
+
+    SVGWriter  .svg/.svgz  one <path>/<circle>/<rect> per shape (gzip for .svgz)
+    PDFWriter  .pdf        one page, Flate-compressed content stream
+
+Coordinates are output pixels, shifted by half a pixel so vertices land
+on pixel centers as in the raster. Shapes get a thin outline in their own
+color (seam_width) so anti-aliased viewers show no hairline gaps between
+neighbouring triangles. The clip path follows the centers of the outermost
+opaque pixels (alpha > 0; partial alpha is not kept).
+
+Example:
+    shapes = triangle_shapes(points[tri.simplices], palette)
+    write_vector("out/piece.pdf", shapes, width, height, clip=alpha_clip_contours(alpha))
+"""
+
+import gzip
+import zlib
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+VECTOR_FORMATS = ("svg", "svgz", "pdf")
+SEAM_WIDTH = 0.5
+CLIP_TOLERANCE = 0.5
+DEFAULT_DPI = 300
+# Bezier handle length of a quarter circle
+KAPPA = 0.5522847498
+
+
+def alpha_clip_contours(alpha, tolerance=CLIP_TOLERANCE):
+    """Outlines (int32 (N, 2) arrays, holes included) of the alpha > 0 region.
+
+    Returns None when every pixel is opaque and an empty list when none
+    is (which clips everything away). Filled with the even-odd rule
+    the outlines cover the opaque region; tolerance simplifies them
+    (cv2.approxPolyDP, in pixels).
+    """
+    opaque = (alpha > 0).view(np.uint8)
+    if opaque.all():
+        return None
+    contours, _ = cv2.findContours(opaque, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
+    if tolerance:
+        contours = [cv2.approxPolyDP(contour, tolerance, True) for contour in contours]
+    return [contour.reshape(-1, 2) for contour in contours]
+
+
+def triangle_shapes(tri_pts, palette, shown=None):
+    """("polygon", vertices, color) for every triangle; palette row i + 1 colors tri_pts[i].
+
+    shown (indexed like palette) skips triangles that showed no pixels.
+    """
+    tri_pts = np.asarray(tri_pts).astype(np.int32)
+    indices = range(len(tri_pts)) if shown is None else np.flatnonzero(shown[1:len(tri_pts) + 1])
+    for i in indices:
+        yield "polygon", tri_pts[i], palette[i + 1]
+
+
+def cell_shapes_of(shapes, palette=None, offset=0):
+    """(kind, geometry, color) of voronoi_shapes entries.
+
+    With palette, shape k takes palette row offset + k + 1 (the layout of
+    cubist_renderer.resolve_mixed) instead of its own color.
+    """
+    for k, (_, kind, geometry, color) in enumerate(shapes):
+        yield kind, geometry, color if palette is None else palette[offset + k + 1]
+
+
+def _hex(color):
+    r, g, b = (int(c) for c in color[:3])
+    if r % 17 == 0 and g % 17 == 0 and b % 17 == 0:
+        return f"#{r // 17:x}{g // 17:x}{b // 17:x}"
+    return f"#{r:02x}{g:02x}{b:02x}"
+
+
+def _num(value, digits=2):
+    """Short decimal text: integers without a point, else up to digits decimals."""
+    value = round(float(value), digits)
+    if value == int(value):
+        return str(int(value))
+    text = f"{value:.{digits}f}".rstrip("0")
+    return text.replace("0.", ".", 1) if text.startswith(("0.", "-0.")) else text
+
+
+def _svg_path_data(vertices):
+    """Closed path data: absolute first vertex, then relative steps ("M10 20l5-3-5 8z")."""
+    vertices = np.asarray(vertices).reshape(-1, 2)
+    steps = " ".join(f"{_num(dx)} {_num(dy)}" for dx, dy in np.diff(vertices, axis=0))
+    return f"M{_num(vertices[0, 0])} {_num(vertices[0, 1])}l{steps}z".replace(" -", "-")
+
+
+class VectorWriter:
+    """Base class: add(kind, geometry, color) streams one shape; close() finishes the file."""
+
+    def __init__(self, path, width, height, clip=None, background=None, seam_width=SEAM_WIDTH):
+        self.path = str(path)
+        self.width = width
+        self.height = height
+        self.seam_width = seam_width
+        self.shapes = 0
+        self._closed = False
+        self._begin(clip, background)
+
+    def add(self, kind, geometry, color):
+        """kind is "polygon" (vertex array), "circle" ((cx, cy, r)) or "rect" ((x0, y0, x1, y1), inclusive)."""
+        if kind not in ("polygon", "circle", "rect"):
+            raise ValueError(f"Unknown shape kind '{kind}'.")
+        self._shape(kind, geometry, color)
+        self.shapes += 1
+
+    def add_all(self, shapes):
+        """Add every (kind, geometry, color) of shapes."""
+        for kind, geometry, color in shapes:
+            self.add(kind, geometry, color)
+        return self
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._end()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class SVGWriter(VectorWriter):
+    """SVG 1.1, written as text (gzip-compressed for .svgz)."""
+
+    def __init__(self, path, width, height, clip=None, background=None, seam_width=SEAM_WIDTH, compress=None):
+        if compress is None:
+            compress = str(path).lower().endswith(".svgz")
+        self.file = gzip.open(path, "wt", encoding="utf-8") if compress else open(path, "w", encoding="utf-8")
+        super().__init__(path, width, height, clip, background, seam_width)
+
+    def _begin(self, clip, background):
+        w, h = self.width, self.height
+        self.file.write(f'<svg xmlns="http://www.w3.org/2000/svg" version="1.1" width="{w}" height="{h}" '
+                        f'viewBox="0 0 {w} {h}">\n')
+        self.file.write('<g transform="translate(.5 .5)">\n')
+        group = ""
+        if clip is not None:
+            # An empty outline list (nothing opaque) clips everything away
+            self.file.write('<clipPath id="alpha"><path clip-rule="evenodd" d="')
+            for contour in clip:
+                self.file.write(_svg_path_data(contour))
+            self.file.write('"/></clipPath>\n')
+            group = ' clip-path="url(#alpha)"'
+        # Shapes only set color; fill and seam outline take it via currentColor
+        stroke = (f' stroke="currentColor" stroke-width="{_num(self.seam_width)}" stroke-linejoin="round"'
+                  if self.seam_width else "")
+        self.file.write(f'<g{group} fill="currentColor"{stroke}>\n')
+        if background is not None:
+            self.file.write(f'<rect color="{_hex(background)}" x="-.5" y="-.5" width="{w}" height="{h}" '
+                            f'stroke="none"/>\n')
+
+    def _shape(self, kind, geometry, color):
+        if kind == "polygon":
+            self.file.write(f'<path color="{_hex(color)}" d="{_svg_path_data(geometry)}"/>\n')
+        elif kind == "circle":
+            cx, cy, radius = geometry
+            self.file.write(f'<circle color="{_hex(color)}" cx="{_num(cx)}" cy="{_num(cy)}" '
+                            f'r="{_num(radius + 0.5)}"/>\n')
+        else:
+            x0, y0, x1, y1 = geometry
+            self.file.write(f'<rect color="{_hex(color)}" x="{_num(x0 - 0.5)}" y="{_num(y0 - 0.5)}" '
+                            f'width="{_num(x1 - x0 + 1)}" height="{_num(y1 - y0 + 1)}"/>\n')
+
+    def _end(self):
+        self.file.write("</g>\n</g>\n</svg>\n")
+        self.file.close()
+
+
+class PDFWriter(VectorWriter):
+    """Single-page PDF 1.4; the page is width x height pixels at dpi.
+
+    The content stream is compressed as it is written; its /Length is an
+    indirect object written after the stream.
+    """
+
+    def __init__(self, path, width, height, clip=None, background=None, seam_width=SEAM_WIDTH, dpi=DEFAULT_DPI):
+        self.file = open(path, "wb")
+        self.dpi = dpi
+        self.offsets = {}
+        self.compressor = zlib.compressobj(6)
+        self.stream_bytes = 0
+        self.color = None
+        super().__init__(path, width, height, clip, background, seam_width)
+
+    def _object(self, number, body):
+        self.offsets[number] = self.file.tell()
+        self.file.write(f"{number} 0 obj\n{body}\nendobj\n".encode("ascii"))
+
+    def _write(self, text):
+        data = self.compressor.compress(text.encode("ascii"))
+        if data:
+            self.file.write(data)
+            self.stream_bytes += len(data)
+
+    def _begin(self, clip, background):
+        scale = 72.0 / self.dpi
+        page_w, page_h = self.width * scale, self.height * scale
+        self.file.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        self._object(1, "<< /Type /Catalog /Pages 2 0 R >>")
+        self._object(2, "<< /Type /Pages /Kids [3 0 R] /Count 1 >>")
+        self._object(3, f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {_num(page_w)} {_num(page_h)}] "
+                        f"/Contents 4 0 R /Resources << >> >>")
+        self.offsets[4] = self.file.tell()
+        self.file.write(b"4 0 obj\n<< /Length 5 0 R /Filter /FlateDecode >>\nstream\n")
+        # Pixel coordinates, y down, vertices on pixel centers
+        self._write(f"{_num(scale)} 0 0 {_num(-scale)} {_num(0.5 * scale)} {_num(page_h - 0.5 * scale)} cm\n")
+        if clip is not None:
+            for contour in clip:
+                self._write(self._path(contour))
+            # With no outline (nothing opaque) an empty rectangle clips everything away
+            self._write("W* n\n" if clip else "0 0 0 0 re W n\n")
+        self._write(f"1 j {_num(self.seam_width)} w\n" if self.seam_width else "")
+        if background is not None:
+            self._set_color(background)
+            self._write(f"-.5 -.5 {self.width} {self.height} re f\n")
+        # Paths are closed with h first, so the seam stroke covers the closing edge too
+        self.paint = "B\n" if self.seam_width else "f\n"
+
+    @staticmethod
+    def _path(vertices):
+        vertices = np.asarray(vertices).reshape(-1, 2)
+        parts = [f"{_num(vertices[0, 0])} {_num(vertices[0, 1])} m"]
+        parts += [f"{_num(x)} {_num(y)} l" for x, y in vertices[1:]]
+        return " ".join(parts) + " h\n"
+
+    def _set_color(self, color):
+        color = tuple(int(c) for c in color[:3])
+        if color != self.color:
+            self.color = color
+            # 3 decimals keep all 256 levels of every channel apart
+            rgb = " ".join(_num(c / 255.0, 3) for c in color)
+            self._write(f"{rgb} rg {rgb} RG\n" if self.seam_width else f"{rgb} rg\n")
+
+    def _shape(self, kind, geometry, color):
+        self._set_color(color)
+        if kind == "polygon":
+            self._write(self._path(geometry)[:-1] + " " + self.paint)
+        elif kind == "circle":
+            cx, cy, radius = geometry
+            r = radius + 0.5
+            k = r * KAPPA
+            self._write(f"{_num(cx + r)} {_num(cy)} m "
+                        f"{_num(cx + r)} {_num(cy + k)} {_num(cx + k)} {_num(cy + r)} {_num(cx)} {_num(cy + r)} c "
+                        f"{_num(cx - k)} {_num(cy + r)} {_num(cx - r)} {_num(cy + k)} {_num(cx - r)} {_num(cy)} c "
+                        f"{_num(cx - r)} {_num(cy - k)} {_num(cx - k)} {_num(cy - r)} {_num(cx)} {_num(cy - r)} c "
+                        f"{_num(cx + k)} {_num(cy - r)} {_num(cx + r)} {_num(cy - k)} {_num(cx + r)} {_num(cy)} c h "
+                        + self.paint)
+        else:
+            x0, y0, x1, y1 = geometry
+            self._write(f"{_num(x0 - 0.5)} {_num(y0 - 0.5)} {_num(x1 - x0 + 1)} {_num(y1 - y0 + 1)} re "
+                        + self.paint)
+
+    def _end(self):
+        tail = self.compressor.flush()
+        self.file.write(tail)
+        self.stream_bytes += len(tail)
+        self.file.write(b"\nendstream\nendobj\n")
+        self._object(5, str(self.stream_bytes))
+        xref = self.file.tell()
+        self.file.write(f"xref\n0 6\n0000000000 65535 f \n".encode("ascii"))
+        for number in range(1, 6):
+            self.file.write(f"{self.offsets[number]:010d} 00000 n \n".encode("ascii"))
+        self.file.write(f"trailer\n<< /Size 6 /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("ascii"))
+        self.file.close()
+
+
+def open_vector(path, width, height, clip=None, background=None, vector_format=None, **options):
+    """Vector writer for path, chosen by vector_format or the path's extension."""
+    if vector_format is None:
+        vector_format = Path(path).suffix.lower().lstrip(".")
+    if vector_format not in VECTOR_FORMATS:
+        raise ValueError(f"Unknown vector format for '{path}', expected one of {VECTOR_FORMATS}.")
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    if vector_format == "pdf":
+        return PDFWriter(path, width, height, clip, background, **options)
+    return SVGWriter(path, width, height, clip, background, compress=vector_format == "svgz", **options)
+
+
+def write_vector(path, shapes, width, height, clip=None, background=None, vector_format=None, **options):
+    """Stream (kind, geometry, color) shapes into a vector file; returns the shape count."""
+    with open_vector(path, width, height, clip, background, vector_format, **options) as writer:
+        writer.add_all(shapes)
+    return writer.shapes
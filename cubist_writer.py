@@ -0,0 +1,109 @@
+"""
+cubist_writer.py - Direct image encoding and a background frame writer
+
+Canvases are encoded straight from the array with cv2.imencode: pixel
+dimensions are preserved exactly, unlike the matplotlib imshow/savefig
+round-trip used by the archive scripts. Supported outputs are PNG with a
+chosen compression level, lossless WebP and uncompressed TIFF.
+
+FrameWriter encodes on a small thread pool (OpenCV releases the GIL while
+encoding), so the next frame renders while the previous one is compressed.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+OUTPUT_FORMATS = ("png", "webp", "tiff")
+DEFAULT_PNG_COMPRESSION = 3
+WEBP_LOSSLESS_QUALITY = 101  # OpenCV switches WebP to lossless above 100
+
+
+def output_extension(output_format):
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format '{output_format}', expected one of {OUTPUT_FORMATS}.")
+    return "." + output_format
+
+
+def encode_params(output_format, png_compression=DEFAULT_PNG_COMPRESSION):
+    """cv2.imencode parameters for an output format."""
+    if output_format == "png":
+        return [cv2.IMWRITE_PNG_COMPRESSION, int(png_compression)]
+    if output_format == "webp":
+        return [cv2.IMWRITE_WEBP_QUALITY, WEBP_LOSSLESS_QUALITY]
+    if output_format == "tiff":
+        return [cv2.IMWRITE_TIFF_COMPRESSION, 1]
+    raise ValueError(f"Unknown output format '{output_format}', expected one of {OUTPUT_FORMATS}.")
+
+
+def encode_image(canvas, alpha=None, output_format="png", png_compression=DEFAULT_PNG_COMPRESSION):
+    """Encoded file bytes (a uint8 array) of an RGB canvas plus optional alpha plane."""
+    if alpha is not None:
+        out = np.dstack((cv2.cvtColor(canvas, cv2.COLOR_RGB2BGR), alpha))
+    else:
+        out = cv2.cvtColor(canvas, cv2.COLOR_RGB2BGR)
+    ok, data = cv2.imencode(output_extension(output_format), out, encode_params(output_format, png_compression))
+    if not ok:
+        raise IOError(f"Could not encode image as {output_format}.")
+    return data
+
+
+def write_bytes(output_path, data):
+    with open(output_path, "wb") as f:
+        f.write(data)
+
+
+def write_image(output_path, canvas, alpha=None, output_format=None, png_compression=DEFAULT_PNG_COMPRESSION):
+    """Encode an RGB canvas (plus optional alpha plane) to output_path.
+
+    The format defaults to the path's extension.
+    """
+    output_path = str(output_path)
+    if output_format is None:
+        extension = output_path.rsplit(".", 1)[-1].lower()
+        output_format = "tiff" if extension == "tif" else extension
+    write_bytes(output_path, encode_image(canvas, alpha, output_format, png_compression))
+
+
+class FrameWriter:
+    """Encode frames on background threads while the caller keeps rendering.
+
+    At most max_pending frames are queued; submit blocks beyond that so
+    memory stays bounded. Submitted arrays must not be modified afterwards.
+    Errors from encoding are raised by close() (or on leaving the with
+    block normally; when the block is left by an exception, that exception
+    propagates and encoding errors are dropped).
+    """
+
+    def __init__(self, output_format="png", png_compression=DEFAULT_PNG_COMPRESSION, workers=2, max_pending=4):
+        self.output_format = output_format
+        self.png_compression = png_compression
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.futures = []
+
+    def submit(self, output_path, canvas, alpha=None):
+        self.slots.acquire()
+        future = self.pool.submit(write_image, output_path, canvas, alpha, self.output_format, self.png_compression)
+        future.add_done_callback(lambda _: self.slots.release())
+        self.futures.append(future)
+        return future
+
+    def close(self):
+        """Wait for all pending frames; re-raises the first encoding error."""
+        self.pool.shutdown(wait=True)
+        for future in self.futures:
+            future.result()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # Don't let an encoding error replace the exception already propagating
+            self.pool.shutdown(wait=True)
+        return False